@@ -0,0 +1,170 @@
+import os
+import logging
+import hashlib
+import shutil
+import threading
+from subprocess import Popen, PIPE
+
+
+# content-addressed cache for initdb templates
+# one instance per Build
+
+class ArtifactCache:
+
+    def __init__(self, config, cache_dir):
+        self.config = config
+        self.cache_dir = cache_dir
+
+
+
+    # tree_fingerprint()
+    #
+    # hash the content of some directories in a tree
+    #
+    # parameter:
+    #  - self
+    #  - top directory
+    #  - list with subdirectories to include
+    # return:
+    #  - hash string
+    def tree_fingerprint(self, top_dir, subdirs):
+        h = hashlib.sha256()
+        for subdir in subdirs:
+            for dirpath, dirnames, filenames in os.walk(os.path.join(top_dir, subdir)):
+                # walk in a stable order
+                dirnames.sort()
+                for filename in sorted(filenames):
+                    path = os.path.join(dirpath, filename)
+                    h.update((path[len(top_dir) + 1:] + os.linesep).encode('utf-8'))
+                    if (os.path.islink(path)):
+                        h.update(('-> ' + os.readlink(path) + os.linesep).encode('utf-8'))
+                        continue
+                    f = open(path, 'rb')
+                    for block in iter(lambda: f.read(1024 * 1024), b''):
+                        h.update(block)
+                    f.close()
+        return h.hexdigest()
+
+
+
+    # template_key()
+    #
+    # create the cache key for an initialized data directory
+    #
+    # parameter:
+    #  - self
+    #  - fingerprint of the install tree
+    #  - locale string
+    #  - initdb options
+    # return:
+    #  - key (type + hash string)
+    def template_key(self, install_fingerprint, test_locale, options):
+        h = hashlib.sha256()
+        h.update(('install: ' + install_fingerprint + os.linesep).encode('utf-8'))
+        h.update(('locale: ' + str(test_locale) + os.linesep).encode('utf-8'))
+        h.update(('options: ' + str(options) + os.linesep).encode('utf-8'))
+
+        key = 'initdb-' + h.hexdigest()
+        logging.debug("initdb template key: " + key)
+        return key
+
+
+
+    # template_dir()
+    #
+    # return the directory name of a data directory template
+    #
+    # parameter:
+    #  - self
+    #  - key
+    # return:
+    #  - full path to template directory
+    def template_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+
+
+    # store_template()
+    #
+    # store an initialized data directory as template
+    #
+    # parameter:
+    #  - self
+    #  - key
+    #  - data directory
+    # return:
+    #  - True/False
+    def store_template(self, key, data_dir):
+        template = self.template_dir(key)
+        if (os.path.isdir(template)):
+            # another job stored the same template in the meantime
+            return True
+
+        # copy into a temporary directory first, concurrent jobs must never see a partial template
+        template_tmp = template + '.' + str(os.getpid()) + '.' + str(threading.current_thread().ident) + '.tmp'
+        logging.debug("store initdb template: " + data_dir + " -> " + template)
+        if (self.copy_tree(data_dir, template_tmp) is False):
+            return False
+        try:
+            os.rename(template_tmp, template)
+        except OSError as e:
+            # lost the race against another job
+            logging.debug("failed to store initdb template: " + str(e))
+            shutil.rmtree(template_tmp, ignore_errors = True)
+
+        return True
+
+
+
+    # clone_template()
+    #
+    # create a data directory from a template
+    #
+    # parameter:
+    #  - self
+    #  - key
+    #  - target data directory (must not exist)
+    # return:
+    #  - True/False
+    def clone_template(self, key, data_dir):
+        template = self.template_dir(key)
+        if not (os.path.isdir(template)):
+            return False
+
+        logging.debug("clone initdb template: " + template + " -> " + data_dir)
+        return self.copy_tree(template, data_dir)
+
+
+
+    # copy_tree()
+    #
+    # copy a directory, use reflinks if the filesystem supports them
+    # hardlinks are no option: the server modifies the data files in place
+    #
+    # parameter:
+    #  - self
+    #  - source directory
+    #  - target directory (must not exist)
+    # return:
+    #  - True/False
+    def copy_tree(self, source_dir, target_dir):
+        try:
+            # GNU cp falls back to a regular copy if reflinks are not supported
+            proc = Popen(['cp', '-a', '--reflink=auto', source_dir, target_dir], stdout=PIPE, stderr=PIPE)
+            out, err = proc.communicate()
+            if (proc.returncode == 0):
+                return True
+            logging.debug("cp --reflink failed: " + err.decode().strip())
+        except OSError as e:
+            logging.debug("cp --reflink failed: " + str(e))
+
+        # other cp implementations don't know "--reflink"
+        shutil.rmtree(target_dir, ignore_errors = True)
+        try:
+            shutil.copytree(source_dir, target_dir, symlinks = True)
+        except (OSError, IOError, shutil.Error) as e:
+            logging.error("failed to copy directory: " + str(e))
+            shutil.rmtree(target_dir, ignore_errors = True)
+            return False
+
+        return True
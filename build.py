@@ -14,6 +14,15 @@ import shlex
 import datetime
 import glob
 import sys
+import threading
+import gzip
+from artifact_cache import ArtifactCache
+from compiler import CompilerLauncher
+from stages import StageGraph
+from core_dumps import CoreDumpCollector
+from log_budget import LogBudget
+from log_manifest import LogManifest
+from test_failures import TestFailureExtractor
 if sys.version_info[0] < 3:
     reload(sys)
     sys.setdefaultencoding('utf8')
@@ -47,6 +56,40 @@ class Build:
         self.support_archives = []
         # logfile directory, valid during Greenplum tests
         self.regression_logfile_directory = False
+        # test stages can fail in parallel, print one error at a time
+        self.print_lock = threading.Lock()
+        # extra options for "configure", set in run_configure()
+        self.extra_configure_options = ''
+        # port for the test clusters, every locale uses the next port
+        self.pg_test_port = 5678
+        # options for initdb, part of the initdb template key
+        self.pg_initdb_options = "-U ads"
+        # fingerprint of the install tree, set before the tests run
+        self.install_fingerprint = None
+        # directory for test databases (install dir or scratch dir), set in run_make_install()
+        self.data_root = False
+        # core file collector, set in run_tests() if gdb is available
+        self.core_dumps = None
+        # compiler cache directory, set in run_configure()
+        self.ccache_dir = False
+        # compilers and compiler launcher (ccache, distcc, ...)
+        self.compiler = CompilerLauncher(config)
+        # size limits for the logfiles of this build
+        self.log_budget = LogBudget(self.config.get('log-step-budget'), self.config.get('log-job-budget'))
+        # steps and logfiles of this build, written into the build directory
+        self.manifest = LogManifest(build_dir)
+        # step outside of the test stages (configure, make, install) which writes logfiles
+        self.current_step = None
+        # graph of the test stages, set while the tests run
+        self.stage_graph = None
+        # result files (like regression.diffs) the test stages collected, see TestFailureExtractor
+        self.result_files = []
+
+        # optional cache for initdb templates
+        if (len(self.config.get('artifact-cache-dir')) > 0):
+            self.artifact_cache = ArtifactCache(config, self.config.get('artifact-cache-dir'))
+        else:
+            self.artifact_cache = False
 
         # directory which holds the buildfarm logfiles
         self.buildfarm_logs = os.path.join(build_dir, '.buildfarm-logs')
@@ -101,6 +144,21 @@ class Build:
 
 
 
+    # support_zstd_option()
+    #
+    # option for the support script: the zstd executable which compresses the logfiles
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - option string (empty if zstd is not used)
+    def support_zstd_option(self):
+        if (len(self.config.get('zstd-bin')) == 0):
+            return ''
+        return " --zstd-bin '" + self.config.get('zstd-bin') + "'"
+
+
+
     # list_all_support_archives()
     #
     # list all stored support archives
@@ -180,6 +238,10 @@ class Build:
             ports = ['57832']
             if (os.environ.get('PGPORT') is not None and len(os.environ.get('PGPORT')) > 0):
                 ports.append(os.environ.get('PGPORT'))
+            if (log_data['is_buildfarm'] is True):
+                # the test clusters for all locales run at the same time
+                for test_locale in self.pg_test_locales(log_data):
+                    ports.append(self.pg_locale_port(log_data, test_locale))
 
             sockets_exist = []
             for port in ports:
@@ -238,7 +300,9 @@ class Build:
     #  - True/False (False if error)
     def run_configure(self, extra_options, build_dir_name, log_data):
         self.extra_configure_options = extra_options
+        self.current_step = 'configure'
         install_dir = self.config.get('install-dir')
+        self.ccache_dir = self.ccache_directory(log_data)
 
         # write 'githead.log'
         f = open(os.path.join(self.buildfarm_logs, 'githead.log'), 'w')
@@ -257,7 +321,7 @@ class Build:
             execute += ' ' + extra_options
 
         if (repository_type == 'PostgreSQL'):
-            execute += ' --with-pgport=5678'
+            execute += ' --with-pgport=' + str(self.pg_test_port)
         # FIXME: remove existing --with-pgport from configure line
 
         run = self.run_shell(execute)
@@ -342,16 +406,25 @@ class Build:
     #  - True/False (False if error)
     def run_make(self, extra_options, log_data):
         self.extra_make_options = extra_options
-        # FIXME: ccache
-        #ccache_bin = self.config.get('ccache-bin')
-        make_parallel = self.config.get('make-parallel')
+        self.current_step = 'make'
+        make_parallel = self.compiler.make_parallel()
 
         execute = "make"
         if (make_parallel > 1):
             execute += ' -j ' + str(make_parallel)
         if (len(extra_options) > 0):
             execute += ' ' + extra_options
+
+        ccache_before = self.ccache_stats()
         run = self.run_shell(execute)
+        ccache_after = self.ccache_stats()
+        if (ccache_before is not False and ccache_after is not False):
+            # other jobs using the same cache directory at the same time distort these numbers
+            log_data['ccache_hits'] = ccache_after['hits'] - ccache_before['hits']
+            log_data['ccache_misses'] = ccache_after['misses'] - ccache_before['misses']
+            log_data['ccache_size'] = ccache_after['size']
+            log_data['ccache_size_delta'] = ccache_after['size'] - ccache_before['size']
+            logging.debug("ccache: " + str(log_data['ccache_hits']) + " hits, " + str(log_data['ccache_misses']) + " misses")
         self.dump_logs(self.build_dir, run, execute, self.config.logfile_name("make"))
         log_data['run_make'] = True
         log_data['extra_make'] = extra_options
@@ -370,6 +443,60 @@ class Build:
 
 
 
+    # scratch_directory()
+    #
+    # figure out where the test databases are created
+    # the scratch dir (tmpfs) is used if configured, and if enough memory is free
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - directory for the test databases
+    def scratch_directory(self):
+        scratch_dir = self.config.get('scratch-dir')
+        if (len(scratch_dir) == 0):
+            return self.install_dir
+
+        free = self.free_memory(scratch_dir)
+        if (free < self.config.get('scratch-min-free')):
+            logging.info("not enough free memory for scratch dir (" + str(free // (1024 * 1024)) + " MB), using install dir")
+            return self.install_dir
+
+        data_root = os.path.join(scratch_dir, os.path.basename(self.install_dir))
+        if not (os.path.isdir(data_root)):
+            os.makedirs(data_root, 0o0700)
+        self.add_entry_to_delete_clean(data_root)
+        logging.info("scratch dir: " + data_root)
+
+        return data_root
+
+
+
+    # free_memory()
+    #
+    # return the free space in a RAM-backed directory
+    #
+    # parameter:
+    #  - self
+    #  - directory
+    # return:
+    #  - free bytes
+    def free_memory(self, directory):
+        st = os.statvfs(directory)
+        # a size-capped tmpfs can be smaller than the available memory
+        free = st.f_bavail * st.f_frsize
+        # tmpfs pages are taken from memory, not every system has /proc/meminfo
+        if (os.path.isfile('/proc/meminfo')):
+            f = open('/proc/meminfo', 'r')
+            for line in f:
+                m = re.match(r'^MemAvailable:\s+([0-9]+) kB', line)
+                if (m):
+                    free = min(free, int(m.group(1)) * 1024)
+            f.close()
+        return free
+
+
+
     # run_make_install()
     #
     # run "make install" in build directory
@@ -384,10 +511,12 @@ class Build:
     #  - path to install dir
     def run_make_install(self, extra_options, log_data, make_extra_options):
         self.extra_install_options = extra_options
+        self.current_step = 'install'
 
         execute = "make install"
         if (len(extra_options) > 0):
             execute += ' ' + extra_options
+
         run = self.run_shell(execute)
         self.dump_logs(self.build_dir, run, execute, self.config.logfile_name("install"))
         log_data['run_install'] = True
@@ -400,9 +529,10 @@ class Build:
 
 
         repository_type = self.repository.identify_repository_type(self.build_dir)
+        self.data_root = self.scratch_directory()
 
         if (repository_type == 'PostgreSQL'):
-            make_parallel = self.config.get('make-parallel')
+            make_parallel = self.compiler.make_parallel()
 
             make_execute = "make"
             make_execute_parallel = "make"
@@ -425,7 +555,7 @@ class Build:
             os.chmod(filename, stat.S_IRWXU | stat.S_IRWXG)
 
 
-            datadirs = os.path.join(self.install_dir, "tmp_demo_db")
+            datadirs = os.path.join(self.data_root, "tmp_demo_db")
 
             # initialize and start the database
             filename = os.path.join(self.install_dir, 'buildclient_initdb.sh')
@@ -479,7 +609,7 @@ class Build:
                 f.write('set -e' + os.linesep)
                 f.write("cd '" + self.build_dir + "'" + os.linesep)
                 f.write("" + os.linesep);
-                f.write(self.config.get("support-bin") + " --archive-type " + self.config.get('support-archive-type') + "" + os.linesep)
+                f.write(self.config.get("support-bin") + " --archive-type " + self.config.get('support-archive-type') + self.support_zstd_option() + os.linesep)
                 f.close()
                 os.chmod(filename, stat.S_IRWXU | stat.S_IRWXG)
 
@@ -602,14 +732,36 @@ class Build:
                 f.close()
                 os.chmod(filename, stat.S_IRWXU | stat.S_IRWXG)
 
+                # create script to build the isolation tester, used by all locales
+                filename = os.path.join(self.build_dir, 'buildclient_run_buildfarm_make_isolation.sh')
+                f = open(filename, 'w')
+                f.write('#!/bin/sh' + os.linesep + os.linesep)
+                f.write('set -e' + os.linesep)
+                f.write("cd '" + self.build_dir + "'" + os.linesep)
+                f.write("cd " + os.path.join('src', 'test', 'isolation') + os.linesep)
+                f.write(make_execute + " all" + os.linesep)
+                f.close()
+                os.chmod(filename, stat.S_IRWXU | stat.S_IRWXG)
+
                 # create script to run the buildfarm regression tests (initdb with locale)
                 filename = os.path.join(self.build_dir, 'buildclient_run_buildfarm_initdb.sh')
                 f = open(filename, 'w')
                 f.write('#!/bin/sh' + os.linesep + os.linesep)
                 f.write('set -e' + os.linesep)
                 f.write("cd '" + self.install_dir + "'" + os.linesep)
-                f.write("./bin/initdb -U ads --locale=$1 data-$1" + os.linesep)
-                f.write("cat buildfarm_append_postgresql.conf >> data-$1/postgresql.conf" + os.linesep)
+                f.write("./bin/initdb " + self.pg_initdb_options + " --locale=$1 '" + self.data_root + "'/data-$1" + os.linesep)
+                f.close()
+                os.chmod(filename, stat.S_IRWXU | stat.S_IRWXG)
+
+                # create script to configure a data directory, after initdb or after cloning a template
+                filename = os.path.join(self.build_dir, 'buildclient_run_buildfarm_initdb_config.sh')
+                f = open(filename, 'w')
+                f.write('#!/bin/sh' + os.linesep + os.linesep)
+                f.write('set -e' + os.linesep)
+                f.write("cd '" + self.install_dir + "'" + os.linesep)
+                f.write("cat buildfarm_append_postgresql.conf >> '" + self.data_root + "'/data-$1/postgresql.conf" + os.linesep)
+                # every locale has a separate port
+                f.write('echo "port = $2" >> \'' + self.data_root + '\'/data-$1/postgresql.conf' + os.linesep)
                 f.close()
                 os.chmod(filename, stat.S_IRWXU | stat.S_IRWXG)
                 # create part of a config file which will be appended to the main config
@@ -632,7 +784,7 @@ class Build:
                 f.write("cd '" + self.install_dir + "'" + os.linesep)
                 # the original buildfarm uses the same logfile, and deletes it every time
                 # use a different logfile each time instead
-                f.write("./bin/pg_ctl -D data-$1 -l logfile-$1-$2 -w start" + os.linesep)
+                f.write("./bin/pg_ctl -D '" + self.data_root + "'/data-$1 -l logfile-$1-$2 -w start" + os.linesep)
                 f.close()
                 os.chmod(filename, stat.S_IRWXU | stat.S_IRWXG)
 
@@ -644,7 +796,7 @@ class Build:
                 f.write("cd '" + self.install_dir + "'" + os.linesep)
                 f.write("export PGCTLTIMEOUT=120" + os.linesep)
                 #f.write("export PGUSER=ads" + os.linesep)
-                f.write("./bin/pg_ctl -D data-$1 stop" + os.linesep)
+                f.write("./bin/pg_ctl -D '" + self.data_root + "'/data-$1 stop" + os.linesep)
                 f.close()
                 os.chmod(filename, stat.S_IRWXU | stat.S_IRWXG)
 
@@ -656,8 +808,8 @@ class Build:
                 f.write("cd '" + self.install_dir + "'" + os.linesep)
                 f.write("export PGCTLTIMEOUT=120" + os.linesep)
                 #f.write("export PGUSER=ads" + os.linesep)
-                f.write("mkdir data-failure" + os.linesep)
-                f.write("for d in data*; do" + os.linesep)
+                f.write("mkdir -p '" + self.data_root + "'/data-failure" + os.linesep)
+                f.write("for d in '" + self.data_root + "'/data*; do" + os.linesep)
                 f.write("./bin/pg_ctl -m immediate -l logfile_stop_after_failure -D $d stop" + os.linesep)
                 f.write("done" + os.linesep)
                 f.write("exit 0" + os.linesep)
@@ -742,7 +894,7 @@ class Build:
             # create script to start and stop the demo cluster
             # and to run the test suite
 
-            datadirs = os.path.join(self.install_dir, "tmp_regression_tests")
+            datadirs = os.path.join(self.data_root, "tmp_regression_tests")
 
             # make cluster script (starts the cluster)
             filename = os.path.join(self.install_dir, 'buildclient_make_cluster.sh')
@@ -817,7 +969,7 @@ class Build:
                 f.write('#!/bin/sh' + os.linesep + os.linesep)
                 f.write("cd '" + self.build_dir + "'" + os.linesep)
                 f.write("" + os.linesep);
-                f.write(self.config.get("support-bin") + " --archive-type " + self.config.get('support-archive-type') + " --logfiles '" + os.path.join(datadirs, "gpAdminLogs") + "'" + os.linesep)
+                f.write(self.config.get("support-bin") + " --archive-type " + self.config.get('support-archive-type') + " --logfiles '" + os.path.join(datadirs, "gpAdminLogs") + "'" + self.support_zstd_option() + os.linesep)
                 f.close()
                 os.chmod(filename, stat.S_IRWXU | stat.S_IRWXG)
 
@@ -906,7 +1058,7 @@ class Build:
             # change this when dynamic ports are used
             f.write("   export PGPORT=15432" + os.linesep)
             f.write("   cd '" + os.path.join(self.build_dir, 'src', 'test', 'regress') + "'" + os.linesep)
-            f.write("   ./pg_regress --psqldir='" + os.path.join(self.install_dir, 'tmp_regression_tests', 'qddir', 'demoDataDir-1') + "' --schedule=./bugbuster/known_good_schedule --psqldir='" + os.path.join(self.install_dir, 'bin') + "' --inputdir=bugbuster" + os.linesep)
+            f.write("   ./pg_regress --psqldir='" + os.path.join(self.data_root, 'tmp_regression_tests', 'qddir', 'demoDataDir-1') + "' --schedule=./bugbuster/known_good_schedule --psqldir='" + os.path.join(self.install_dir, 'bin') + "' --inputdir=bugbuster" + os.linesep)
             f.write("fi" + os.linesep)
             f.close()
             os.chmod(filename, stat.S_IRWXU | stat.S_IRWXG)
@@ -926,7 +1078,7 @@ class Build:
             # change this when dynamic ports are used
             f.write("   export PGPORT=15432" + os.linesep)
             f.write("   cd '" + os.path.join(self.build_dir, 'src', 'test', 'regress') + "'" + os.linesep)
-            f.write("   ./pg_regress --psqldir='" + os.path.join(self.install_dir, 'tmp_regression_tests', 'qddir', 'demoDataDir-1') + "' --psqldir='" + os.path.join(self.install_dir, 'bin') + "' --inputdir=expected " + '"$@"'+ os.linesep)
+            f.write("   ./pg_regress --psqldir='" + os.path.join(self.data_root, 'tmp_regression_tests', 'qddir', 'demoDataDir-1') + "' --psqldir='" + os.path.join(self.install_dir, 'bin') + "' --inputdir=expected " + '"$@"'+ os.linesep)
             f.write("fi" + os.linesep)
             f.close()
             os.chmod(filename, stat.S_IRWXU | stat.S_IRWXG)
@@ -975,595 +1127,442 @@ class Build:
         repository_type = self.repository.identify_repository_type(self.build_dir)
 
         if (repository_type == 'PostgreSQL'):
-            # FIXME: buildfarm timings
-            if (log_data['is_buildfarm'] is True):
-                execute = "./buildclient_run_buildfarm_regression_tests.sh"
-            else:
-                execute = "./buildclient_run_regression_tests.sh"
-            run = self.run_shell(execute)
-            test_log_number = 0
-            self.dump_logs(self.build_dir, run, execute, self.config.logfile_name("tests", second_number = test_log_number))
             log_data['run_tests'] = True
             log_data['extra_tests'] = extra_options
-            log_data['result_tests'] = run[0]
-            log_data['time_tests'] = run[2]
 
-            self.copy_logfile(self.config.logfile_name("tests", second_number = test_log_number, file_type = 'stdout_stderr', full_path = self.build_dir), os.path.join(self.buildfarm_logs, 'check.log'))
-
-            # add more logfiles, 'check.log' is a mingle-mangle of logs
-            files_log = glob.glob(os.path.join(self.build_dir, 'src', 'test', 'regress', 'log') + os.sep + '*.log')
-            files_log.extend(glob.glob(os.path.join(self.build_dir, 'tmp_install', 'log') + os.sep + '*'))
-            if (os.path.isfile(os.path.join(self.build_dir, 'src', 'test', 'regress', 'regression.diffs'))):
-                files_log[:0] = [os.path.join(self.build_dir, 'src', 'test', 'regress', 'regression.diffs')]
-            for file_log in files_log:
-                self.attach_logfile_pg_buildfarm(file_log,
-                                                 os.path.join(self.buildfarm_logs, 'check.log'),
-                                                 "\n\n================== " + file_log[len(self.build_dir) + 1:] + " ===================\n")
-                self.attach_logfile_buildfarm(file_log,
-                                              "tests", test_log_number, None,
-                                              file_log[len(self.build_dir) + 1:])
-
-            # add stack traces of any "core*" file found in the tree
-            stack_trace = self.stack_traces(self.build_dir)
-            if (stack_trace is not None and len(stack_trace) > 0):
-                f = open(os.path.join(self.buildfarm_logs, 'check.log'), 'a')
-                f.write(stack_trace)
-                f.close()
-                f = open(self.config.logfile_name("tests", file_type = 'logfile', full_path = self.build_dir, second_number = test_log_number), 'a')
-                f.write(stack_trace)
-                f.close()
+            if (self.artifact_cache is not False and log_data['is_buildfarm'] is True):
+                # the initdb templates depend on the installed binaries and data files
+                self.install_fingerprint = self.artifact_cache.tree_fingerprint(self.install_dir, ['bin', 'lib', 'share'])
+
+            gdb = self.config.find_in_path('gdb')
+            if (gdb is not False):
+                self.core_dumps = CoreDumpCollector(gdb, os.path.join(self.install_dir, 'bin', 'postgres'))
+
+            graph = StageGraph(self.test_parallel(log_data), continue_on_failure = self.config.get('continue-on-failure'))
+            self.add_pg_test_stages(graph, extra_options, log_data)
+            self.stage_graph = graph
+            result = graph.run()
+            self.stage_graph = None
+
+            for stage in graph.stages:
+                if (stage.result is True):
+                    stage_result = 'ok'
+                elif (stage.result is False):
+                    stage_result = 'failed'
+                else:
+                    stage_result = 'skipped'
+                self.manifest.update_step(stage.name, buildfarm_step = stage.step, locale = stage.locale, result = stage_result,
+                                          started = stage.started, duration = stage.time)
+
+            log_data['stage_results'] = graph.stage_results()
+            failed_stage = graph.failed_stage()
+            if (failed_stage is not None):
+                # the first failure (in declaration order) is reported to the buildfarm
+                if (failed_stage.report_step is not None):
+                    log_data['failed_stage'] = failed_stage.report_step
+                else:
+                    # never report internal stage names
+                    logging.debug("stage without buildfarm step failed: " + failed_stage.name)
+                    log_data['failed_stage'] = 'Check'
+
+            if (result is False):
+                # pg_regress removes regression.diffs when all tests pass, only look after a failure
+                log_data['test_failures'] = TestFailureExtractor(self.build_dir).collect(self.result_files)
+                for stage in graph.stages:
+                    if (stage.name.startswith('startdb-') and stage.result is not None):
+                        # shutdown everything
+                        logging.info("shutting down everything after test failure")
+                        execute = "./buildclient_run_buildfarm_stopdbs_after_failure.sh"
+                        run = self.run_shell(execute)
+                        # don't care about error handling
+                        break
+                return False
+
 
-            # set mtime and other metadata to original timestamp from the test
-            self.copy_stats(self.config.logfile_name("tests", second_number = test_log_number, file_type = 'stdout_stderr', full_path = self.build_dir), os.path.join(self.buildfarm_logs, 'check.log'))
 
-            # finally deal with any error
+        elif (repository_type == 'Greenplum'):
+            # FIXME: figure out the hostfile, and check ssh connections to all hosts
+            self.regression_logfile_directory = os.path.join(self.data_root, "tmp_regression_tests", "gpAdminLogs")
+            self.current_step = 'tests'
+            execute = "./buildclient_run_regression_tests.sh"
+            run = self.run_shell(execute)
+            self.dump_logs(self.build_dir, run, execute, "log_09_tests")
+            log_data['run_tests'] = True
+            log_data['extra_tests'] = extra_options
+            log_data['result_tests'] = run[0]
+            log_data['time_tests'] = run[2]
             if (run[0] > 0):
-                self.print_run_error(run, execute)
+                self.print_run_error(run, execute, ' tests failed.')
                 return False
+            self.regression_logfile_directory = False
 
-            # run "Contrib"
-            if (log_data['is_buildfarm'] is True):
-                execute = "./buildclient_run_buildfarm_make_contrib.sh"
-                run = self.run_shell(execute)
-                test_log_number += 1
-                test_log_name = "make_contrib"
-                self.dump_logs(self.build_dir, run, execute, self.config.logfile_name("tests", second_number = test_log_number, second_type = test_log_name))
-
-                self.copy_logfile(self.config.logfile_name("tests", file_type = 'stdout_stderr', full_path = self.build_dir, second_number = test_log_number, second_type = test_log_name),
-                                  os.path.join(self.buildfarm_logs, 'make-contrib.log'))
-
-                # finally deal with any error
-                if (run[0] > 0):
-                    self.print_run_error(run, execute)
-                    return False
+        logging.debug("regression tests completed")
+        return True
 
-            # run "TestModules"
-            if (log_data['is_buildfarm'] is True):
-                execute = "./buildclient_run_buildfarm_make_testmodules.sh"
-                run = self.run_shell(execute)
-                test_log_number += 1
-                test_log_name = "make_testmodules"
-                self.dump_logs(self.build_dir, run, execute, self.config.logfile_name("tests", second_number = test_log_number, second_type = test_log_name))
 
-                self.copy_logfile(self.config.logfile_name("tests", file_type = 'stdout_stderr', full_path = self.build_dir, second_number = test_log_number, second_type = test_log_name),
-                                  os.path.join(self.buildfarm_logs, 'make-testmodules.log'))
 
-                # finally deal with any error
-                if (run[0] > 0):
-                    self.print_run_error(run, execute)
-                    return False
+    # add_pg_test_stages()
+    #
+    # declare all PostgreSQL test stages
+    #
+    # parameter:
+    #  - self
+    #  - Stage graph
+    #  - extra options for tests
+    #  - pointer to log data
+    # return:
+    #  none
+    def add_pg_test_stages(self, graph, extra_options, log_data):
+        # all "make check" runs share the temporary installation in 'tmp_install'
+        if (log_data['is_buildfarm'] is True):
+            execute = "./buildclient_run_buildfarm_regression_tests.sh"
+        else:
+            execute = "./buildclient_run_regression_tests.sh"
+        graph.add('check', lambda stage: self.stage_pg_check(stage, execute, log_data),
+                  outputs = ['tmp_install', os.path.join('src', 'test', 'regress')], step = 'Check')
 
+        if (log_data['is_buildfarm'] is False):
             # install happened earlier, just copy the logfile
             self.copy_logfile(self.config.logfile_name("install", file_type = 'stdout_stderr', full_path = self.build_dir), os.path.join(self.buildfarm_logs, 'make-install.log'))
-            if (log_data['is_buildfarm'] is True):
-                # fake the metadata
-                self.copy_stats(os.path.join(self.buildfarm_logs, 'make-testmodules.log'), os.path.join(self.buildfarm_logs, 'make-install.log'))
-
-            # run "ContribInstall"
-            if (log_data['is_buildfarm'] is True):
-                execute = "./buildclient_run_buildfarm_make_contrib-install.sh"
-                run = self.run_shell(execute)
-                test_log_number += 1
-                test_log_name = "make_contrib-install"
-                self.dump_logs(self.build_dir, run, execute, self.config.logfile_name("tests", second_number = test_log_number, second_type = test_log_name))
-
-                self.copy_logfile(self.config.logfile_name("tests", file_type = 'stdout_stderr', full_path = self.build_dir, second_number = test_log_number, second_type = test_log_name),
-                                  os.path.join(self.buildfarm_logs, 'install-contrib.log'))
-
-                # finally deal with any error
-                if (run[0] > 0):
-                    self.print_run_error(run, execute)
-                    return False
-
-            # run "TestModulesInstall"
-            if (log_data['is_buildfarm'] is True):
-                execute = "./buildclient_run_buildfarm_make_testmodules-install.sh"
-                run = self.run_shell(execute)
-                test_log_number += 1
-                test_log_name = "make_testmodules-install"
-                self.dump_logs(self.build_dir, run, execute, self.config.logfile_name("tests", second_number = test_log_number, second_type = test_log_name))
-
-                self.copy_logfile(self.config.logfile_name("tests", file_type = 'stdout_stderr', full_path = self.build_dir, second_number = test_log_number, second_type = test_log_name),
-                                  os.path.join(self.buildfarm_logs, 'install-testmodules.log'))
-
-                # finally deal with any error
-                if (run[0] > 0):
-                    self.print_run_error(run, execute)
-                    return False
-
-            # run "pg_upgradeCheck"
-            if (log_data['is_buildfarm'] is True and int(log_data['pg_version_num']) >= 90200):
-                execute = "./buildclient_run_buildfarm_make_pg_upgrade.sh"
-                run = self.run_shell(execute)
-                test_log_number += 1
-                test_log_name = "make_pg_upgrade"
-                self.dump_logs(self.build_dir, run, execute, self.config.logfile_name("tests", second_number = test_log_number, second_type = test_log_name))
-
-                self.copy_logfile(self.config.logfile_name("tests", file_type = 'stdout_stderr', full_path = self.build_dir, second_number = test_log_number, second_type = test_log_name),
-                                  os.path.join(self.buildfarm_logs, 'check-pg_upgrade.log'))
-
-                # add logfiles from tests
-                files_log = glob.glob(os.path.join(self.build_dir, 'contrib', 'pg_upgrade') + os.sep + '*.log')
-                files_log.extend(glob.glob(os.path.join(self.build_dir, 'contrib', 'pg_upgrade', 'log') + os.sep + '*'))
-                files_log.extend(glob.glob(os.path.join(self.build_dir, 'src', 'bin', 'pg_upgrade') + os.sep + '*.log'))
-                files_log.extend(glob.glob(os.path.join(self.build_dir, 'src', 'bin', 'pg_upgrade', 'log') + os.sep + '*'))
-                files_log.extend(glob.glob(os.path.join(self.build_dir, 'src', 'test', 'regress') + os.sep + '*.diffs'))
-                for file_log in files_log:
-                    self.attach_logfile_pg_buildfarm(file_log,
-                                                     os.path.join(self.buildfarm_logs, 'check-pg_upgrade.log'),
-                                                     "=========================== " + file_log[len(self.build_dir) + 1:] + " ================\n")
-                    self.attach_logfile_buildfarm(file_log,
-                                                  "tests", test_log_number, test_log_name,
-                                                  file_log[len(self.build_dir) + 1:])
-
-                # set mtime and other metadata to original timestamp from the test
-                self.copy_stats(self.config.logfile_name("tests", file_type = 'stdout_stderr', full_path = self.build_dir, second_number = test_log_number, second_type = test_log_name),
-                                os.path.join(self.buildfarm_logs, 'check-pg_upgrade.log'))
-
-                # finally deal with any error
-                if (run[0] > 0):
-                    self.print_run_error(run, execute)
-                    return False
-
-            # run "test-decoding-check"
-            if (log_data['is_buildfarm'] is True):
-                execute = "./buildclient_run_buildfarm_make_test-decoding-check.sh"
-                run = self.run_shell(execute)
-                test_log_number += 1
-                test_log_name = "make_test-decoding-check"
-                self.dump_logs(self.build_dir, run, execute, self.config.logfile_name("tests", second_number = test_log_number, second_type = test_log_name))
-
-                self.copy_logfile(self.config.logfile_name("tests", file_type = 'stdout_stderr', full_path = self.build_dir, second_number = test_log_number, second_type = test_log_name),
-                                  os.path.join(self.buildfarm_logs, 'test-decoding-check.log'))
-
-                # add logfiles from tests
-                files_log = glob.glob(os.path.join(self.build_dir, 'contrib', 'test_decoding', 'regression_output', 'log') + os.sep + '*.log')
-                files_log.extend(glob.glob(os.path.join(self.build_dir, 'contrib', 'test_decoding', 'regression_output') + os.sep + '*.diffs'))
-                files_log.extend(glob.glob(os.path.join(self.build_dir, 'contrib', 'test_decoding', 'isolation_output', 'log') + os.sep + '*.log'))
-                files_log.extend(glob.glob(os.path.join(self.build_dir, 'contrib', 'test_decoding', 'isolation_output') + os.sep + '*.diffs'))
-                for file_log in files_log:
-                    self.attach_logfile_pg_buildfarm(file_log,
-                                                     os.path.join(self.buildfarm_logs, 'test-decoding-check.log'),
-                                                     "=========================== " + file_log[len(self.build_dir) + 1:] + " ================\n")
-                    self.attach_logfile_buildfarm(file_log,
-                                                  "tests", test_log_number, test_log_name,
-                                                  file_log[len(self.build_dir) + 1:])
-
-                # set mtime and other metadata to original timestamp from the test
-                self.copy_stats(self.config.logfile_name("tests", file_type = 'stdout_stderr', full_path = self.build_dir, second_number = test_log_number, second_type = test_log_name),
-                                os.path.join(self.buildfarm_logs, 'test-decoding-check.log'))
-
-                # finally deal with any error
-                if (run[0] > 0):
-                    self.print_run_error(run, execute)
-                    return False
-
-            if (log_data['is_buildfarm'] is True):
-                started_times = 0
-                test_locales = log_data['test_locales']
-                if (len(test_locales) == 0):
-                    test_locales = 'C'
-                test_locales = test_locales.split(',')
-                for test_locale in test_locales:
-                    # test each locale separately
-                    # but run all tests for one locale before starting the next one
-
-                    try:
-                        # run "Initdb-<locale>"
-                        test_log_number += 1
-                        test_log_name = "initdb"
-                        result = self.regression_pg_initdb(extra_options, log_data, test_locale, test_log_number, test_log_name)
-                        if (result is False):
-                            raise RegressionTestErrorPG('initdb')
-
-
-                        # run "StartDb-<locale>"
-                        started_times += 1
-                        test_log_number += 1
-                        test_log_name = "startdb"
-                        result = self.regression_pg_startdb(extra_options, log_data, test_locale, started_times, test_log_number, test_log_name)
-                        if (result is False):
-                            raise RegressionTestErrorPG('startdb')
-
-
-                        # run "InstallCheck-<locale>"
-                        execute = "./buildclient_run_buildfarm_installcheck.sh" + " " + str(test_locale) + " " + str(started_times)
-                        run = self.run_shell(execute)
-                        test_log_number += 1
-                        test_log_name = "make_installcheck"
-                        self.dump_logs(self.build_dir, run, execute, self.config.logfile_name("tests", second_number = test_log_number, second_type = test_log_name))
-
-                        self.copy_logfile(self.config.logfile_name("tests", file_type = 'stdout_stderr', full_path = self.build_dir, second_number = test_log_number, second_type = test_log_name),
-                                          os.path.join(self.buildfarm_logs, 'install-check-' + str(test_locale) + '.log'))
-
-                        # add logfiles
-                        self.attach_logfile_pg_buildfarm(os.path.join(self.build_dir, 'src', 'test', 'regress', 'regression.diffs'),
-                                                         os.path.join(self.buildfarm_logs, 'install-check-' + str(test_locale) + '.log'),
-                                                         "\n\n================== src/test/regress/regression.diffs ==================\n")
-                        self.attach_logfile_buildfarm(os.path.join(self.build_dir, 'src', 'test', 'regress', 'regression.diffs'),
-                                                      "tests", test_log_number, test_log_name,
-                                                      "src/test/regress/regression.diffs")
-
-                        self.attach_logfile_pg_buildfarm(os.path.join(self.install_dir, 'logfile-' + str(test_locale) + "-" + str(started_times)),
-                                                         os.path.join(self.buildfarm_logs, 'install-check-' + str(test_locale) + '.log'),
-                                                         "\n\n================== logfile ==================\n")
-                        self.attach_logfile_buildfarm(os.path.join(self.install_dir, 'logfile-' + str(test_locale) + "-" + str(started_times)),
-                                                      "tests", test_log_number, test_log_name,
-                                                      "db logfile")
-
-                        # set mtime and other metadata to original timestamp from the test
-                        self.copy_stats(self.config.logfile_name("tests", file_type = 'stdout_stderr', full_path = self.build_dir, second_number = test_log_number, second_type = test_log_name),
-                                        os.path.join(self.buildfarm_logs, 'install-check-' + str(test_locale) + '.log'))
-
-                        # finally deal with any error
-                        if (run[0] > 0):
-                            self.print_run_error(run, execute)
-                            raise RegressionTestErrorPG('make_installcheck')
-
-
-                        # run "StopDb-<locale>"
-                        test_log_number += 1
-                        test_log_name = "stopdb"
-                        result = self.regression_pg_stopdb(extra_options, log_data, test_locale, started_times, test_log_number, test_log_name)
-                        if (result is False):
-                            raise RegressionTestErrorPG('stopdb')
-
-
-
-
-                        # run "StartDb-<locale>"
-                        started_times += 1
-                        test_log_number += 1
-                        test_log_name = "startdb"
-                        result = self.regression_pg_startdb(extra_options, log_data, test_locale, started_times, test_log_number, test_log_name)
-                        if (result is False):
-                            raise RegressionTestErrorPG('startdb')
-
-
-                        # run "IsolationCheck-<locale>"
-                        execute = "./buildclient_run_buildfarm_isolation-check.sh" + " " + str(test_locale) + " " + str(started_times)
-                        run = self.run_shell(execute)
-                        test_log_number += 1
-                        test_log_name = "make_isolation-check"
-                        self.dump_logs(self.build_dir, run, execute, self.config.logfile_name("tests", second_number = test_log_number, second_type = test_log_name))
-
-                        self.copy_logfile(self.config.logfile_name("tests", file_type = 'stdout_stderr', full_path = self.build_dir, second_number = test_log_number, second_type = test_log_name),
-                                          os.path.join(self.buildfarm_logs, 'isolation-check-' + str(test_locale) + '.log'))
-
-                        # add logfiles
-                        self.attach_logfile_pg_buildfarm(os.path.join(self.build_dir, 'src', 'test', 'isolation', 'regression.diffs'),
-                                                         os.path.join(self.buildfarm_logs, 'isolation-check-' + str(test_locale) + '.log'),
-                                                         "\n\n================== src/test/regress/regression.diffs ===================\n")
-
-                        files_log = glob.glob(os.path.join(self.build_dir, 'src', 'test', 'isolation', 'log') + os.sep + '*.log')
-                        for file_log in files_log:
-                            self.attach_logfile_pg_buildfarm(file_log,
-                                                             os.path.join(self.buildfarm_logs, 'isolation-check-' + str(test_locale) + '.log'),
-                                                             "\n\n================== " + file_log[len(self.build_dir) + 1:] + " ===================\n")
-                            self.attach_logfile_buildfarm(file_log,
-                                                          "tests", test_log_number, test_log_name,
-                                                          file_log[len(self.build_dir) + 1:])
-
-                        self.attach_logfile_pg_buildfarm(os.path.join(self.install_dir, 'logfile-' + str(test_locale) + "-" + str(started_times)),
-                                                         os.path.join(self.buildfarm_logs, 'isolation-check-' + str(test_locale) + '.log'),
-                                                         "\n\n================== logfile ===================\n")
-                        self.attach_logfile_buildfarm(os.path.join(self.install_dir, 'logfile-' + str(test_locale) + "-" + str(started_times)),
-                                                      "tests", test_log_number, test_log_name,
-                                                      "db logfile")
-
-                        # set mtime and other metadata to original timestamp from the test
-                        self.copy_stats(self.config.logfile_name("tests", file_type = 'stdout_stderr', full_path = self.build_dir, second_number = test_log_number, second_type = test_log_name),
-                                        os.path.join(self.buildfarm_logs, 'isolation-check-' + str(test_locale) + '.log'))
-
-                        # finally deal with any error
-                        if (run[0] > 0):
-                            self.print_run_error(run, execute)
-                            raise RegressionTestErrorPG('make_isolation-check')
-
-
-                        # run "StopDb-<locale>"
-                        test_log_number += 1
-                        test_log_name = "stopdb"
-                        result = self.regression_pg_stopdb(extra_options, log_data, test_locale, started_times, test_log_number, test_log_name)
-                        if (result is False):
-                            raise RegressionTestErrorPG('stopdb')
-
-
-
-
-                        # run "StartDb-<locale>"
-                        started_times += 1
-                        test_log_number += 1
-                        test_log_name = "startdb"
-                        result = self.regression_pg_startdb(extra_options, log_data, test_locale, started_times, test_log_number, test_log_name)
-                        if (result is False):
-                            raise RegressionTestErrorPG('startdb')
-
-
-                        # run "PLCheck-<locale>"
-                        execute = "./buildclient_run_buildfarm_pl-installcheck.sh" + " " + str(test_locale) + " " + str(started_times)
-                        run = self.run_shell(execute)
-                        test_log_number += 1
-                        test_log_name = "pl-installcheck"
-                        self.dump_logs(self.build_dir, run, execute, self.config.logfile_name("tests", second_number = test_log_number, second_type = test_log_name))
-
-                        self.copy_logfile(self.config.logfile_name("tests", file_type = 'stdout_stderr', full_path = self.build_dir, second_number = test_log_number, second_type = test_log_name),
-                                          os.path.join(self.buildfarm_logs, 'pl-install-check-' + str(test_locale) + '.log'))
-
-                        # add logfiles
-                        files_log = glob.glob(os.path.join(self.build_dir, 'src', 'pl') + os.sep + '*' + os.sep + 'regression.diffs')
-                        files_log.extend(glob.glob(os.path.join(self.build_dir, 'src', 'pl') + os.sep + '*' + os.sep + '*' + os.sep + 'regression.diffs'))
-                        for file_log in files_log:
-                            self.attach_logfile_pg_buildfarm(file_log,
-                                                             os.path.join(self.buildfarm_logs, 'pl-install-check-' + str(test_locale) + '.log'),
-                                                             "\n\n================= " + file_log[len(self.build_dir) + 1:] + " ===================\n")
-                            self.attach_logfile_buildfarm(file_log,
-                                                          "tests", test_log_number, test_log_name,
-                                                          file_log[len(self.build_dir) + 1:])
-
-                        self.attach_logfile_pg_buildfarm(os.path.join(self.install_dir, 'logfile-' + str(test_locale) + "-" + str(started_times)),
-                                                         os.path.join(self.buildfarm_logs, 'pl-install-check-' + str(test_locale) + '.log'),
-                                                         "\n\n================= logfile ===================\n")
-                        self.attach_logfile_buildfarm(os.path.join(self.install_dir, 'logfile-' + str(test_locale) + "-" + str(started_times)),
-                                                      "tests", test_log_number, test_log_name,
-                                                      "db logfile")
-
-                        # set mtime and other metadata to original timestamp from the test
-                        self.copy_stats(self.config.logfile_name("tests", file_type = 'stdout_stderr', full_path = self.build_dir, second_number = test_log_number, second_type = test_log_name),
-                                        os.path.join(self.buildfarm_logs, 'pl-install-check-' + str(test_locale) + '.log'))
-
-                        # finally deal with any error
-                        if (run[0] > 0):
-                            self.print_run_error(run, execute)
-                            raise RegressionTestErrorPG('pl-installcheck')
-
-
-                        # run "StopDb-<locale>"
-                        test_log_number += 1
-                        test_log_name = "stopdb"
-                        result = self.regression_pg_stopdb(extra_options, log_data, test_locale, started_times, test_log_number, test_log_name)
-                        if (result is False):
-                            raise RegressionTestErrorPG('stopdb')
-
-
-
-
-                        # run "StartDb-<locale>"
-                        started_times += 1
-                        test_log_number += 1
-                        test_log_name = "startdb"
-                        result = self.regression_pg_startdb(extra_options, log_data, test_locale, started_times, test_log_number, test_log_name)
-                        if (result is False):
-                            raise RegressionTestErrorPG('startdb')
-
-
-                        # run "ContribCheck-<locale>"
-                        execute = "./buildclient_run_buildfarm_contrib-installcheck.sh" + " " + str(test_locale) + " " + str(started_times)
-                        run = self.run_shell(execute)
-                        test_log_number += 1
-                        test_log_name = "contrib-installcheck"
-                        self.dump_logs(self.build_dir, run, execute, self.config.logfile_name("tests", second_number = test_log_number, second_type = test_log_name))
-
-                        self.copy_logfile(self.config.logfile_name("tests", file_type = 'stdout_stderr', full_path = self.build_dir, second_number = test_log_number, second_type = test_log_name),
-                                          os.path.join(self.buildfarm_logs, 'contrib-install-check-' + str(test_locale) + '.log'))
-
-
-                        # add logfiles
-                        files_log = glob.glob(os.path.join(self.build_dir, 'contrib') + os.sep + '*' + os.sep + 'regression.diffs')
-                        for file_log in files_log:
-                            self.attach_logfile_pg_buildfarm(file_log,
-                                                             os.path.join(self.buildfarm_logs, 'contrib-install-check-' + str(test_locale) + '.log'),
-                                                             "\n\n================= " + file_log[len(self.build_dir) + 1:] + " ===================\n")
-                            self.attach_logfile_buildfarm(file_log,
-                                                          "tests", test_log_number, test_log_name,
-                                                          file_log[len(self.build_dir) + 1:])
-
-                        self.attach_logfile_pg_buildfarm(os.path.join(self.install_dir, 'logfile-' + str(test_locale) + "-" + str(started_times)),
-                                                         os.path.join(self.buildfarm_logs, 'contrib-install-check-' + str(test_locale) + '.log'),
-                                                         "\n\n================= logfile ===================\n")
-                        self.attach_logfile_buildfarm(os.path.join(self.install_dir, 'logfile-' + str(test_locale) + "-" + str(started_times)),
-                                                      "tests", test_log_number, test_log_name,
-                                                      "db logfile")
-
-
-                        # add stack traces of any "core*" file found in the tree
-                        stack_trace = self.stack_traces(os.path.join(self.install_dir, 'data-' + test_locale))
-                        if (len(stack_trace) > 0):
-                            f = open(os.path.join(self.buildfarm_logs, 'contrib-install-check-' + str(test_locale) + '.log'), 'a')
-                            f.write(stack_trace)
-                            f.close()
-                            f = open(self.config.logfile_name("tests", file_type = 'logfile', full_path = self.build_dir, second_number = test_log_number, second_type = test_log_name), 'a')
-                            f.write(stack_trace)
-                            f.close()
-
-
-                        # set mtime and other metadata to original timestamp from the test
-                        self.copy_stats(self.config.logfile_name("tests", file_type = 'stdout_stderr', full_path = self.build_dir, second_number = test_log_number, second_type = test_log_name),
-                                        os.path.join(self.buildfarm_logs, 'contrib-install-check-' + str(test_locale) + '.log'))
-
-                        # finally deal with any error
-                        if (run[0] > 0):
-                            self.print_run_error(run, execute)
-                            raise RegressionTestErrorPG('contrib-installcheck')
-
-
-                        # run "StopDb-<locale>"
-                        test_log_number += 1
-                        test_log_name = "stopdb"
-                        result = self.regression_pg_stopdb(extra_options, log_data, test_locale, started_times, test_log_number, test_log_name)
-                        if (result is False):
-                            raise RegressionTestErrorPG('stopdb')
-
-
-
-
-                        # run "StartDb-<locale>"
-                        started_times += 1
-                        test_log_number += 1
-                        test_log_name = "startdb"
-                        result = self.regression_pg_startdb(extra_options, log_data, test_locale, started_times, test_log_number, test_log_name)
-                        if (result is False):
-                            raise RegressionTestErrorPG('startdb')
-
+            return
+
+        graph.add('make-contrib',
+                  lambda stage: self.stage_pg_script(stage, "./buildclient_run_buildfarm_make_contrib.sh", "make_contrib", 'make-contrib.log'),
+                  outputs = ['contrib'], step = 'Contrib')
+        graph.add('make-testmodules',
+                  lambda stage: self.stage_pg_script(stage, "./buildclient_run_buildfarm_make_testmodules.sh", "make_testmodules", 'make-testmodules.log'),
+                  outputs = [os.path.join('src', 'test', 'modules')], step = 'TestModules')
+
+        # both install into the same install directory
+        graph.add('contrib-install',
+                  lambda stage: self.stage_pg_contrib_install(stage),
+                  deps = ['make-contrib', 'make-testmodules'], outputs = ['contrib', 'install'], step = 'ContribInstall')
+        graph.add('testmodules-install',
+                  lambda stage: self.stage_pg_script(stage, "./buildclient_run_buildfarm_make_testmodules-install.sh", "make_testmodules-install", 'install-testmodules.log'),
+                  deps = ['make-testmodules'], outputs = [os.path.join('src', 'test', 'modules'), 'install'], step = 'TestModulesInstall')
+
+        if (int(log_data['pg_version_num']) >= 90200):
+            files_log = [os.path.join('contrib', 'pg_upgrade', '*.log'),
+                         os.path.join('contrib', 'pg_upgrade', 'log', '*'),
+                         os.path.join('src', 'bin', 'pg_upgrade', '*.log'),
+                         os.path.join('src', 'bin', 'pg_upgrade', 'log', '*'),
+                         os.path.join('src', 'bin', 'pg_upgrade', 'tmp_check', 'log', '*'),
+                         os.path.join('src', 'test', 'regress', '*.diffs')]
+            graph.add('pg_upgrade-check',
+                      lambda stage: self.stage_pg_script(stage, "./buildclient_run_buildfarm_make_pg_upgrade.sh", "make_pg_upgrade", 'check-pg_upgrade.log',
+                                                         files_log, "=========================== %s ================\n"),
+                      outputs = ['tmp_install', os.path.join('contrib', 'pg_upgrade'), os.path.join('src', 'bin', 'pg_upgrade'), os.path.join('src', 'test', 'regress')],
+                      step = 'pg_upgradeCheck')
+
+        files_log = [os.path.join('contrib', 'test_decoding', 'regression_output', 'log', '*.log'),
+                     os.path.join('contrib', 'test_decoding', 'regression_output', '*.diffs'),
+                     os.path.join('contrib', 'test_decoding', 'isolation_output', 'log', '*.log'),
+                     os.path.join('contrib', 'test_decoding', 'isolation_output', '*.diffs')]
+        graph.add('test-decoding-check',
+                  lambda stage: self.stage_pg_script(stage, "./buildclient_run_buildfarm_make_test-decoding-check.sh", "make_test-decoding-check", 'test-decoding-check.log',
+                                                     files_log, "=========================== %s ================\n"),
+                  outputs = ['tmp_install', os.path.join('contrib', 'test_decoding')], step = 'test-decoding-check')
+
+        # build everything the installcheck suites need before the locales run in parallel
+        graph.add('make-isolation',
+                  lambda stage: self.stage_pg_script(stage, "./buildclient_run_buildfarm_make_isolation.sh", "make_isolation", None),
+                  outputs = [os.path.join('src', 'test', 'isolation')], report_step = 'IsolationCheck-' + self.pg_test_locales(log_data)[0])
+        # the clusters are numbered across all locales, like in a serial run
+        started_times = 0
+        for test_locale in self.pg_test_locales(log_data):
+            # every locale has a separate cluster, port and output directory
+            started_times = self.add_pg_locale_stages(graph, extra_options, log_data, test_locale,
+                                                      ['check', 'contrib-install', 'testmodules-install', 'make-isolation'], started_times)
+
+        files_log = [os.path.join('src', 'interfaces', 'ecpg', 'test', 'log', 'regression.diffs'),
+                     os.path.join('src', 'interfaces', 'ecpg', 'test', 'log', '*.log')]
+        graph.add('ecpg-check',
+                  lambda stage: self.stage_pg_script(stage, "./buildclient_run_buildfarm_ecpg-check.sh", "ecpg-check", 'ecpg-check.log',
+                                                     files_log, "\n\n================= %s ===================\n",
+                                                     core_dirs = [os.path.join(self.build_dir, 'src', 'interfaces', 'ecpg', 'test', 'tmp_check', 'data')]),
+                  outputs = ['tmp_install', os.path.join('src', 'interfaces', 'ecpg')], step = 'ECPG-Check')
+
+
+
+    # add_pg_locale_stages()
+    #
+    # declare the PostgreSQL test stages for one locale
+    # every installcheck suite gets a freshly started cluster,
+    # in fast mode the cluster is started once for all suites
+    #
+    # parameter:
+    #  - self
+    #  - Stage graph
+    #  - extra options for tests
+    #  - pointer to log data
+    #  - locale string
+    #  - list with stages the first stage depends on
+    #  - number of clusters started for the previous locales
+    # return:
+    #  - number of clusters started including this locale
+    def add_pg_locale_stages(self, graph, extra_options, log_data, test_locale, deps, started_times):
+        # suite name, script, log name, buildfarm logfile prefix, buildfarm step prefix, logfiles, header, scan for core files, outputs
+        suites = [['installcheck', "./buildclient_run_buildfarm_installcheck.sh", "make_installcheck", 'install-check-', 'InstallCheck-',
+                   [os.path.join('src', 'test', 'regress', 'regression.diffs')],
+                   "\n\n================== %s ==================\n", False, [os.path.join('src', 'test', 'regress')]],
+                  ['isolation-check', "./buildclient_run_buildfarm_isolation-check.sh", "make_isolation-check", 'isolation-check-', 'IsolationCheck-',
+                   [os.path.join('src', 'test', 'isolation', 'regression.diffs'), os.path.join('src', 'test', 'isolation', 'log', '*.log')],
+                   "\n\n================== %s ===================\n", False, [os.path.join('src', 'test', 'isolation')]],
+                  ['pl-installcheck', "./buildclient_run_buildfarm_pl-installcheck.sh", "pl-installcheck", 'pl-install-check-', 'PLCheck-',
+                   [os.path.join('src', 'pl', '*', 'regression.diffs'), os.path.join('src', 'pl', '*', '*', 'regression.diffs')],
+                   "\n\n================= %s ===================\n", False, [os.path.join('src', 'pl')]],
+                  ['contrib-installcheck', "./buildclient_run_buildfarm_contrib-installcheck.sh", "contrib-installcheck", 'contrib-install-check-', 'ContribCheck-',
+                   [os.path.join('contrib', '*', 'regression.diffs')],
+                   "\n\n================= %s ===================\n", True, ['contrib']],
+                  ['testmodules-installcheck', "./buildclient_run_buildfarm_testmodules-installcheck.sh", "testmodules-installcheck", 'testmodules-install-check-', 'TestModulesCheck-',
+                   [os.path.join('src', 'test', 'modules', '*', 'regression.diffs')],
+                   "\n\n================= %s ===================\n", True, [os.path.join('src', 'test', 'modules')]]]
+
+        port = self.pg_locale_port(log_data, test_locale)
+        # the suites write their results below a separate directory for each locale,
+        # the logfile names stay the same as if they were written into the source tree
+        output_root = os.path.join(self.build_dir, 'buildclient_regress', test_locale)
+        env_extra = {'PGPORT': port,
+                     'EXTRA_REGRESS_OPTS': "--outputdir='" + output_root + "/$(subdir)'"}
+
+        output_dirs = []
+        for suite in suites:
+            output_dirs.extend(suite[8])
+        name = 'initdb-' + test_locale
+        graph.add(name,
+                  lambda stage: self.create_regress_output_dirs(output_root, output_dirs) and
+                                self.regression_pg_initdb(extra_options, log_data, test_locale, stage.log_number, "initdb", port),
+                  deps = deps, step = 'Initdb-' + test_locale, locale = test_locale)
+
+        # a failing suite does not stop the cluster and the following suites from running,
+        # they only run after the failed suite (stopdb and the next suite use "after")
+        test_fast = self.config.get('test-fast')
+        startdb = None
+        for suite in suites:
+            # bind the loop variables, the lambdas run later
+            if (test_fast is False or startdb is None):
+                started_times += 1
+                # starting and stopping a cluster is reported as part of the suite
+                startdb = graph.add('startdb-' + test_locale + '-' + str(started_times),
+                                    lambda stage, n = started_times: self.regression_pg_startdb(extra_options, log_data, test_locale, n, stage.log_number, "startdb", port),
+                                    deps = [name], locale = test_locale, report_step = suite[4] + test_locale).name
+                name = startdb
+
+            if (suite[7] is True):
+                core_dirs = [os.path.join(self.data_root, 'data-' + test_locale)]
+            else:
+                core_dirs = None
+            execute = suite[1] + " " + str(test_locale) + " " + str(started_times)
+            # in fast mode the server log is shared by all suites, only attach what this suite added
+            name = graph.add(suite[0] + '-' + test_locale,
+                             lambda stage, suite = suite, execute = execute, n = started_times, core_dirs = core_dirs:
+                                 self.stage_pg_script(stage, execute, suite[2], suite[3] + str(test_locale) + '.log', suite[5], suite[6],
+                                                      db_logfile = os.path.join(self.install_dir, 'logfile-' + str(test_locale) + "-" + str(n)),
+                                                      core_dirs = core_dirs, env_extra = env_extra, files_root = output_root,
+                                                      db_logfile_slice = test_fast),
+                             deps = [startdb], after = [name], outputs = [os.path.join(output_root, o) for o in suite[8]], step = suite[4] + test_locale,
+                             locale = test_locale).name
 
-                        # run "TestModulesCheck-<locale>"
-                        execute = "./buildclient_run_buildfarm_testmodules-installcheck.sh" + " " + str(test_locale) + " " + str(started_times)
-                        run = self.run_shell(execute)
-                        test_log_number += 1
-                        test_log_name = "contrib-installcheck"
-                        self.dump_logs(self.build_dir, run, execute, self.config.logfile_name("tests", second_number = test_log_number, second_type = test_log_name))
+            if (test_fast is False or suite is suites[-1]):
+                name = graph.add('stopdb-' + test_locale + '-' + str(started_times),
+                                 lambda stage, n = started_times: self.regression_pg_stopdb(extra_options, log_data, test_locale, n, stage.log_number, "stopdb", port),
+                                 deps = [startdb], after = [name], locale = test_locale, report_step = suite[4] + test_locale).name
 
-                        self.copy_logfile(self.config.logfile_name("tests", file_type = 'stdout_stderr', full_path = self.build_dir, second_number = test_log_number, second_type = test_log_name),
-                                          os.path.join(self.buildfarm_logs, 'testmodules-install-check-' + str(test_locale) + '.log'))
+        return started_times
 
 
-                        # add logfiles
-                        files_log = glob.glob(os.path.join(self.build_dir, 'src', 'test', 'modules') + os.sep + '*' + os.sep + 'regression.diffs')
-                        for file_log in files_log:
-                            self.attach_logfile_pg_buildfarm(file_log,
-                                                             os.path.join(self.buildfarm_logs, 'testmodules-install-check-' + str(test_locale) + '.log'),
-                                                             "\n\n================= " + file_log[len(self.build_dir) + 1:] + " ===================\n")
-                            self.attach_logfile_buildfarm(file_log,
-                                                          "tests", test_log_number, test_log_name,
-                                                          file_log[len(self.build_dir) + 1:])
 
-                        self.attach_logfile_pg_buildfarm(os.path.join(self.install_dir, 'logfile-' + str(test_locale) + "-" + str(started_times)),
-                                                         os.path.join(self.buildfarm_logs, 'testmodules-install-check-' + str(test_locale) + '.log'),
-                                                         "\n\n================= logfile ===================\n")
-                        self.attach_logfile_buildfarm(os.path.join(self.install_dir, 'logfile-' + str(test_locale) + "-" + str(started_times)),
-                                                      "tests", test_log_number, test_log_name,
-                                                      "db logfile")
+    # pg_test_locales()
+    #
+    # return the list of locales for the tests
+    #
+    # parameter:
+    #  - self
+    #  - pointer to log data
+    # return:
+    #  - list with locales
+    def pg_test_locales(self, log_data):
+        test_locales = log_data['test_locales']
+        if (test_locales is None or len(test_locales) == 0):
+            test_locales = 'C'
+        return test_locales.split(',')
 
 
-                        # add stack traces of any "core*" file found in the tree
-                        stack_trace = self.stack_traces(os.path.join(self.install_dir, 'data-' + test_locale))
-                        if (len(stack_trace) > 0):
-                            f = open(os.path.join(self.buildfarm_logs, 'testmodules-install-check-' + str(test_locale) + '.log'), 'a')
-                            f.write(stack_trace)
-                            f.close()
-                            f = open(self.config.logfile_name("tests", file_type = 'logfile', full_path = self.build_dir, second_number = test_log_number, second_type = test_log_name), 'a')
-                            f.write(stack_trace)
-                            f.close()
 
+    # test_parallel()
+    #
+    # return the number of test stages running in parallel
+    # "auto" runs the suites of all locales at the same time
+    #
+    # parameter:
+    #  - self
+    #  - pointer to log data
+    # return:
+    #  - number of stages
+    def test_parallel(self, log_data):
+        test_parallel = self.config.get('test-parallel')
+        if (test_parallel != 'auto'):
+            return test_parallel
 
-                        # set mtime and other metadata to original timestamp from the test
-                        self.copy_stats(self.config.logfile_name("tests", file_type = 'stdout_stderr', full_path = self.build_dir, second_number = test_log_number, second_type = test_log_name),
-                                        os.path.join(self.buildfarm_logs, 'testmodules-install-check-' + str(test_locale) + '.log'))
+        test_parallel = len(self.pg_test_locales(log_data))
+        logging.debug("test-parallel: " + str(test_parallel))
 
-                        # finally deal with any error
-                        if (run[0] > 0):
-                            self.print_run_error(run, execute)
-                            raise RegressionTestErrorPG('contrib-installcheck')
+        return test_parallel
 
 
-                        # run "StopDb-<locale>"
-                        test_log_number += 1
-                        test_log_name = "stopdb"
-                        result = self.regression_pg_stopdb(extra_options, log_data, test_locale, started_times, test_log_number, test_log_name)
-                        if (result is False):
-                            raise RegressionTestErrorPG('stopdb')
 
+    # pg_locale_port()
+    #
+    # return the port of the test cluster for a locale
+    #
+    # parameter:
+    #  - self
+    #  - pointer to log data
+    #  - locale string
+    # return:
+    #  - port (string)
+    def pg_locale_port(self, log_data, test_locale):
+        return str(self.pg_test_port + self.pg_test_locales(log_data).index(test_locale))
 
 
-                    except RegressionTestErrorPG as error:
-                        # shutdown everything
-                        logging.info("shutting down everything after test failure")
-                        execute = "./buildclient_run_buildfarm_stopdbs_after_failure.sh"
-                        run = self.run_shell(execute)
-                        # don't care about error handling
-                        return False
 
+    # create_regress_output_dirs()
+    #
+    # create the output directories for the regression tests of one locale
+    # pg_regress does not create missing parent directories
+    #
+    # parameter:
+    #  - self
+    #  - output root directory
+    #  - list with directories in the source tree (relative to build dir)
+    # return:
+    #  - True
+    def create_regress_output_dirs(self, output_root, output_dirs):
+        for output_dir in output_dirs:
+            for dirpath, dirnames, filenames in os.walk(os.path.join(self.build_dir, output_dir)):
+                if ('Makefile' in filenames):
+                    target = os.path.join(output_root, dirpath[len(self.build_dir) + 1:])
+                    if not (os.path.isdir(target)):
+                        os.makedirs(target)
+        return True
 
 
-                    # run "ECPG-Check-<locale>"
-                    execute = "./buildclient_run_buildfarm_ecpg-check.sh"
-                    run = self.run_shell(execute)
-                    test_log_number += 1
-                    test_log_name = "contrib-installcheck"
-                    self.dump_logs(self.build_dir, run, execute, self.config.logfile_name("tests", second_number = test_log_number, second_type = test_log_name))
 
-                    self.copy_logfile(self.config.logfile_name("tests", file_type = 'stdout_stderr', full_path = self.build_dir, second_number = test_log_number, second_type = test_log_name),
-                                      os.path.join(self.buildfarm_logs, 'ecpg-check.log'))
+    # stage_pg_script()
+    #
+    # run one test script, and collect the logfiles
+    #
+    # parameter:
+    #  - self
+    #  - Stage object
+    #  - script with arguments
+    #  - test name (used for the logfile name)
+    #  - name of the buildfarm logfile (None: not reported to the buildfarm)
+    #  - optional: list with logfiles to attach (glob patterns, relative to build dir)
+    #  - optional: header for attached logfiles (with '%s' for the name)
+    #  - optional: database logfile to attach
+    #  - optional: list with directories to scan for core files
+    #  - optional: dictionary with additional environment variables
+    #  - optional: directory the logfile patterns are relative to (default: build dir)
+    #  - optional: only attach the part of the database logfile written by this script
+    # return:
+    #  - True/False (False if error)
+    def stage_pg_script(self, stage, execute, test_log_name, buildfarm_log, files_log = [], header = None, db_logfile = None, core_dirs = None, env_extra = None, files_root = None, db_logfile_slice = False):
+        test_log_number = stage.log_number
+        lastpos = None
+        if (db_logfile is not None and db_logfile_slice is True and os.path.exists(db_logfile)):
+            lastpos = os.stat(db_logfile).st_size
+        run = self.run_shell(execute, env_extra)
+        stage.data['run'] = run
+        self.dump_logs(self.build_dir, run, execute, self.config.logfile_name("tests", second_number = test_log_number, second_type = test_log_name))
 
+        if (buildfarm_log is None):
+            if (run[0] > 0):
+                self.print_run_error(run, execute)
+                return False
+            return True
+
+        stdout_stderr = self.config.logfile_name("tests", file_type = 'stdout_stderr', full_path = self.build_dir, second_number = test_log_number, second_type = test_log_name)
+        buildfarm_log = os.path.join(self.buildfarm_logs, buildfarm_log)
+        self.copy_logfile(stdout_stderr, buildfarm_log)
+
+        # add logfiles from tests
+        if (files_root is None):
+            files_root = self.build_dir
+        for pattern in files_log:
+            for file_log in sorted(glob.glob(os.path.join(files_root, pattern))):
+                self.result_files.append(file_log)
+                self.attach_logfile_both(file_log, buildfarm_log, header % file_log[len(files_root) + 1:],
+                                         "tests", test_log_number, test_log_name,
+                                         file_log[len(files_root) + 1:])
+        if (db_logfile is not None):
+            self.attach_logfile_both(db_logfile, buildfarm_log, header % "logfile",
+                                     "tests", test_log_number, test_log_name,
+                                     "db logfile", start_pos = lastpos)
+
+        # add stack traces of any new core file
+        if (core_dirs is not None and self.core_dumps is not None):
+            stack_trace = self.core_dumps.stack_traces(core_dirs, stage.started)
+            if (len(stack_trace) > 0):
+                f = open(buildfarm_log, 'a')
+                f.write(stack_trace)
+                f.close()
+                f = open(self.config.logfile_name("tests", file_type = 'logfile', full_path = self.build_dir, second_number = test_log_number, second_type = test_log_name), 'a')
+                f.write(stack_trace)
+                f.close()
 
-                    # add logfiles
-                    files_log = glob.glob(os.path.join(self.build_dir, 'src', 'interfaces', 'ecpg', 'test', 'log', 'regression.diffs'))
-                    files_log.extend(glob.glob(os.path.join(self.build_dir, 'src', 'interfaces', 'ecpg', 'test', 'log') + os.sep + '*.log'))
-                    for file_log in files_log:
-                        self.attach_logfile_pg_buildfarm(file_log,
-                                                         os.path.join(self.buildfarm_logs, 'ecpg-check.log'),
-                                                         "\n\n================= " + file_log[len(self.build_dir) + 1:] + " ===================\n")
-                        self.attach_logfile_buildfarm(file_log,
-                                                      "tests", test_log_number, test_log_name,
-                                                      file_log[len(self.build_dir) + 1:])
+        # set mtime and other metadata to original timestamp from the test
+        self.copy_stats(stdout_stderr, buildfarm_log)
 
-                    self.attach_logfile_pg_buildfarm(os.path.join(self.install_dir, 'logfile-' + str(test_locale) + "-" + str(started_times)),
-                                                     os.path.join(self.buildfarm_logs, 'ecpg-check.log'),
-                                                     "\n\n================= logfile ===================\n")
-                    self.attach_logfile_buildfarm(os.path.join(self.install_dir, 'logfile-' + str(test_locale) + "-" + str(started_times)),
-                                                  "tests", test_log_number, test_log_name,
-                                                  "db logfile")
+        # finally deal with any error
+        if (run[0] > 0):
+            self.print_run_error(run, execute)
+            return False
 
+        return True
 
-                    # add stack traces of any "core*" file found in the tree
-                    stack_trace = self.stack_traces(os.path.join(self.build_dir, 'src', 'test', 'regress', 'tmp_check', 'data'))
-                    if (len(stack_trace) > 0):
-                        f = open(os.path.join(self.buildfarm_logs, 'ecpg-check.log'), 'a')
-                        f.write(stack_trace)
-                        f.close()
-                        f = open(self.config.logfile_name("tests", file_type = 'logfile', full_path = self.build_dir, second_number = test_log_number, second_type = test_log_name), 'a')
-                        f.write(stack_trace)
-                        f.close()
 
 
-                    # set mtime and other metadata to original timestamp from the test
-                    self.copy_stats(self.config.logfile_name("tests", file_type = 'stdout_stderr', full_path = self.build_dir, second_number = test_log_number, second_type = test_log_name),
-                                    os.path.join(self.buildfarm_logs, 'ecpg-check.log'))
+    # stage_pg_check()
+    #
+    # run "make check", the result is the main test result
+    #
+    # parameter:
+    #  - self
+    #  - Stage object
+    #  - script to run
+    #  - pointer to log data
+    # return:
+    #  - True/False (False if error)
+    def stage_pg_check(self, stage, execute, log_data):
+        # 'check.log' is a mingle-mangle of logs
+        files_log = [os.path.join('src', 'test', 'regress', 'regression.diffs'),
+                     os.path.join('src', 'test', 'regress', 'log', '*.log'),
+                     os.path.join('tmp_install', 'log', '*')]
+        result = self.stage_pg_script(stage, execute, None, 'check.log', files_log, "\n\n================== %s ===================\n",
+                                      core_dirs = [os.path.join(self.build_dir, 'src', 'test', 'regress', 'tmp_check', 'data')])
+        log_data['result_tests'] = stage.data['run'][0]
+        log_data['time_tests'] = stage.data['run'][2]
 
-                    # finally deal with any error
-                    if (run[0] > 0):
-                        self.print_run_error(run, execute)
-                        return False
+        return result
 
 
 
-        elif (repository_type == 'Greenplum'):
-            # FIXME: figure out the hostfile, and check ssh connections to all hosts
-            self.regression_logfile_directory = os.path.join(self.install_dir, "tmp_regression_tests", "gpAdminLogs")
-            execute = "./buildclient_run_regression_tests.sh"
-            run = self.run_shell(execute)
-            self.dump_logs(self.build_dir, run, execute, "log_09_tests")
-            log_data['run_tests'] = True
-            log_data['extra_tests'] = extra_options
-            log_data['result_tests'] = run[0]
-            log_data['time_tests'] = run[2]
-            if (run[0] > 0):
-                self.print_run_error(run, execute, ' tests failed.')
-                return False
-            self.regression_logfile_directory = False
+    # stage_pg_contrib_install()
+    #
+    # run "make install" in contrib
+    #
+    # parameter:
+    #  - self
+    #  - Stage object
+    # return:
+    #  - True/False (False if error)
+    def stage_pg_contrib_install(self, stage):
+        # install happened earlier, just copy the logfile and fake the metadata
+        self.copy_logfile(self.config.logfile_name("install", file_type = 'stdout_stderr', full_path = self.build_dir), os.path.join(self.buildfarm_logs, 'make-install.log'))
+        self.copy_stats(os.path.join(self.buildfarm_logs, 'make-testmodules.log'), os.path.join(self.buildfarm_logs, 'make-install.log'))
 
-        logging.debug("regression tests completed")
-        return True
+        return self.stage_pg_script(stage, "./buildclient_run_buildfarm_make_contrib-install.sh", "make_contrib-install", 'install-contrib.log')
 
 
 
@@ -1584,6 +1583,9 @@ class Build:
             logging.error("file: " + str(from_file))
             sys.exit(1)
         shutil.copy2(from_file, to_file)
+        step = self.current_step_name()
+        if (step is not None):
+            self.manifest.add_log(step, to_file)
 
 
 
@@ -1622,20 +1624,9 @@ class Build:
     #  none
     def attach_logfile_pg_buildfarm(self, log_file, to_file, header, stat_file = None, start_pos = None):
         if (os.path.exists(log_file)):
-            f = open(to_file, 'a')
-            f.write(header)
-            # the PostgreSQL buildfarm makes no attempt to read files in binary mode
-            r = open(log_file, 'r')
-            if (start_pos is not None):
-                r.seek(start_pos, 0)
-            f.write(r.read())
-            r.close()
-            f.close()
+            self.append_logfile(log_file, [[to_file, header]], start_pos)
             if (stat_file is not None):
-                if not (os.path.exists(stat_file)):
-                    logging.error("stat file does not exist!")
-                    logging.error("file: " + str(stat_file))
-                self.copy_stats(stat_file, to_file)
+                self.copy_stats_to_logfile(stat_file, to_file)
 
 
 
@@ -1653,25 +1644,269 @@ class Build:
     #  none
     def attach_logfile_buildfarm(self, log_file, target_log_type, target_second_number, target_second_type, header, start_pos = None):
         if (os.path.exists(log_file)):
+            self.append_logfile(log_file, [self.logfile_target_buildfarm(target_log_type, target_second_number, target_second_type, header)], start_pos)
 
-            # calculate to_file name
-            to_file = self.config.logfile_name(target_log_type, second_number = target_second_number, second_type = target_second_type, file_type = "logfile", full_path = self.build_dir)
-            if (os.path.exists(to_file)):
-                to_file_size = os.stat(to_file).st_size
-            else:
-                to_file_size = 0
 
-            f = open(to_file, 'a')
-            if (to_file_size > 0):
-                # add linebreaks if the file already has logs
-                f.write(os.linesep + os.linesep)
-            f.write("=" * 15 + " " + header + " " + "=" * 15 + os.linesep)
-            r = open(log_file, 'r')
-            if (start_pos is not None):
-                r.seek(start_pos, 0)
-            f.write(r.read())
-            r.close()
-            f.close()
+
+    # attach_logfile_both()
+    #
+    # attach a logfile to a PostgreSQL buildfarm logfile and to a buildfarm logfile,
+    # the logfile is only read once
+    #
+    # parameter:
+    #  - self
+    #  - logfile to attach
+    #  - target PostgreSQL buildfarm logfile
+    #  - header for the PostgreSQL buildfarm logfile
+    #  - log type, number and name of the buildfarm logfile
+    #  - header for the buildfarm logfile
+    #  - start position: optional start position in the attach logfile
+    #  - stats file: optional filename which metadata is used to update the PostgreSQL buildfarm logfile
+    # return:
+    #  none
+    def attach_logfile_both(self, log_file, to_file, pg_header, target_log_type, target_second_number, target_second_type, header, start_pos = None, stat_file = None):
+        if (os.path.exists(log_file)):
+            self.append_logfile(log_file, [[to_file, pg_header],
+                                           self.logfile_target_buildfarm(target_log_type, target_second_number, target_second_type, header)], start_pos)
+            if (stat_file is not None):
+                self.copy_stats_to_logfile(stat_file, to_file)
+
+
+
+    # logfile_target_buildfarm()
+    #
+    # figure out target filename and header for attach_logfile_buildfarm()
+    #
+    # parameter:
+    #  - self
+    #  - log type, number and name of the target logfile
+    #  - header to insert
+    # return:
+    #  - list with target filename and header
+    def logfile_target_buildfarm(self, target_log_type, target_second_number, target_second_type, header):
+        # calculate to_file name
+        to_file = self.config.logfile_name(target_log_type, second_number = target_second_number, second_type = target_second_type, file_type = "logfile", full_path = self.build_dir)
+        if (os.path.exists(to_file)):
+            to_file_size = os.stat(to_file).st_size
+        else:
+            to_file_size = 0
+
+        full_header = ''
+        if (to_file_size > 0):
+            # add linebreaks if the file already has logs
+            full_header += os.linesep + os.linesep
+        full_header += "=" * 15 + " " + header + " " + "=" * 15 + os.linesep
+
+        return [to_file, full_header]
+
+
+
+    # copy_stats_to_logfile()
+    #
+    # copy metadata to a logfile after attaching another logfile
+    #
+    # parameter:
+    #  - self
+    #  - stats file
+    #  - target logfile
+    # return:
+    #  none
+    def copy_stats_to_logfile(self, stat_file, to_file):
+        if not (os.path.exists(stat_file)):
+            logging.error("stat file does not exist!")
+            logging.error("file: " + str(stat_file))
+        self.copy_stats(stat_file, to_file)
+
+
+
+    # append_logfile()
+    #
+    # append (the end of) a logfile to one or more target files
+    # the logfile is copied in chunks, and read only once for all targets
+    # a logfile exceeding the log budget is cut, the beginning and the end are kept
+    #
+    # parameter:
+    #  - self
+    #  - logfile to attach
+    #  - list with [target filename, header] pairs
+    #  - start position: optional start position in the attach logfile
+    # return:
+    #  none
+    def append_logfile(self, log_file, targets, start_pos = None):
+        step = self.current_step_name()
+        target_fds = []
+        for to_file, header in targets:
+            # no O_APPEND, copy_file_range() does not support it
+            fd = os.open(to_file, os.O_WRONLY | os.O_CREAT, 0o0644)
+            offset = os.lseek(fd, 0, os.SEEK_END)
+            self.write_all(fd, header.encode('utf-8'))
+            target_fds.append(fd)
+            if (step is not None):
+                # the offset points to the header itself, not to the linebreaks before it
+                self.manifest.add_section(step, to_file, offset + len(header.encode('utf-8')) - len(header.lstrip().encode('utf-8')), header)
+
+        source_fd = os.open(log_file, os.O_RDONLY)
+        if (start_pos is None):
+            start_pos = 0
+        size = max(os.fstat(source_fd).st_size - start_pos, 0)
+        head, tail, marker = self.log_budget.split(size)
+        os.lseek(source_fd, start_pos, os.SEEK_SET)
+        self.copy_fd(source_fd, target_fds, head)
+        if (marker is not None):
+            for fd in target_fds:
+                self.write_all(fd, marker)
+            os.lseek(source_fd, start_pos + size - tail, os.SEEK_SET)
+            self.copy_fd(source_fd, target_fds, tail)
+
+        os.close(source_fd)
+        for fd in target_fds:
+            os.close(fd)
+
+
+
+    # copy_fd()
+    #
+    # copy a number of bytes from a file descriptor to one or more file descriptors,
+    # starting at the current positions
+    #
+    # parameter:
+    #  - self
+    #  - source file descriptor
+    #  - list with target file descriptors
+    #  - number of bytes to copy (less if the source ends before)
+    # return:
+    #  none
+    def copy_fd(self, source_fd, target_fds, count):
+        chunk_size = 1024 * 1024
+        if (len(target_fds) == 1 and hasattr(os, 'copy_file_range')):
+            # let the kernel copy the data (Python 3.8+, Linux)
+            try:
+                while (count > 0):
+                    copied = os.copy_file_range(source_fd, target_fds[0], min(count, chunk_size))
+                    if (copied == 0):
+                        break
+                    count -= copied
+                return
+            except OSError as e:
+                # continue with a regular copy, both file positions are still correct
+                logging.debug("copy_file_range() failed: " + str(e))
+        while (count > 0):
+            block = os.read(source_fd, min(count, chunk_size))
+            if (len(block) == 0):
+                break
+            for fd in target_fds:
+                self.write_all(fd, block)
+            count -= len(block)
+
+
+
+    # truncate_buildfarm_logs()
+    #
+    # apply the log budget to the logfiles for the buildfarm server
+    # logs copied from other places (like config.log) did not pass the budget yet
+    # must run before the manifest is written, the cut moves the sections in the logfiles
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  none
+    def truncate_buildfarm_logs(self):
+        logfiles = list(filter(os.path.isfile, glob.glob(os.path.join(self.buildfarm_logs, '*.log'))))
+        logfiles.sort(key = lambda f: os.path.getmtime(f))
+        log_budget = LogBudget(self.config.get('log-step-budget'), self.config.get('log-job-budget'))
+        for logfile in logfiles:
+            cut = log_budget.truncate_file(logfile)
+            if (cut is not False):
+                logging.info("logfile truncated for buildfarm server: " + os.path.basename(logfile))
+                self.manifest.cut_log(logfile, cut[0], cut[1], cut[2])
+
+
+
+    # compress_logs()
+    #
+    # compress the logfiles of a finished build, and update the manifest
+    # only used when the build dir is kept, else the logfiles are deleted anyway
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  none
+    def compress_logs(self):
+        method = self.config.get('compress-logs')
+        if (method == 'none'):
+            return
+        if (self.build_dir in self.cleanup_clean or self.build_dir in self.cleanup_error):
+            return
+
+        logfiles = glob.glob(os.path.join(self.build_dir, 'log_*.txt'))
+        logfiles.extend(glob.glob(os.path.join(self.buildfarm_logs, '*.log')))
+        logging.debug("compress " + str(len(logfiles)) + " logfiles (" + method + ")")
+        for logfile in logfiles:
+            target = self.compress_logfile(logfile, method)
+            if (target is not False):
+                self.manifest.compress_log(logfile, target, method)
+        self.manifest.write()
+
+
+
+    # compress_logfile()
+    #
+    # compress one logfile, and remove the original
+    #
+    # parameter:
+    #  - self
+    #  - logfile name
+    #  - compression method (gzip, zstd)
+    # return:
+    #  - False, or name of the compressed logfile
+    def compress_logfile(self, logfile, method):
+        if (method == 'gzip'):
+            target = logfile + '.gz'
+            try:
+                r = open(logfile, 'rb')
+                f = gzip.open(target, 'wb')
+                shutil.copyfileobj(r, f, 1024 * 1024)
+                f.close()
+                r.close()
+            except (OSError, IOError) as e:
+                logging.error("failed to compress logfile: " + logfile)
+                logging.error("error: " + str(e))
+                if (os.path.exists(target)):
+                    os.remove(target)
+                return False
+        else:
+            target = logfile + '.zst'
+            proc = Popen([self.config.get('zstd-bin'), '-q', '-f', logfile, '-o', target], stdout=PIPE, stderr=subprocess.STDOUT)
+            out, err = proc.communicate()
+            if (proc.returncode != 0):
+                logging.error("failed to compress logfile: " + logfile)
+                logging.error("error: " + out.decode().strip())
+                if (os.path.exists(target)):
+                    os.remove(target)
+                return False
+
+        # keep metadata (like mtime) intact, the PostgreSQL buildfarm depends on it
+        shutil.copystat(logfile, target)
+        os.remove(logfile)
+
+        return target
+
+
+
+    # write_all()
+    #
+    # write a buffer to a file descriptor, handle short writes
+    #
+    # parameter:
+    #  - self
+    #  - file descriptor
+    #  - buffer (bytes)
+    # return:
+    #  none
+    def write_all(self, fd, data):
+        while (len(data) > 0):
+            written = os.write(fd, data)
+            data = data[written:]
 
 
 
@@ -1686,12 +1921,33 @@ class Build:
     #  - locale string used to initialize the cluster
     #  - ongoing test number
     #  - test name
+    #  - port for the cluster
     # return:
     #  none
-    def regression_pg_initdb(self, extra_options, log_data, test_locale, test_log_number, test_log_name):
+    def regression_pg_initdb(self, extra_options, log_data, test_locale, test_log_number, test_log_name, port):
         # run "Initdb-<locale>"
         execute = "./buildclient_run_buildfarm_initdb.sh" + " " + str(test_locale)
-        run = self.run_shell(execute)
+        data_dir = os.path.join(self.data_root, 'data-' + str(test_locale))
+        template_key = None
+        run = False
+        if (self.install_fingerprint is not None):
+            template_key = self.artifact_cache.template_key(self.install_fingerprint, test_locale, self.pg_initdb_options)
+            t_start = datetime.datetime.now()
+            if (self.artifact_cache.clone_template(template_key, data_dir) is True):
+                t_end = datetime.datetime.now()
+                run = [0, ("data directory cloned from initdb template: " + template_key).encode(), "%.2f" % (t_end - t_start).total_seconds()]
+        if (run is False):
+            run = self.run_shell(execute)
+            if (run[0] == 0 and template_key is not None):
+                # store the unmodified data directory, the configuration is added for every clone
+                self.artifact_cache.store_template(template_key, data_dir)
+        if (run[0] == 0):
+            execute_config = "./buildclient_run_buildfarm_initdb_config.sh" + " " + str(test_locale) + " " + str(port)
+            run_config = self.run_shell(execute_config)
+            if (run_config[0] > 0):
+                # report the failing script
+                run = run_config
+                execute = execute_config
         test_log_name += "-" + str(test_locale)
         self.dump_logs(self.build_dir, run, execute, self.config.logfile_name("tests", second_number = test_log_number, second_type = test_log_name))
 
@@ -1719,12 +1975,13 @@ class Build:
     #  - number times the database was started
     #  - ongoing test number
     #  - test name
+    #  - port for the cluster
     # return:
     #  none
-    def regression_pg_startdb(self, extra_options, log_data, test_locale, started_times, test_log_number, test_log_name):
+    def regression_pg_startdb(self, extra_options, log_data, test_locale, started_times, test_log_number, test_log_name, port):
         # run "StartDb-<locale>"
         execute = "./buildclient_run_buildfarm_startdb.sh" + " " + str(test_locale) + " " + str(started_times)
-        run = self.run_shell(execute)
+        run = self.run_shell(execute, {'PGPORT': port})
         test_log_name += "-" + str(test_locale) + "-" + str(started_times)
         self.dump_logs(self.build_dir, run, execute, self.config.logfile_name("tests", second_number = test_log_number, second_type = test_log_name))
 
@@ -1732,13 +1989,12 @@ class Build:
                           os.path.join(self.buildfarm_logs, 'startdb-' + str(test_locale) + "-" + str(started_times) + '.log'))
 
         # add logfiles
-        self.attach_logfile_pg_buildfarm(os.path.join(self.install_dir, 'logfile-' + str(test_locale) + "-" + str(started_times)),
-                                         os.path.join(self.buildfarm_logs, 'startdb-' + str(test_locale) + "-" + str(started_times) + '.log'),
-                                         "========== db log file ==========",
-                                         stat_file = self.config.logfile_name("tests", file_type = 'stdout_stderr', full_path = self.build_dir, second_number = test_log_number, second_type = test_log_name))
-        self.attach_logfile_buildfarm(os.path.join(self.install_dir, 'logfile-' + str(test_locale) + "-" + str(started_times)),
-                                      "tests", test_log_number, test_log_name,
-                                      "db logfile")
+        self.attach_logfile_both(os.path.join(self.install_dir, 'logfile-' + str(test_locale) + "-" + str(started_times)),
+                                 os.path.join(self.buildfarm_logs, 'startdb-' + str(test_locale) + "-" + str(started_times) + '.log'),
+                                 "========== db log file ==========",
+                                 "tests", test_log_number, test_log_name,
+                                 "db logfile",
+                                 stat_file = self.config.logfile_name("tests", file_type = 'stdout_stderr', full_path = self.build_dir, second_number = test_log_number, second_type = test_log_name))
 
         # finally deal with any error
         if (run[0] > 0):
@@ -1761,13 +2017,14 @@ class Build:
     #  - number times the database was started
     #  - ongoing test number
     #  - test name
+    #  - port for the cluster
     # return:
     #  none
-    def regression_pg_stopdb(self, extra_options, log_data, test_locale, started_times, test_log_number, test_log_name):
+    def regression_pg_stopdb(self, extra_options, log_data, test_locale, started_times, test_log_number, test_log_name, port):
         # run "StopDb-<locale>"
         lastpos = os.stat(os.path.join(self.install_dir, 'logfile-' + str(test_locale) + "-" + str(started_times))).st_size
         execute = "./buildclient_run_buildfarm_stopdb.sh" + " " + str(test_locale) + " " + str(started_times)
-        run = self.run_shell(execute)
+        run = self.run_shell(execute, {'PGPORT': port})
         test_log_name += "-" + str(test_locale) + "-" + str(started_times)
         self.dump_logs(self.build_dir, run, execute, self.config.logfile_name("tests", second_number = test_log_number, second_type = test_log_name))
 
@@ -1775,14 +2032,12 @@ class Build:
                           os.path.join(self.buildfarm_logs, 'stopdb-' + str(test_locale) + "-" + str(started_times) + '.log'))
 
         # add logfiles
-        self.attach_logfile_pg_buildfarm(os.path.join(self.install_dir, 'logfile-' + str(test_locale) + "-" + str(started_times)),
-                                         os.path.join(self.buildfarm_logs, 'stopdb-' + str(test_locale) + "-" + str(started_times) + '.log'),
-                                         "========== db log file ==========",
-                                         stat_file = self.config.logfile_name("tests", file_type = 'stdout_stderr', full_path = self.build_dir, second_number = test_log_number, second_type = test_log_name),
-                                         start_pos = lastpos)
-        self.attach_logfile_buildfarm(os.path.join(self.install_dir, 'logfile-' + str(test_locale) + "-" + str(started_times)),
-                                      "tests", test_log_number, test_log_name,
-                                      "db logfile", start_pos = lastpos)
+        self.attach_logfile_both(os.path.join(self.install_dir, 'logfile-' + str(test_locale) + "-" + str(started_times)),
+                                 os.path.join(self.buildfarm_logs, 'stopdb-' + str(test_locale) + "-" + str(started_times) + '.log'),
+                                 "========== db log file ==========",
+                                 "tests", test_log_number, test_log_name,
+                                 "db logfile", start_pos = lastpos,
+                                 stat_file = self.config.logfile_name("tests", file_type = 'stdout_stderr', full_path = self.build_dir, second_number = test_log_number, second_type = test_log_name))
 
         # finally deal with any error
         if (run[0] > 0):
@@ -1805,6 +2060,23 @@ class Build:
     # return:
     #  none
     def print_run_error(self, run, command, filter = False):
+        with self.print_lock:
+            self.print_run_error_locked(run, command, filter)
+
+
+
+    # print_run_error_locked()
+    #
+    # print out run error messages, caller holds the print lock
+    #
+    # parameter:
+    #  - self
+    #  - list with result from run_shell()
+    #  - arguments string
+    #  - filter string for output
+    # return:
+    #  none
+    def print_run_error_locked(self, run, command, filter = False):
         print("")
         print("exec failed (return code: " + str(run[0]) + ")")
         if (len(run[1]) > 1):
@@ -1873,12 +2145,13 @@ class Build:
     # parameter:
     #  - self
     #  - string with command and arguments
+    #  - optional: dictionary with additional environment variables
     # return:
     #  - list with:
     #    - exit code
     #    - content of STDOUT
     #    - content of STDERR
-    def run_shell(self, arguments):
+    def run_shell(self, arguments, env_extra = None):
         dir = self.build_dir
 
         call = shlex.split(arguments)
@@ -1888,9 +2161,14 @@ class Build:
         logging.debug(str(call))
         t_start = datetime.datetime.now()
         # use extra environment which enables ccache
-        proc = Popen(call, stdout=PIPE, stderr=subprocess.STDOUT, cwd=dir, env=self.create_env_for_ccache())
-        out, err = proc.communicate()
-        exitcode = proc.returncode
+        env = self.create_env_for_ccache()
+        if (env_extra is not None):
+            env.update(env_extra)
+        proc = Popen(call, stdout=PIPE, stderr=subprocess.STDOUT, cwd=dir, env=env)
+        # the log budget is applied while reading, the full output is never kept in memory
+        out = self.log_budget.read_stream(proc.stdout)
+        proc.stdout.close()
+        exitcode = proc.wait()
         t_end = datetime.datetime.now()
         t_run = "%.2f" % (t_end - t_start).total_seconds()
         logging.debug("runtime: " + str(t_run) + "s")
@@ -1915,18 +2193,67 @@ class Build:
         f = open(os.path.join(build_dir, template + '_exit_code.txt'), 'w')
         f.write(str(run[0]) + os.linesep)
         f.close()
-        f = open(os.path.join(build_dir, template + '_stdout_stderr.txt'), 'w')
-        f.write(run[1].decode() + os.linesep)
+        f = open(os.path.join(build_dir, template + '_stdout_stderr.txt'), 'wb')
+        # the budget was applied in run_shell()
+        f.write(run[1] + os.linesep.encode('utf-8'))
         f.close()
+        self.log_budget.charge(len(run[1]))
         f = open(os.path.join(build_dir, template + '_cmdline.txt'), 'w')
         f.write(args + os.linesep)
         f.close()
 
+        step = self.current_step_name()
+        if (step is not None):
+            for file_type in ['cmdline', 'exit_code', 'stdout_stderr']:
+                self.manifest.add_log(step, os.path.join(build_dir, template + '_' + file_type + '.txt'))
+            self.manifest.update_step(step, exit_code = run[0], result = 'ok' if (run[0] == 0) else 'failed',
+                                      started = time.time() - float(run[2]), duration = run[2])
+
+
+
+    # current_step_name()
+    #
+    # figure out which step is writing logfiles in the calling thread
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - step name, or None
+    def current_step_name(self):
+        if (self.stage_graph is not None):
+            stage = self.stage_graph.current_stage()
+            if (stage is not None):
+                return stage.name
+        return self.current_step
+
+
+
+    # write_manifest()
+    #
+    # write the manifest with all steps and logfiles into the build directory,
+    # and add the steps to the log data (table: build_steps)
+    #
+    # parameter:
+    #  - self
+    #  - pointer to log data
+    # return:
+    #  none
+    def write_manifest(self, log_data):
+        self.manifest.write()
+        for step in self.manifest.ordered_steps():
+            if (step['started'] is None):
+                # declared, but never ran
+                continue
+            log_data['build_steps'].append({'name': step['name'], 'step': step['buildfarm_step'], 'locale': step.get('locale'),
+                                            'result': step['result'], 'exit_code': step['exit_code'],
+                                            'started': step['started'], 'duration': step['duration'],
+                                            'log': self.manifest.main_log(step)})
+
 
 
     # create_env_for_ccache()
     #
-    # populate a copy of he shell environment with ccache settings
+    # populate a copy of he shell environment with compiler and ccache settings
     #
     # parameter:
     #  - self
@@ -1935,74 +2262,86 @@ class Build:
     def create_env_for_ccache(self):
         env = os.environ.copy()
 
+        self.compiler.populate_env(env)
         if (len(self.config.get('ccache-bin')) > 0):
-            # for now just assume it's 'gcc' and 'g++'
-            # was told that clang on Mac links to these names as well
-            env['CC'] = self.config.get('ccache-bin') + ' gcc'
-            env['CXX'] = self.config.get('ccache-bin') + ' g++'
+            if (self.ccache_dir is not False):
+                env['CCACHE_DIR'] = self.ccache_dir
+            if (len(self.config.get('ccache-max-size')) > 0):
+                env['CCACHE_MAXSIZE'] = self.config.get('ccache-max-size')
 
         return env
 
 
 
-    # stack_traces()
+    # ccache_directory()
     #
-    # generate stack traces of all core files
+    # figure out which compiler cache directory to use for a build
     #
     # parameter:
     #  - self
-    #  - directory to scan for core files
+    #  - pointer to log data
     # return:
-    #  - string with stack traces
-    def stack_traces(self, scan_dir):
-        # first check if there is a gdb binary in $PATH
-
-        gdb = self.config.find_in_path('gdb')
-        if (gdb is False):
-            return None
-
-        trace = ''
-
-        for core_dirpath, core_dirs, core_files in os.walk(scan_dir):
-            for core_file in core_files:
-                if (core_file[0:4] == 'core'):
-                    core_this = os.path.join(core_dirpath, core_file)
-                    core_trace = self.stack_trace(core_this, scan_dir, gdb)
-                    if (core_trace is not None):
-                        trace += core_trace
+    #  - False (ccache default), or path to cache directory
+    def ccache_directory(self, log_data):
+        if (len(self.config.get('ccache-bin')) == 0 or len(self.config.get('ccache-dir')) == 0):
+            return False
+        if (self.config.get('ccache-per-branch') is False):
+            return self.config.get('ccache-dir')
+
+        # every repository/branch combination gets its own cache,
+        # builds of different branches do not evict each other
+        name = re.sub(r'[^a-zA-Z0-9_\-\.]', '_', str(log_data['repository']) + '_' + str(log_data['branch']))
+        ccache_dir = os.path.join(self.config.get('ccache-dir'), name)
+        if (os.path.isdir(ccache_dir) is False):
+            try:
+                os.mkdir(ccache_dir, 0o0700)
+            except OSError as e:
+                # another job might have created it in the meantime
+                if (os.path.isdir(ccache_dir) is False):
+                    logging.error("failed to create ccache directory: " + ccache_dir)
+                    logging.error("error: " + e.strerror)
+                    return self.config.get('ccache-dir')
+        logging.debug("ccache dir: " + ccache_dir)
 
-        return trace
+        return ccache_dir
 
 
 
-    # stack_trace()
+    # ccache_stats()
     #
-    # generate a stack trace for a core file
+    # read the statistics of the compiler cache
     #
     # parameter:
     #  - self
-    #  - core file name
-    #  - directory name
-    #  - path to gdb binary
     # return:
-    #  - string with stack traces
-    def stack_trace(self, core, scan_dir, gdb):
-        gpdcmd = os.path.join(scan_dir, 'gdbcmd')
-        f.open(gpdcmd, 'w')
-        f.write("bt" + os.linesep)
-        f.close()
+    #  - False (no ccache or no statistics), or dictionary with 'hits', 'misses' and 'size' (in KiB)
+    def ccache_stats(self):
+        if (len(self.config.get('ccache-bin')) == 0):
+            return False
 
-        execute = gdb + " -x " + gpdcmd + " --batch " + os.path.join(self.install_dir, 'bin', 'postgres') + "'" + core + "'"
-        run = self.run_shell(execute)
-        if (run[0] > 0):
-            # something happened, cannot extract stack trace
-            return None
+        env = self.create_env_for_ccache()
+        try:
+            # machine readable output, available since ccache 3.7
+            proc = Popen([self.config.get('ccache-bin'), '--print-stats'], stdout=PIPE, stderr=PIPE, env=env)
+            out, err = proc.communicate()
+        except OSError as e:
+            logging.debug("failed to read ccache statistics: " + str(e))
+            return False
+        if (proc.returncode != 0):
+            logging.debug("failed to read ccache statistics: " + err.decode().strip())
+            return False
 
-        os.remove(gpdcmd)
+        values = {}
+        for line in out.decode().splitlines():
+            fields = line.split()
+            if (len(fields) == 2 and fields[1].isdigit()):
+                values[fields[0]] = int(fields[1])
 
-        trace = "\n\n" + "=" * 15 + " stack trace: "
-        trace += core[len(scan_dir) + 1:]
-        trace += " " + "=" * 15 + "\n"
-        trace += run[1]
+        stats = {}
+        # the names changed in ccache 4.0
+        stats['hits'] = values.get('direct_cache_hit', values.get('cache_hit_direct', 0)) + \
+                        values.get('preprocessed_cache_hit', values.get('cache_hit_preprocessed', 0))
+        stats['misses'] = values.get('cache_miss', 0)
+        stats['size'] = values.get('cache_size_kibibyte', 0)
 
-        return trace
+        return stats
@@ -0,0 +1,117 @@
+# log data of one build, filled by the build steps and written by Database.log_build()
+# the fields are fixed: a misspelled key raises KeyError instead of silently adding a new entry
+# for compatibility with the code written for dictionaries, fields can be used as record['name']
+
+class BuildRecord(object):
+
+    __slots__ = ['repository', 'repository_type', 'branch', 'revision', 'is_head',
+                 'start_time', 'start_time_local', 'orca', 'is_buildfarm',
+                 'run_git_update', 'run_configure', 'run_make', 'run_install', 'run_tests', 'run_extra_targets',
+                 'time_git_update', 'time_configure', 'time_make', 'time_install', 'time_tests', 'build_steps',
+                 'result_portcheck', 'result_git_update', 'result_configure', 'result_make', 'result_install', 'result_tests',
+                 'extra_configure', 'extra_make', 'extra_install', 'extra_tests', 'extra_patches',
+                 'test_locales', 'patches', 'errorstr',
+                 'pg_majorversion', 'pg_version', 'pg_version_num', 'pg_version_str',
+                 'gp_majorversion', 'gp_version', 'gp_version_num',
+                 'ccache_hits', 'ccache_misses', 'ccache_size', 'ccache_size_delta',
+                 'test_failures',
+                 'build_dir', 'install_dir', 'stage_results', 'failed_stage']
+
+    def __init__(self):
+        self.repository = None
+        self.repository_type = None
+        self.branch = None
+        self.revision = None
+        self.is_head = None
+
+        self.start_time = None
+        self.start_time_local = None
+        self.orca = None
+        self.is_buildfarm = None
+
+        self.run_git_update = False
+        self.run_configure = False
+        self.run_make = False
+        self.run_install = False
+        self.run_tests = False
+        self.run_extra_targets = ''
+
+        self.time_git_update = 0
+        self.time_configure = 0
+        self.time_make = 0
+        self.time_install = 0
+        self.time_tests = 0
+        # every step and test stage which ran, see Build.write_manifest()
+        self.build_steps = []
+
+        self.result_portcheck = None
+        self.result_git_update = None
+        self.result_configure = None
+        self.result_make = None
+        self.result_install = None
+        self.result_tests = None
+
+        self.extra_configure = ''
+        self.extra_make = ''
+        self.extra_install = ''
+        self.extra_tests = ''
+        self.extra_patches = False
+        self.test_locales = ''
+        self.patches = ''
+        self.errorstr = ''
+
+        self.pg_majorversion = None
+        self.pg_version = None
+        self.pg_version_num = None
+        self.pg_version_str = None
+        self.gp_majorversion = None
+        self.gp_version = None
+        self.gp_version_num = None
+
+        self.ccache_hits = None
+        self.ccache_misses = None
+        self.ccache_size = None
+        self.ccache_size_delta = None
+
+        # failed tests, see TestFailureExtractor
+        self.test_failures = []
+
+        # stored in build_additional_data, None if not set
+        self.build_dir = None
+        self.install_dir = None
+        self.stage_results = None
+        # first failed test stage, see StageGraph.failed_stage()
+        self.failed_stage = None
+
+
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+
+
+    def __setitem__(self, key, value):
+        try:
+            setattr(self, key, value)
+        except AttributeError:
+            raise KeyError(key)
+
+
+
+    # sql_bool()
+    #
+    # adapter for boolean fields: SQLite stores them as 1/0
+    #
+    # parameter:
+    #  - self
+    #  - field name
+    # return:
+    #  - 1/0
+    def sql_bool(self, key):
+        if (self[key] is True):
+            return 1
+        return 0
+
@@ -19,16 +19,17 @@ from subprocess import Popen
 import socket
 import sqlite3
 import datetime
+import gzip
 from time import gmtime, localtime, strftime
 # config functions
 from config import Config
 # repository functions
 from repository import Repository
 from build import Build
+from log_manifest import LogManifest
 from patch import Patch
 from database import Database
 from buildfarm import Buildfarm
-import copy
 
 
 # start with 'info', can be overriden by '-q' later on
@@ -70,7 +71,6 @@ config.build_and_verify_config()
 config.cleanup_old_dirs_and_files()
 
 database = Database(config)
-all_log_data = database.init_dataset()
 
 
 
@@ -105,23 +105,50 @@ all_log_data = database.init_dataset()
 
 
 
+#######################################################################
+# roll up old builds into daily statistics, then exit
+if (config.get('compact-history') is True):
+    stats = database.compact_history(config.get('keep-builds'))
+    print("")
+    print("Rolled up " + str(stats['builds']) + " builds into " + str(stats['days']) + " daily statistics")
+    print("Deleted " + str(stats['jobs']) + " finished buildfarm jobs")
+    print("")
+    sys.exit(0)
+
+
+
 #######################################################################
 # list results of previous runs, in compact mode
 if (config.get('list-results') is True):
-    data = database.fetch_all_from_build_status()
+    filters = {'failing-test': config.get('failing-test'),
+               'branch': config.get('filter-branch'),
+               'repository': config.get('filter-repository'),
+               'status': config.get('filter-status'),
+               'mode': config.get('filter-mode'),
+               'since': config.get('since'),
+               'until': config.get('until')}
+    count = database.count_build_status(filters)
     print("")
-    if (data is None or len(data) == 0):
+    if (count == 0):
         print("No previous records in database")
         print("")
         sys.exit(0)
 
-    if (len(data) > 1):
-        print("" + str(len(data)) + " records found")
+    if (count > 1):
+        print("" + str(count) + " records found")
     else:
         print("1 record found")
+    if (config.get('limit') is not None or config.get('offset') is not None):
+        first = (config.get('offset') or 0) + 1
+        last = count if (config.get('limit') is None) else min(count, first - 1 + config.get('limit'))
+        if (first > last):
+            print("No records in this range")
+        else:
+            print("Showing records " + str(first) + " to " + str(last))
     print("")
 
-    for i in data:
+    # the rows are printed while they are read from the database
+    for i in database.fetch_all_from_build_status(filters, limit = config.get('limit'), offset = config.get('offset')):
         tmp_id = i['id']
         tmp_repository = i['repository']
         tmp_repository_type = i['repository_type']
@@ -151,25 +178,8 @@ if (config.get('list-results') is True):
             status.append('extra targets')
         if (len(i['test_locales']) > 0):
             status.append('locales')
-        error = 'OK'
-        if (i['run_git_update'] == 1 and i['result_git_update'] > 0):
-            error = 'ERROR'
-        if (i['run_configure'] == 1 and i['result_configure'] > 0):
-            error = 'ERROR'
-        if (i['run_make'] == 1 and i['result_make'] > 0):
-            error = 'ERROR'
-        if (i['run_install'] == 1 and i['result_install'] > 0):
-            error = 'ERROR'
-        if (i['run_tests'] == 1 and i['result_tests'] > 0):
-            error = 'ERROR'
-        if (i['result_portcheck'] is not None and i['result_portcheck'] > 0):
-            error = 'ERROR'
-        if (i['result_portcheck'] is None and i['is_buildfarm'] == 1 and i['run_configure'] == 1):
-            # buildfarm mode requires running regression tests
-            error = 'ERROR'
-        if (i['result_portcheck'] is None and i['run_tests'] == 1):
-            # running regression tests requires running portcheck
-            error = 'ERROR'
+        # the verdict is calculated when the build is written, see Database.build_result()
+        error = 'OK' if (i['result_overall'] == 0) else 'ERROR'
 
         if (tmp_repository_type is None):
             tmp_repository_type = '?'
@@ -180,6 +190,13 @@ if (config.get('list-results') is True):
 
         print("{0:5d}:  {1:s}  {2:5s}  {3:s} / {4:s}  ({5:s})  ({6:s} / {7:s})".format(tmp_id, tmp_start_time_local.replace('_', ' '), error, str(tmp_branch), str(tmp_revision), '/'.join(status), tmp_repository, tmp_repository_type))
     print("")
+
+    if (len(config.get('failing-test')) > 0):
+        # a test failing in only some of the builds is flaky
+        print("Test '" + config.get('failing-test') + "' failed in:")
+        for i in database.test_failure_statistics(config.get('failing-test')):
+            print("  {0:s} / {1:s}:  {2:d} of {3:d} builds since the first failure, last failure: {4:s}".format(str(i['repository']), str(i['branch']), i['failed'], i['builds'], str(i['last_failure']).replace('_', ' ')))
+        print("")
     sys.exit(0)
 
 
@@ -244,6 +261,62 @@ if (len(config.get('show-result')) > 0):
             print("Error: install dir is not available")
             print("")
             sys.exit(1)
+    if (len(config.get('show-log')) > 0):
+        manifest = False
+        if ('build_dir' in data):
+            manifest = LogManifest(str(data['build_dir']))
+            if (manifest.load() is False):
+                manifest = False
+        if (manifest is False):
+            print("")
+            print("Error: no manifest available (build dir removed, or build too old)")
+            print("")
+            sys.exit(1)
+        if (config.get('show-log') == 'list'):
+            print("{:<36}  {:<28}  {:<8}  {:>5}  {:>10}  {:s}".format("Step", "Buildfarm step", "Result", "Exit", "Time", "Logfiles"))
+            for step in manifest.ordered_steps():
+                print("{:<36}  {:<28}  {:<8}  {:>5}  {:>10}  {:d}".format(step['name'], str(step['buildfarm_step'] or ''), str(step['result']),
+                                                                      '' if step['exit_code'] is None else str(step['exit_code']),
+                                                                      '' if step['duration'] is None else str(step['duration']) + 's', len(step['logs'])))
+            sys.exit(0)
+        step = manifest.find_step(config.get('show-log'))
+        if (step is None):
+            print("")
+            print("Error: step '" + config.get('show-log') + "' not found (use --log list)")
+            print("")
+            sys.exit(1)
+        out = getattr(sys.stdout, 'buffer', sys.stdout)
+        for log in step['logs']:
+            print("=" * 15 + " " + log['file'] + " (" + str(log['size']) + " bytes) " + "=" * 15)
+            for section in log['sections']:
+                print("  offset " + str(section['offset']) + ": " + section['header'])
+            sys.stdout.flush()
+            logfile = os.path.join(str(data['build_dir']), log['file'])
+            compression = log.get('compression')
+            if (compression is None and os.path.isfile(logfile + '.gz')):
+                # manifest of an older build, the logfile was compressed later
+                logfile += '.gz'
+                compression = 'gzip'
+            elif (compression is None and os.path.isfile(logfile + '.zst')):
+                logfile += '.zst'
+                compression = 'zstd'
+            if (os.path.isfile(logfile) is False):
+                print("logfile not available")
+            elif (compression is None):
+                f = open(logfile, 'rb')
+                shutil.copyfileobj(f, out)
+                f.close()
+            elif (compression == 'gzip'):
+                f = gzip.open(logfile, 'rb')
+                shutil.copyfileobj(f, out)
+                f.close()
+            elif (config.find_in_path('zstd') is not False):
+                proc = Popen([config.find_in_path('zstd'), '-d', '-q', '-c', logfile], stdout=out)
+                proc.communicate()
+            else:
+                print("logfile not available")
+            out.flush()
+        sys.exit(0)
 
 
     # start regular output here
@@ -339,9 +412,28 @@ if (len(config.get('show-result')) > 0):
         print("{:>17}:  {:s}".format("Result tests", 'OK'))
     else:
         print("{:>17}:  {:s}".format("Result tests", str(data['result_tests'])))
+    if (data['failed_stage'] is not None):
+        print("{:>17}:  {:s}".format("Failed stage", str(data['failed_stage'])))
 
     print("")
 
+    if ('stage_results' in data):
+        # only list what did not succeed, the list of all stages is long
+        for stage_result in str(data['stage_results']).split(' '):
+            stage_name, stage_status = stage_result.rsplit(':', 1)
+            if (stage_status != 'ok'):
+                print("{:>17}:  {:s}".format("Stage " + stage_status, stage_name))
+        print("")
+
+    test_failures = database.fetch_test_failures(data['id'])
+    if (len(test_failures) > 0):
+        for failure in test_failures:
+            suite = failure['suite']
+            if (failure['locale'] is not None):
+                suite += ", " + failure['locale']
+            print("{:>17}:  {:s}  ({:s}, {:s})".format("Failed test", failure['test_name'], failure['kind'], suite))
+        print("")
+
     print("{:>17}:  {:s}".format("Time git update", str(data['time_git_update'])))
     print("{:>17}:  {:s}".format("Time configure", str(data['time_configure'])))
     print("{:>17}:  {:s}".format("Time make", str(data['time_make'])))
@@ -350,6 +442,12 @@ if (len(config.get('show-result')) > 0):
 
     print("")
 
+    if (data['ccache_hits'] is not None):
+        print("{:>17}:  {:s}".format("ccache hits", str(data['ccache_hits'])))
+        print("{:>17}:  {:s}".format("ccache misses", str(data['ccache_misses'])))
+        print("{:>17}:  {:s}".format("ccache size", "%.1f MB (%+.1f MB)" % (data['ccache_size'] / 1024.0, data['ccache_size_delta'] / 1024.0)))
+        print("")
+
     print("{:>17}:  {:s}".format("Extra configure", str(data['extra_configure'])))
     print("{:>17}:  {:s}".format("Extra make", str(data['extra_make'])))
     print("{:>17}:  {:s}".format("Extra install", str(data['extra_install'])))
@@ -476,7 +574,7 @@ if (config.get('buildfarm') is True):
         logging.error("Error: No repository url specified")
         sys.exit(1)
 
-    log_data = copy.deepcopy(all_log_data)
+    log_data = database.init_dataset()
     log_data['is_buildfarm'] = True
     log_data['repository'] = config.get('repository-url')
     log_data['start_time'] = int(time.time())
@@ -520,17 +618,12 @@ if (config.get('buildfarm') is True):
             jobs.append(job)
 
 
-    # figure out if this combination was built before
-    # this only checks if this combination is in the job table for the buildfarm
-    # it does not take into account if the job is already finished
-    for job in jobs:
-        if (database.buildfarm_job_exists(job['repository'], job['branch'], job['revision'], job['extra-configure'],
-                                          job['extra-make'], job['extra-install'], job['extra-tests'],
-                                          job['run-extra-targets'], job['test-locales'],
-                                          orca = job['orca']) is False):
-            # not found, add this job to the queue
-            logging.info("add to buildfarm queue: " + job['branch'] + " / " + job['revision'])
-            database.add_bildfarm_job(job)
+    # a job is only added if this combination is not in the job table for the buildfarm
+    # (pending or finished), the unique job key makes this safe against concurrent clients
+    with database.transaction():
+        for job in jobs:
+            if (database.add_bildfarm_job(job) is True):
+                logging.info("add to buildfarm queue: " + job['branch'] + " / " + job['revision'])
 
     # write log entry into database
     database.log_build(log_data)
@@ -558,7 +651,7 @@ if (config.get('buildfarm') is True):
         # note: from here on, every job can have a different repository
         job_number = 0
         for job in jobs:
-            log_data = copy.deepcopy(all_log_data)
+            log_data = database.init_dataset()
             job_number += 1
             stats_jobs_executed += 1
             logging.debug("run buildfarm job: " + str(job['id']) + " (" + str(job_number) + " out of " + str(len(jobs)) + ")")
@@ -607,6 +700,7 @@ if (config.get('buildfarm') is True):
             build_dir = repository.copy_repository(build_dir_name, log_data['branch'], log_data['revision'])
 
             build = Build(config, repository, build_dir)
+            log_data['build_dir'] = build_dir
 
             # test if ports for regression tests are available
             if (build.portcheck(log_data['repository_type'], log_data) is True):
@@ -636,8 +730,15 @@ if (config.get('buildfarm') is True):
                 stats_jobs_delayed += 1
                 database.update_buildfarm_job_delayed(job['id'], log_data['start_time'])
 
+            # cut oversized logfiles for the buildfarm server
+            build.truncate_buildfarm_logs()
+            # list of steps and logfiles, used by the buildfarm and by --show-result --log
+            build.write_manifest(log_data)
             # write log entry into database
             database.log_build(log_data)
+            # the logfiles are no longer written, and not needed uncompressed
+            # the buildfarm tarball uncompresses them again
+            build.compress_logs()
             # gather data for buildfarm website
             buildfarm = Buildfarm(config, repository, build_dir, database)
             buildfarm.send_results(log_data)
@@ -658,7 +759,7 @@ if (config.get('buildfarm') is True):
 #######################################################################
 # manual mode
 for branch in config.get('build-branch'):
-    log_data = copy.deepcopy(all_log_data)
+    log_data = database.init_dataset()
     log_data['repository'] = config.get('repository-url')
     log_data['branch'] = branch
     log_data['start_time'] = int(time.time())
@@ -744,8 +845,12 @@ for branch in config.get('build-branch'):
                         result_tests = build.run_tests(config.get('extra-tests'), log_data)
 
 
+    if (config.get('run-configure') is True):
+        build.write_manifest(log_data)
     # write log entry into database
     database.log_build(log_data)
+    if (config.get('run-configure') is True):
+        build.compress_logs()
 
 
 
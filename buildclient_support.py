@@ -29,6 +29,7 @@ from subprocess import Popen
 import socket
 from time import gmtime, localtime, strftime
 import glob
+import gzip
 
 
 
@@ -382,6 +383,7 @@ def parse_parameters():
     parser.add_argument('--archive-type', default = 'zip', dest = 'archive_type', choices = ['zip', 'tar'], help = 'choose archive type')
     parser.add_argument('--archive-name', default = '', dest = 'archive_name', help = 'choose archive file name (default: autogenerated)')
     parser.add_argument('-l', '--logfiles', default = '', dest = 'logfiles', help = 'directory with extra logfiles to include')
+    parser.add_argument('--zstd-bin', default = 'zstd', dest = 'zstd_bin', help = 'zstd executable for compressed logfiles (default: zstd)')
 
     # parse parameters
     args = parser.parse_args()
@@ -496,9 +498,10 @@ def dump_gp_version(dir):
 #
 # parameters:
 #  - temp directory
+#  - zstd executable
 # return:
 #  none
-def dump_build_logs(dir):
+def dump_build_logs(dir, zstd_bin):
     files = ['config.log', 'config.status', 'buildclient-config.txt', 'repository-info.txt',
              'src/test/regress/regression.diffs', 'src/test/regress/regression.out']
     files_log = glob.glob('log_*.txt')
@@ -511,6 +514,39 @@ def dump_build_logs(dir):
             # copy the file, with the original filename
             shutil.copyfile(filename, os.path.join(dir, os.path.basename(filename)))
 
+    # logfiles of finished builds might be compressed (--compress-logs)
+    for filename in glob.glob('log_*.txt.gz') + glob.glob('log_*.txt.zst'):
+        copy_compressed_logfile(filename, os.path.join(dir, os.path.basename(filename).rsplit('.', 1)[0]), zstd_bin)
+
+
+
+# copy_compressed_logfile()
+#
+# uncompress a logfile into the support package
+#
+# parameters:
+#  - compressed logfile
+#  - target filename
+#  - zstd executable (the one which compressed the logfile)
+# return:
+#  none
+def copy_compressed_logfile(filename, target, zstd_bin):
+    if (filename.endswith('.gz')):
+        r = gzip.open(filename, 'rb')
+        f = open(target, 'wb')
+        shutil.copyfileobj(r, f)
+        f.close()
+        r.close()
+    else:
+        f = open(target, 'wb')
+        proc = Popen([zstd_bin, '-d', '-q', '-c', filename], stdout=f, stderr=subprocess.PIPE)
+        out, err = proc.communicate()
+        f.close()
+        if (proc.returncode != 0):
+            # keep the compressed file instead
+            os.remove(target)
+            shutil.copyfile(filename, os.path.join(os.path.dirname(target), os.path.basename(filename)))
+
 
 
 # include_extra_logs()
@@ -651,7 +687,7 @@ dump_sysctl(sp_dir)
 dump_hostname(sp_dir)
 dump_gp_version(sp_dir)
 dump_platform(sp_dir)
-dump_build_logs(sp_dir)
+dump_build_logs(sp_dir, args.zstd_bin)
 if (os.path.isdir(args.logfiles)):
     include_extra_logs(args.logfiles, sp_dir)
 
@@ -4,8 +4,11 @@ import sys
 import logging
 import shlex
 import glob
+import gzip
+import shutil
 import subprocess
 from subprocess import Popen, PIPE
+from log_manifest import LogManifest
 
 
 class Buildfarm:
@@ -258,31 +261,12 @@ class Buildfarm:
             changed_since_success = self.repository.changed_files_with_commits(result_previous_success['revision'], result_this['revision'])
 
 
-        res = 0
-        stage = ''
         steps_completed = []
 
-        # see if and where it failed
-        if (result_this['run_git_update'] == 1 and result_this['result_git_update'] > 0):
-            res = result_this['result_git_update']
-            stage = 'SCM'
-        elif (result_this['result_portcheck'] is not None and result_this['result_portcheck'] > 0):
-            res = result_this['result_portcheck']
-            stage = 'Pre-run-port-check'
-        elif (result_this['run_configure'] == 1 and result_this['result_configure'] > 0):
-            res = result_this['result_configure']
-            stage = 'Configure'
-        elif (result_this['run_make'] == 1 and result_this['result_make'] > 0):
-            res = result_this['result_make']
-            stage = 'Make'
-        elif (result_this['run_install'] == 1 and result_this['result_install'] > 0):
-            res = result_this['result_install']
-            stage = 'Make-install'
-        elif (result_this['run_tests'] == 1 and result_this['result_tests'] > 0):
-            res = result_this['result_tests']
-            stage = 'Check'
-        else:
-            res = 0
+        # if and where it failed was calculated when the build was written, see Database.build_result()
+        res = result_this['result_overall']
+        stage = result_this['failed_stage']
+        if (stage is None):
             stage = 'OK'
 
         if (result_this['run_git_update'] == 1):
@@ -293,42 +277,18 @@ class Buildfarm:
             steps_completed.append("Make")
         if (result_this['run_install'] == 1):
             steps_completed.append("Install")
-        if (result_this['run_tests'] == 1):
-            steps_completed.append("Check")
 
         buildlogs = os.path.join(self.build_dir, '.buildfarm-logs')
-        if (os.path.isfile(os.path.join(buildlogs, 'make-contrib.log'))):
-            steps_completed.append("Contrib")
-        if (os.path.isfile(os.path.join(buildlogs, 'make-testmodules.log'))):
-            steps_completed.append("TestModules")
-        if (os.path.isfile(os.path.join(buildlogs, 'install-contrib.log'))):
-            steps_completed.append("ContribInstall")
-        if (os.path.isfile(os.path.join(buildlogs, 'install-testmodules.log'))):
-            steps_completed.append("TestModulesInstall")
-        if (os.path.isfile(os.path.join(buildlogs, 'check-pg_upgrade.log'))):
-            steps_completed.append("pg_upgradeCheck")
-        if (os.path.isfile(os.path.join(buildlogs, 'test-decoding-check.log'))):
-            steps_completed.append("test-decoding-check")
-        if (os.path.isfile(os.path.join(buildlogs, 'ecpg-check.log'))):
-            steps_completed.append("ECPG-Check")
-
-
-        # find all 'initdb-*.log' logfiles, extract the locale
-        initdb_list = glob.glob(buildlogs + os.sep + 'initdb-*.log')
-        for initdb in initdb_list:
-            initdb_file = os.path.basename(initdb)
-            initdb_locale = initdb_file[7:][:-4]
-            steps_completed.append("Initdb-" + initdb_locale)
-            if (os.path.isfile(os.path.join(buildlogs, 'install-check-' + initdb_locale + '.log'))):
-                steps_completed.append("InstallCheck-" + initdb_locale)
-            if (os.path.isfile(os.path.join(buildlogs, 'isolation-check-' + initdb_locale + '.log'))):
-                steps_completed.append("IsolationCheck-" + initdb_locale)
-            if (os.path.isfile(os.path.join(buildlogs, 'pl-install-check-' + initdb_locale + '.log'))):
-                steps_completed.append("PLCheck-" + initdb_locale)
-            if (os.path.isfile(os.path.join(buildlogs, 'contrib-install-check-' + initdb_locale + '.log'))):
-                steps_completed.append("ContribCheck-" + initdb_locale)
-            if (os.path.isfile(os.path.join(buildlogs, 'testmodules-install-check-' + initdb_locale + '.log'))):
-                steps_completed.append("TestModulesCheck-" + initdb_locale)
+        manifest = LogManifest(self.build_dir)
+        build_steps = self.database.fetch_build_steps(result_this['id'])
+        if (manifest.load() is True):
+            # the manifest lists every step, and its result
+            steps_completed.extend(manifest.completed_steps())
+        elif (len(build_steps) > 0):
+            # the steps stored with the build
+            steps_completed.extend([s['step'] for s in build_steps if (s['step'] is not None and s['result'] == 'ok')])
+        elif (result_this['run_tests'] == 1):
+            steps_completed.append("Check")
         steps_completed = " ".join(steps_completed)
         # 'steps_completed' => 'ContribCheck-C TestModulesCheck-C',
         print("steps completed: " + steps_completed)
@@ -398,17 +358,35 @@ class Buildfarm:
 
 
         # gather logfiles for buildfarm server
-        logfiles = list(filter(os.path.isfile, glob.glob(buildlogs + os.sep + "*.log")))
+        # the logfiles might already be compressed (--compress-logs), the server expects the plain '.log' files
+        logfiles = glob.glob(buildlogs + os.sep + "*.log") + glob.glob(buildlogs + os.sep + "*.log.gz") + glob.glob(buildlogs + os.sep + "*.log.zst")
+        logfiles = list(filter(os.path.isfile, logfiles))
         logfiles.sort(key = lambda f: os.path.getmtime(f))
+        # the log budget was applied before the manifest was written, see Build.truncate_buildfarm_logs()
+        tar_dir = buildlogs
+        if (len([x for x in logfiles if not x.endswith('.log')]) > 0):
+            tar_dir = os.path.join(buildlogs, 'runlogs.tmp')
+            shutil.rmtree(tar_dir, ignore_errors = True)
+            os.mkdir(tar_dir)
+            for logfile in logfiles:
+                target = os.path.join(tar_dir, os.path.basename(logfile))
+                if not (logfile.endswith('.log')):
+                    target = target.rsplit('.', 1)[0]
+                if (self.uncompress_logfile(logfile, target) is False):
+                    shutil.rmtree(tar_dir, ignore_errors = True)
+                    return False
         logfiles = [os.path.basename(x) for x in logfiles]
+        logfiles = [x if x.endswith('.log') else x.rsplit('.', 1)[0] for x in logfiles]
         #print("logfiles: " + str(logfiles))
         logging.debug(str(len(logfiles)) + " logfiles for buildfarm server")
         # quickly change directory, create the tarball, and come back
-        tar = self.config.get('tar-bin') + " -z -cf runlogs.tgz " + " ".join(logfiles)
+        tar = self.config.get('tar-bin') + " -z -cf " + os.path.join(buildlogs, 'runlogs.tgz') + " " + " ".join(logfiles)
         call = shlex.split(tar)
-        proc = Popen(call, stdout=PIPE, stderr=subprocess.STDOUT, cwd=buildlogs)
+        proc = Popen(call, stdout=PIPE, stderr=subprocess.STDOUT, cwd=tar_dir)
         out, err = proc.communicate()
         exitcode = proc.returncode
+        if (tar_dir != buildlogs):
+            shutil.rmtree(tar_dir, ignore_errors = True)
         if (exitcode > 0):
             logging.error("unable to create tar archive for buildfarm server")
             logging.error("error: " + str(err))
@@ -447,6 +425,45 @@ class Buildfarm:
 
 
 
+    # uncompress_logfile()
+    #
+    # write the uncompressed content of a logfile into a new file
+    # plain logfiles are copied, the PostgreSQL buildfarm depends on the mtime
+    #
+    # parameter:
+    #  - self
+    #  - logfile name (.log, .log.gz or .log.zst)
+    #  - target filename
+    # return:
+    #  - True/False
+    def uncompress_logfile(self, logfile, target):
+        try:
+            if (logfile.endswith('.gz')):
+                r = gzip.open(logfile, 'rb')
+                f = open(target, 'wb')
+                shutil.copyfileobj(r, f, 1024 * 1024)
+                f.close()
+                r.close()
+            elif (logfile.endswith('.zst')):
+                f = open(target, 'wb')
+                proc = Popen([self.config.get('zstd-bin'), '-d', '-q', '-c', logfile], stdout=f, stderr=PIPE)
+                out, err = proc.communicate()
+                f.close()
+                if (proc.returncode != 0):
+                    logging.error("failed to uncompress logfile: " + logfile)
+                    logging.error("error: " + err.decode().strip())
+                    return False
+            else:
+                shutil.copyfile(logfile, target)
+            shutil.copystat(logfile, target)
+        except (OSError, IOError) as e:
+            logging.error("failed to uncompress logfile: " + logfile)
+            logging.error("error: " + str(e))
+            return False
+
+        return True
+
+
 
     def send_results_greenplum(self, log_data):
         logging.error("Buildfarm mode for Greenplum not yet implemented")
@@ -0,0 +1,130 @@
+import re
+import os
+import logging
+import multiprocessing
+from subprocess import Popen, PIPE
+
+
+# compiler launchers (like distcc) which send compile jobs to other machines
+DISTRIBUTED_LAUNCHERS = ['distcc', 'icecc']
+
+
+# handles the compiler pair and an optional compiler launcher
+# one instance per Build
+
+class CompilerLauncher:
+
+    def __init__(self, config):
+        self.config = config
+        # number of remote compile slots, only figured out once
+        self.slots = None
+
+
+
+    # populate_env()
+    #
+    # set the compiler variables in a shell environment
+    #
+    # parameter:
+    #  - self
+    #  - environment (modified in place)
+    # return:
+    #  none
+    def populate_env(self, env):
+        ccache_bin = self.config.get('ccache-bin')
+        launcher = self.config.get('compiler-launcher')
+        launcher_bin = self.config.get('compiler-launcher-bin')
+
+        cc = self.config.get('cc')
+        cxx = self.config.get('cxx')
+        if (len(ccache_bin) == 0 and len(launcher) == 0):
+            # no launcher, only replace the compilers if explicitly requested
+            if (len(cc) > 0):
+                env['CC'] = cc
+            if (len(cxx) > 0):
+                env['CXX'] = cxx
+            return
+
+        # the compilers from the environment, else assume it's 'gcc' and 'g++'
+        # was told that clang on Mac links to these names as well
+        if (len(cc) == 0):
+            cc = env.get('CC', 'gcc')
+        if (len(cxx) == 0):
+            cxx = env.get('CXX', 'g++')
+
+        if (len(ccache_bin) > 0):
+            # ccache runs first, and only hands cache misses to the next launcher
+            env['CC'] = ccache_bin + ' ' + cc
+            env['CXX'] = ccache_bin + ' ' + cxx
+            if (len(launcher) > 0):
+                env['CCACHE_PREFIX'] = launcher_bin
+        else:
+            env['CC'] = launcher_bin + ' ' + cc
+            env['CXX'] = launcher_bin + ' ' + cxx
+
+        if (launcher == 'distcc' and len(self.config.get('distcc-hosts')) > 0):
+            env['DISTCC_HOSTS'] = self.config.get('distcc-hosts')
+
+
+
+    # make_parallel()
+    #
+    # return the number of parallel "make" jobs
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - number of jobs
+    def make_parallel(self):
+        make_parallel = self.config.get('make-parallel')
+        if (make_parallel != 'auto'):
+            return make_parallel
+
+        if (self.config.get('compiler-launcher') in DISTRIBUTED_LAUNCHERS):
+            jobs = self.remote_slots()
+        else:
+            jobs = multiprocessing.cpu_count()
+        logging.debug("make-parallel: " + str(jobs))
+
+        return jobs
+
+
+
+    # remote_slots()
+    #
+    # figure out how many compile jobs the distributed launcher can handle
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - number of slots
+    def remote_slots(self):
+        if (self.slots is not None):
+            return self.slots
+
+        if (self.config.get('compiler-slots') > 0):
+            self.slots = self.config.get('compiler-slots')
+            return self.slots
+
+        slots = 0
+        if (self.config.get('compiler-launcher') == 'distcc'):
+            # "distcc -j" sums up the slots of all hosts in DISTCC_HOSTS
+            env = os.environ.copy()
+            self.populate_env(env)
+            try:
+                proc = Popen([self.config.get('compiler-launcher-bin'), '-j'], stdout=PIPE, stderr=PIPE, env=env)
+                out, err = proc.communicate()
+                if (proc.returncode == 0 and re.match(r'^[0-9]+$', out.decode().strip())):
+                    slots = int(out.decode().strip())
+                else:
+                    logging.debug("distcc -j failed: " + err.decode().strip())
+            except OSError as e:
+                logging.debug("distcc -j failed: " + str(e))
+
+        if (slots < 1):
+            # icecc has no way to ask the scheduler, fall back to the local CPUs
+            slots = multiprocessing.cpu_count()
+            logging.debug("no remote slot information, using number of CPUs")
+
+        self.slots = slots
+        return self.slots
@@ -9,6 +9,7 @@ import logging
 import hashlib
 import string
 import atexit
+import time
 from lockfile import LockFile, LockTimeout
 from subprocess import Popen
 from distutils.version import LooseVersion
@@ -105,9 +106,20 @@ class Config:
         parser.add_argument('--cache-dir', default = '', dest = 'cache_dir', help = 'path to cache directory for git clone')
         parser.add_argument('--build-dir', default = '', dest = 'build_dir', help = 'path to build directory for build')
         parser.add_argument('--install-dir', default = '', dest = 'install_dir', help = 'path to install directory for tests')
+        parser.add_argument('--artifact-cache-dir', default = '', dest = 'artifact_cache_dir', help = 'path to cache directory for initdb templates, default: none')
+        parser.add_argument('--scratch-dir', default = '', dest = 'scratch_dir', help = 'path to RAM-backed directory (tmpfs) for test databases, default: none')
+        parser.add_argument('--scratch-min-free', default = '', dest = 'scratch_min_free', help = 'free memory required to use the scratch dir (like: 2G), default: 1G')
         parser.add_argument('--git-bin', default = '', dest = 'git_bin', help = 'git binary, default: search in $PATH')
         parser.add_argument('--git-depth', default = '', dest = 'git_depth', help = 'depth for a shallow git clode, default: everything')
         parser.add_argument('--ccache-bin', default = '', dest = 'ccache_bin', help = 'compiler cache binary, default: none')
+        parser.add_argument('--ccache-dir', default = '', dest = 'ccache_dir', help = 'compiler cache directory, default: ccache default')
+        parser.add_argument('--ccache-per-branch', default = False, dest = 'ccache_per_branch', action = 'store_true', help = 'use a separate compiler cache directory for every repository and branch')
+        parser.add_argument('--ccache-max-size', default = '', dest = 'ccache_max_size', help = 'maximum size of the compiler cache (like: 5G), default: ccache default')
+        parser.add_argument('--cc', default = '', dest = 'cc', help = 'C compiler, default: $CC or gcc')
+        parser.add_argument('--cxx', default = '', dest = 'cxx', help = 'C++ compiler, default: $CXX or g++')
+        parser.add_argument('--compiler-launcher', default = '', dest = 'compiler_launcher', help = 'compiler launcher (ccache, sccache, distcc, icecc), default: none')
+        parser.add_argument('--distcc-hosts', default = '', dest = 'distcc_hosts', help = 'distcc host list (like: "127.0.0.1/4 buildhost/8"), default: $DISTCC_HOSTS')
+        parser.add_argument('--compiler-slots', default = '', dest = 'compiler_slots', help = 'number of remote compile slots, default: ask distcc or use number of CPUs')
         # store_true: store "True" if specified, otherwise store "False"
         # store_false: store "False" if specified, otherwise store "True"
         parser.add_argument('--no-clean-on-failure', default = True, dest = 'clean_on_failure', action = 'store_false', help = 'do not clean up the build dir if there was an error')
@@ -126,8 +138,23 @@ class Config:
         parser.add_argument('--extra-install', default = '', dest = 'extra_install', help = 'extra make install options')
         parser.add_argument('--extra-tests', default = '', dest = 'extra_tests', help = 'extra make installcheck-good options')
         parser.add_argument('--patch', dest = 'patch', action = 'append', help = 'additional patch(es) to apply')
-        parser.add_argument('--make-parallel', default = '', dest = 'make_parallel', help = 'number of parallel make jobs (default: 1)')
+        parser.add_argument('--make-parallel', default = '', dest = 'make_parallel', help = 'number of parallel make jobs, or "auto" (default: 1, "auto" with distcc or icecc)')
+        parser.add_argument('--test-parallel', default = '', dest = 'test_parallel', help = 'number of test stages running in parallel, or "auto" (default: "auto", one per test locale)')
+        parser.add_argument('--test-fast', default = False, dest = 'test_fast', action = 'store_true', help = 'start the test cluster only once per locale for all installcheck suites')
+        parser.add_argument('--compress-logs', default = '', dest = 'compress_logs', help = 'compress the logfiles of a finished build (gzip, zstd), default: none')
+        parser.add_argument('--log-step-budget', default = '', dest = 'log_step_budget', help = 'maximum size of one logfile (like: 64M), larger logs keep the beginning and the end, default: 0 (unlimited)')
+        parser.add_argument('--log-job-budget', default = '', dest = 'log_job_budget', help = 'maximum size of all logfiles of a build (like: 512M), default: 0 (unlimited)')
+        parser.add_argument('--continue-on-failure', default = False, dest = 'continue_on_failure', action = 'store_true', help = 'keep running test stages which do not depend on a failed stage')
         parser.add_argument('--list-results', default = False, dest = 'list_results', action = 'store_true', help = 'list all locally stored results of previous runs')
+        parser.add_argument('--failing-test', default = '', dest = 'failing_test', help = 'list only results where this test failed, and how often it failed (requires --list-results)')
+        parser.add_argument('--filter-branch', default = '', dest = 'filter_branch', help = 'list only results of this branch (requires --list-results)')
+        parser.add_argument('--filter-repository', default = '', dest = 'filter_repository', help = 'list only results of this repository (requires --list-results)')
+        parser.add_argument('--filter-status', default = '', dest = 'filter_status', help = 'list only results with this status: ok, error (requires --list-results)')
+        parser.add_argument('--filter-mode', default = '', dest = 'filter_mode', help = 'list only results of this mode: buildfarm, interactive (requires --list-results)')
+        parser.add_argument('--since', default = '', dest = 'since', help = 'list only results started at or after this time, like: 2020-01-31 or "2020-01-31 12:00" (requires --list-results)')
+        parser.add_argument('--until', default = '', dest = 'until', help = 'list only results started before the end of this day, or before this time (requires --list-results)')
+        parser.add_argument('--limit', default = '', dest = 'limit', help = 'list at most this many results (requires --list-results)')
+        parser.add_argument('--offset', default = '', dest = 'offset', help = 'skip this many results (requires --list-results)')
         parser.add_argument('--show-result', default = '', dest = 'show_result', help = 'show results of a specific build (use "last" for latest build)')
         parser.add_argument('--show-id', default = False, dest = 'show_id', action = 'store_true', help = 'list only the ID for the specified build (requires --show-result)')
         parser.add_argument('--show-repository', default = False, dest = 'show_repository', action = 'store_true', help = 'list only the repository for the specified build (requires --show-result)')
@@ -135,6 +162,7 @@ class Config:
         parser.add_argument('--show-revision', default = False, dest = 'show_revision', action = 'store_true', help = 'list only the revision for the specified build (requires --show-result)')
         parser.add_argument('--show-build-dir', default = False, dest = 'show_build_dir', action = 'store_true', help = 'list only the build dir for the specified build (requires --show-result)')
         parser.add_argument('--show-install-dir', default = False, dest = 'show_install_dir', action = 'store_true', help = 'list only the install dir for the specified build (requires --show-result)')
+        parser.add_argument('--log', default = '', dest = 'show_log', help = 'show the logfiles of one step of the specified build (use "list" for all steps, requires --show-result)')
         parser.add_argument('--list-jobs', default = False, dest = 'list_jobs', action = 'store_true', help = 'list all pending buildfarm jobs, then exit')
         parser.add_argument('--list-all-jobs', default = False, dest = 'list_all_jobs', action = 'store_true', help = 'list all pending and finished buildfarm jobs, then exit')
         parser.add_argument('--requeue-job', default = '', dest = 'requeue_job', help = 'requeue a buildfarm job')
@@ -147,6 +175,9 @@ class Config:
         parser.add_argument('--support-file', default = '', dest = 'support_file', help = 'optional filename for support file, must end in .zip or .tar')
         parser.add_argument('--support-archive-type', default = '', dest = 'support_archive_type', help = 'type of support archive: zip or tar')
         parser.add_argument('--lockfile', default = '', dest = 'lockfile', help = 'optional lockfile name (required for buildfarm mode)')
+        parser.add_argument('--database', default = '', dest = 'database_path', help = 'database file, default: $HOME/.buildclient')
+        parser.add_argument('--compact-history', default = False, dest = 'compact_history', action = 'store_true', help = 'roll up old builds into daily statistics per branch, delete them, then exit')
+        parser.add_argument('--keep-builds', default = '', dest = 'keep_builds', help = 'number of builds per branch which are kept by --compact-history, default: 100')
         parser.add_argument('--cleanup-builds', default = False, dest = 'cleanup_builds', action = 'store_true', help = 'cleanup all previous build and install directories')
         parser.add_argument('--cleanup-patches', default = False, dest = 'cleanup_patches', action = 'store_true', help = 'cleanup all previous patches in cache directory')
         parser.add_argument('--cleanup-support-files', default = False, dest = 'cleanup_support_files', action = 'store_true', help = 'cleanup all previous support files in build directory')
@@ -235,6 +266,10 @@ class Config:
         self.pre_set_configfile_value('build', 'dirs', 'cache-dir')
         self.pre_set_configfile_value('build', 'dirs', 'build-dir')
         self.pre_set_configfile_value('build', 'dirs', 'install-dir')
+        self.pre_set_configfile_value('build', 'dirs', 'artifact-cache-dir')
+        self.pre_set_configfile_value('build', 'dirs', 'scratch-dir')
+        self.pre_set_configfile_value('build', 'options', 'scratch-min-free')
+        self.pre_set_configfile_value('build', 'dirs', 'ccache-dir')
 
         self.pre_set_configfile_value('build', 'patch', None)
 
@@ -246,7 +281,20 @@ class Config:
         self.pre_set_configfile_value('build', 'options', 'extra-install')
         self.pre_set_configfile_value('build', 'options', 'extra-tests')
         self.pre_set_configfile_value('build', 'options', 'ccache-bin')
+        self.pre_set_configfile_value('build', 'options', 'ccache-per-branch')
+        self.pre_set_configfile_value('build', 'options', 'ccache-max-size')
         self.pre_set_configfile_value('build', 'options', 'make-parallel')
+        self.pre_set_configfile_value('build', 'options', 'test-parallel')
+        self.pre_set_configfile_value('build', 'options', 'test-fast')
+        self.pre_set_configfile_value('build', 'options', 'continue-on-failure')
+        self.pre_set_configfile_value('build', 'options', 'compress-logs')
+        self.pre_set_configfile_value('build', 'options', 'log-step-budget')
+        self.pre_set_configfile_value('build', 'options', 'log-job-budget')
+        self.pre_set_configfile_value('build', 'compiler', 'cc')
+        self.pre_set_configfile_value('build', 'compiler', 'cxx')
+        self.pre_set_configfile_value('build', 'compiler', 'launcher')
+        self.pre_set_configfile_value('build', 'compiler', 'distcc-hosts')
+        self.pre_set_configfile_value('build', 'compiler', 'slots')
         self.pre_set_configfile_value('build', 'work', 'branch')
         self.pre_set_configfile_value('build', 'work', 'revision')
 
@@ -262,6 +310,10 @@ class Config:
 
         self.pre_set_configfile_value('locking', 'lockfile', None)
 
+        self.pre_set_configfile_value('database', 'path', None)
+        self.pre_set_configfile_value('database', 'pragmas', None)
+        self.pre_set_configfile_value('database', 'keep-builds', None)
+
         self.pre_set_configfile_value('test', 'locales', None)
         self.pre_set_configfile_value('test', 'extra-targets', None)
 
@@ -400,6 +452,23 @@ class Config:
                 print("Error: --list-all-jobs can't be combined with another run option")
                 sys.exit(1)
 
+        if (self.arguments.compact_history is True):
+            if (len(self.arguments.show_result) > 0 or
+                self.arguments.list_results is True or
+                self.arguments.list_jobs is True or
+                self.arguments.list_all_jobs is True or
+                len(self.arguments.requeue_job) > 0 or
+                self.arguments.run_all is True or
+                self.arguments.run_update is True or
+                self.arguments.run_configure is True or
+                self.arguments.run_make is True or
+                self.arguments.run_install is True or
+                self.arguments.run_tests is True):
+                self.print_help()
+                print("")
+                print("Error: --compact-history can't be combined with another run option")
+                sys.exit(1)
+
         if (len(self.arguments.requeue_job) > 0):
             if (len(self.arguments.show_result) > 0 or
                 self.arguments.list_results is True or
@@ -431,6 +500,14 @@ class Config:
                 print("")
                 print("Error: --list-results can't be combined with another run option")
                 sys.exit(1)
+        else:
+            for option in ['failing_test', 'filter_branch', 'filter_repository', 'filter_status', 'filter_mode',
+                           'since', 'until', 'limit', 'offset']:
+                if (len(getattr(self.arguments, option)) > 0):
+                    self.print_help()
+                    print("")
+                    print("Error: --" + option.replace('_', '-') + " requires --list-results")
+                    sys.exit(1)
 
         if (len(self.arguments.show_result) > 0):
             if (self.arguments.list_results is True or
@@ -462,6 +539,8 @@ class Config:
                 number_show_args += 1
             if (self.arguments.show_install_dir is True):
                 number_show_args += 1
+            if (len(self.arguments.show_log) > 0):
+                number_show_args += 1
             if (number_show_args > 1):
                 print("")
                 print("Error: --show-result only allows one extra argument")
@@ -472,7 +551,8 @@ class Config:
                 self.arguments.show_branch is True or
                 self.arguments.show_revision is True or
                 self.arguments.show_build_dir is True or
-                self.arguments.show_install_dir is True):
+                self.arguments.show_install_dir is True or
+                len(self.arguments.show_log) > 0):
                 print("")
                 print("Error: extra argument specified, but --show-result is missing")
                 sys.exit(1)
@@ -498,6 +578,7 @@ class Config:
             ret['list-results'] = False
             ret['list-jobs'] = False
             ret['list-all-jobs'] = False
+            ret['compact-history'] = False
             ret['requeue-job'] = ''
             ret['run-update'] = True
             ret['run-configure'] = True
@@ -510,11 +591,14 @@ class Config:
             ret['show-revision'] = False
             ret['show-build-dir'] = False
             ret['show-install-dir'] = False
+            ret['show-log'] = ''
+            ret['failing-test'] = ''
         else:
             ret['show-result'] = self.arguments.show_result if (len(self.arguments.show_result) > 0) else ''
             ret['list-results'] = True if (self.arguments.list_results is True) else False
             ret['list-jobs'] = True if (self.arguments.list_jobs is True) else False
             ret['list-all-jobs'] = True if (self.arguments.list_all_jobs is True) else False
+            ret['compact-history'] = True if (self.arguments.compact_history is True) else False
             ret['requeue-job'] = self.arguments.requeue_job if (len(self.arguments.requeue_job) > 0) else ''
             ret['run-update'] = True if (self.arguments.run_update is True) else False
             ret['run-configure'] = True if (self.arguments.run_configure is True) else False
@@ -527,6 +611,47 @@ class Config:
             ret['show-revision'] = True if (self.arguments.show_revision is True) else False
             ret['show-build-dir'] = True if (self.arguments.show_build_dir is True) else False
             ret['show-install-dir'] = True if (self.arguments.show_install_dir is True) else False
+            ret['show-log'] = self.arguments.show_log
+            ret['failing-test'] = self.arguments.failing_test
+
+        # filters for --list-results, all of them are applied in the database
+        ret['filter-branch'] = self.arguments.filter_branch
+        ret['filter-repository'] = self.arguments.filter_repository
+        ret['filter-status'] = self.arguments.filter_status.lower()
+        if (ret['filter-status'] not in ['', 'ok', 'error']):
+            self.print_help()
+            print("")
+            print("Error: invalid --filter-status (must be one of: ok, error)")
+            print("Argument: " + self.arguments.filter_status)
+            sys.exit(1)
+        ret['filter-mode'] = self.arguments.filter_mode.lower()
+        if (ret['filter-mode'] not in ['', 'buildfarm', 'interactive']):
+            self.print_help()
+            print("")
+            print("Error: invalid --filter-mode (must be one of: buildfarm, interactive)")
+            print("Argument: " + self.arguments.filter_mode)
+            sys.exit(1)
+        for option in ['since', 'until']:
+            ret[option] = None
+            if (len(getattr(self.arguments, option)) > 0):
+                # --since is the start of the day, --until the end of the day
+                ret[option] = self.timestamp_from_date(getattr(self.arguments, option), option == 'until')
+                if (ret[option] is None):
+                    self.print_help()
+                    print("")
+                    print("Error: invalid --" + option + " (must be like: 2020-01-31 or 2020-01-31 12:00)")
+                    print("Argument: " + getattr(self.arguments, option))
+                    sys.exit(1)
+        for option in ['limit', 'offset']:
+            ret[option] = None
+            if (len(getattr(self.arguments, option)) > 0):
+                if (getattr(self.arguments, option).isdigit() is False):
+                    self.print_help()
+                    print("")
+                    print("Error: --" + option + " must be a number")
+                    print("Argument: " + getattr(self.arguments, option))
+                    sys.exit(1)
+                ret[option] = int(getattr(self.arguments, option))
 
         # do not require --run-update
         #if (ret['run-configure'] is True and ret['run-update'] is False):
@@ -644,6 +769,67 @@ class Config:
             sys.exit(1)
 
 
+        if (self.arguments.artifact_cache_dir and os.path.isdir(self.arguments.artifact_cache_dir) is False):
+            self.print_help()
+            print("")
+            print("Error: --artifact-cache-dir is not a directory")
+            print("Argument: " + self.arguments.artifact_cache_dir)
+            sys.exit(1)
+        if (self.configfile is not False):
+            if (len(self.configfile['build']['dirs']['artifact-cache-dir']) > 0 and os.path.isdir(self.replace_home_env(self.configfile['build']['dirs']['artifact-cache-dir'])) is False):
+                self.print_help()
+                print("")
+                print("Error: artifact-cache-dir is not a directory")
+                print("Argument: " + self.configfile['build']['dirs']['artifact-cache-dir'])
+                sys.exit(1)
+        if (self.arguments.artifact_cache_dir):
+            ret['artifact-cache-dir'] = self.arguments.artifact_cache_dir
+        elif (self.configfile is not False and self.configfile['build']['dirs']['artifact-cache-dir']):
+            ret['artifact-cache-dir'] = self.replace_home_env(self.configfile['build']['dirs']['artifact-cache-dir'])
+        else:
+            # the artifact cache is optional
+            ret['artifact-cache-dir'] = ''
+
+
+        if (self.arguments.scratch_dir and os.path.isdir(self.arguments.scratch_dir) is False):
+            self.print_help()
+            print("")
+            print("Error: --scratch-dir is not a directory")
+            print("Argument: " + self.arguments.scratch_dir)
+            sys.exit(1)
+        if (self.configfile is not False):
+            if (len(self.configfile['build']['dirs']['scratch-dir']) > 0 and os.path.isdir(self.replace_home_env(self.configfile['build']['dirs']['scratch-dir'])) is False):
+                self.print_help()
+                print("")
+                print("Error: scratch-dir is not a directory")
+                print("Argument: " + self.configfile['build']['dirs']['scratch-dir'])
+                sys.exit(1)
+        if (self.arguments.scratch_dir):
+            ret['scratch-dir'] = self.arguments.scratch_dir
+        elif (self.configfile is not False and self.configfile['build']['dirs']['scratch-dir']):
+            ret['scratch-dir'] = self.replace_home_env(self.configfile['build']['dirs']['scratch-dir'])
+        else:
+            # the scratch dir is optional, test databases are in the install dir
+            ret['scratch-dir'] = ''
+
+
+        if (self.arguments.scratch_min_free == ''):
+            if (self.configfile is not False and len(str(self.configfile['build']['options']['scratch-min-free'])) > 0):
+                scratch_min_free = str(self.configfile['build']['options']['scratch-min-free'])
+            else:
+                scratch_min_free = '1G'
+        else:
+            scratch_min_free = self.arguments.scratch_min_free
+        # store the value in bytes
+        ret['scratch-min-free'] = self.size_in_bytes(scratch_min_free)
+        if (ret['scratch-min-free'] is None):
+            self.print_help()
+            print("")
+            print("Error: invalid scratch-min-free")
+            print("Argument: " + scratch_min_free)
+            sys.exit(1)
+
+
         stat_cache = os.stat(ret['cache-dir'])
         stat_build = os.stat(ret['build-dir'])
         if (stat_cache.st_dev != stat_build.st_dev):
@@ -839,6 +1025,11 @@ class Config:
                 print("")
                 print("Error: --requeue-job cannot be combined with --buildfarm")
                 sys.exit(1)
+            if (ret['compact-history'] is True):
+                self.print_help()
+                print("")
+                print("Error: --compact-history cannot be combined with --buildfarm")
+                sys.exit(1)
             if (ret['run-update'] is False):
                 self.print_help()
                 print("")
@@ -1007,6 +1198,23 @@ class Config:
             ret['extra-tests'] = self.arguments.extra_tests
 
 
+        if (self.arguments.compiler_launcher == ''):
+            if (self.configfile is not False and len(self.configfile['build']['compiler']['launcher']) > 0):
+                ret['compiler-launcher'] = self.configfile['build']['compiler']['launcher']
+            else:
+                ret['compiler-launcher'] = ''
+        else:
+            ret['compiler-launcher'] = self.arguments.compiler_launcher
+        if (ret['compiler-launcher'] not in ['', 'none', 'ccache', 'sccache', 'distcc', 'icecc']):
+            self.print_help()
+            print("")
+            print("Error: unknown compiler-launcher")
+            print("Argument: " + ret['compiler-launcher'])
+            sys.exit(1)
+        if (ret['compiler-launcher'] == 'none'):
+            ret['compiler-launcher'] = ''
+
+
         if (self.arguments.ccache_bin == ''):
             if (self.configfile is not False and len(self.configfile['build']['options']['ccache-bin']) > 0):
                 ret['ccache-bin'] = self.configfile['build']['options']['ccache-bin']
@@ -1014,6 +1222,11 @@ class Config:
                 ret['ccache-bin'] = ''
         else:
             ret['ccache-bin'] = self.arguments.ccache_bin
+        if (ret['compiler-launcher'] == 'ccache'):
+            # ccache is handled by --ccache-bin, the launcher setting is just a shortcut
+            if (len(ret['ccache-bin']) == 0):
+                ret['ccache-bin'] = 'ccache'
+            ret['compiler-launcher'] = ''
 
         if (len(ret['ccache-bin']) > 0):
             if (self.binary_is_executable(ret['ccache-bin']) is False):
@@ -1053,29 +1266,250 @@ class Config:
             logging.debug("ccache: " + ret['ccache-bin'])
 
 
+        if (len(ret['compiler-launcher']) > 0):
+            if (ret['compiler-launcher'] == 'sccache' and len(ret['ccache-bin']) > 0):
+                self.print_help()
+                print("")
+                print("Error: sccache can't be combined with --ccache-bin")
+                sys.exit(1)
+            launcher_bin = self.find_in_path(ret['compiler-launcher'])
+            if (launcher_bin is False):
+                self.print_help()
+                print("")
+                print("Error: no compiler-launcher executable found")
+                print("Argument: " + ret['compiler-launcher'])
+                sys.exit(1)
+            ret['compiler-launcher-bin'] = launcher_bin
+            logging.debug("compiler launcher: " + ret['compiler-launcher-bin'])
+        else:
+            ret['compiler-launcher-bin'] = ''
+
+
+        if (self.arguments.cc == ''):
+            if (self.configfile is not False and len(self.configfile['build']['compiler']['cc']) > 0):
+                ret['cc'] = self.configfile['build']['compiler']['cc']
+            else:
+                ret['cc'] = ''
+        else:
+            ret['cc'] = self.arguments.cc
+
+        if (self.arguments.cxx == ''):
+            if (self.configfile is not False and len(self.configfile['build']['compiler']['cxx']) > 0):
+                ret['cxx'] = self.configfile['build']['compiler']['cxx']
+            else:
+                ret['cxx'] = ''
+        else:
+            ret['cxx'] = self.arguments.cxx
+
+
+        if (self.arguments.distcc_hosts == ''):
+            if (self.configfile is not False and len(self.configfile['build']['compiler']['distcc-hosts']) > 0):
+                ret['distcc-hosts'] = self.configfile['build']['compiler']['distcc-hosts']
+            else:
+                ret['distcc-hosts'] = ''
+        else:
+            ret['distcc-hosts'] = self.arguments.distcc_hosts
+        if (len(ret['distcc-hosts']) > 0 and ret['compiler-launcher'] != 'distcc'):
+            self.print_help()
+            print("")
+            print("Error: --distcc-hosts requires distcc as compiler-launcher")
+            sys.exit(1)
+
+
+        if (self.arguments.compiler_slots == ''):
+            if (self.configfile is not False and len(str(self.configfile['build']['compiler']['slots'])) > 0):
+                ret['compiler-slots'] = self.configfile['build']['compiler']['slots']
+            else:
+                # ask the launcher
+                ret['compiler-slots'] = 0
+        else:
+            ret['compiler-slots'] = self.arguments.compiler_slots
+        try:
+            t = int(ret['compiler-slots'])
+        except ValueError:
+            self.print_help()
+            print("")
+            print("Error: compiler-slots is not an integer")
+            sys.exit(1)
+        if (t < 0):
+            self.print_help()
+            print("")
+            print("Error: compiler-slots must be a positive integer")
+            sys.exit(1)
+        ret['compiler-slots'] = t
+
+
+        if (self.arguments.ccache_dir and os.path.isdir(self.arguments.ccache_dir) is False):
+            self.print_help()
+            print("")
+            print("Error: --ccache-dir is not a directory")
+            print("Argument: " + self.arguments.ccache_dir)
+            sys.exit(1)
+        if (self.configfile is not False):
+            if (len(self.configfile['build']['dirs']['ccache-dir']) > 0 and os.path.isdir(self.replace_home_env(self.configfile['build']['dirs']['ccache-dir'])) is False):
+                self.print_help()
+                print("")
+                print("Error: ccache-dir is not a directory")
+                print("Argument: " + self.configfile['build']['dirs']['ccache-dir'])
+                sys.exit(1)
+        if (self.arguments.ccache_dir):
+            ret['ccache-dir'] = self.arguments.ccache_dir
+        elif (self.configfile is not False and self.configfile['build']['dirs']['ccache-dir']):
+            ret['ccache-dir'] = self.replace_home_env(self.configfile['build']['dirs']['ccache-dir'])
+        else:
+            # let ccache use its own default
+            ret['ccache-dir'] = ''
+
+
+        if (self.arguments.ccache_per_branch is True):
+            # --ccache-per-branch specified on commandline, honor the flag
+            ret['ccache-per-branch'] = True
+        elif (self.arguments.ccache_per_branch is False):
+            # see if the configuration overrides this flag
+            if (self.configfile is not False and self.configfile['build']['options']['ccache-per-branch'] == 1):
+                ret['ccache-per-branch'] = True
+            else:
+                ret['ccache-per-branch'] = False
+        if (ret['ccache-per-branch'] is True and len(ret['ccache-dir']) == 0):
+            self.print_help()
+            print("")
+            print("Error: --ccache-per-branch requires --ccache-dir")
+            sys.exit(1)
+
+
+        if (self.arguments.ccache_max_size == ''):
+            if (self.configfile is not False and len(str(self.configfile['build']['options']['ccache-max-size'])) > 0):
+                ret['ccache-max-size'] = str(self.configfile['build']['options']['ccache-max-size'])
+            else:
+                ret['ccache-max-size'] = ''
+        else:
+            ret['ccache-max-size'] = self.arguments.ccache_max_size
+        if (len(ret['ccache-max-size']) > 0 and not re.match(r'^[0-9]+(\.[0-9]+)?[kMGT]?i?$', ret['ccache-max-size'])):
+            self.print_help()
+            print("")
+            print("Error: invalid ccache-max-size")
+            print("Argument: " + ret['ccache-max-size'])
+            sys.exit(1)
+
+
         if (self.arguments.make_parallel == ''):
             # read value from configfile
             if (self.configfile is not False and len(str(self.configfile['build']['options']['make-parallel'])) > 0):
                 ret['make-parallel'] = self.configfile['build']['options']['make-parallel']
+            elif (ret['compiler-launcher'] in ['distcc', 'icecc']):
+                # scale with the number of remote compile slots
+                ret['make-parallel'] = 'auto'
             else:
                 # default value (just one job)
                 ret['make-parallel'] = 1
         else:
             # use input from commandline
             ret['make-parallel'] = self.arguments.make_parallel
-        try:
-            t = int(ret['make-parallel'])
-        except ValueError:
-            self.print_help()
-            print("")
-            print("Error: make-parallel is not an integer")
-            sys.exit(1)
-        if (t < 0):
+        if (ret['make-parallel'] != 'auto'):
+            try:
+                t = int(ret['make-parallel'])
+            except ValueError:
+                self.print_help()
+                print("")
+                print("Error: make-parallel is not an integer")
+                sys.exit(1)
+            if (t < 0):
+                self.print_help()
+                print("")
+                print("Error: make-parallel must be a positive integer")
+                sys.exit(1)
+            ret['make-parallel'] = t
+        # "auto" is resolved in CompilerLauncher.make_parallel()
+
+
+        if (self.arguments.test_parallel == ''):
+            # read value from configfile
+            if (self.configfile is not False and len(str(self.configfile['build']['options']['test-parallel'])) > 0):
+                ret['test-parallel'] = self.configfile['build']['options']['test-parallel']
+            else:
+                # default value (the locales run at the same time)
+                ret['test-parallel'] = 'auto'
+        else:
+            # use input from commandline
+            ret['test-parallel'] = self.arguments.test_parallel
+        if (ret['test-parallel'] != 'auto'):
+            try:
+                t = int(ret['test-parallel'])
+            except ValueError:
+                self.print_help()
+                print("")
+                print("Error: test-parallel is not an integer")
+                sys.exit(1)
+            if (t < 1):
+                self.print_help()
+                print("")
+                print("Error: test-parallel must be a positive integer")
+                sys.exit(1)
+            ret['test-parallel'] = t
+        # "auto" is resolved in Build.test_parallel()
+
+
+        if (self.arguments.test_fast is True):
+            # --test-fast specified on commandline, honor the flag
+            ret['test-fast'] = True
+        elif (self.arguments.test_fast is False):
+            # see if the configuration overrides this flag
+            if (self.configfile is not False and self.configfile['build']['options']['test-fast'] == 1):
+                ret['test-fast'] = True
+            else:
+                ret['test-fast'] = False
+
+
+        if (self.arguments.continue_on_failure is True):
+            # --continue-on-failure specified on commandline, honor the flag
+            ret['continue-on-failure'] = True
+        elif (self.arguments.continue_on_failure is False):
+            # see if the configuration overrides this flag
+            if (self.configfile is not False and self.configfile['build']['options']['continue-on-failure'] == 1):
+                ret['continue-on-failure'] = True
+            else:
+                ret['continue-on-failure'] = False
+
+
+        if (self.arguments.compress_logs == ''):
+            if (self.configfile is not False and len(str(self.configfile['build']['options']['compress-logs'])) > 0):
+                ret['compress-logs'] = str(self.configfile['build']['options']['compress-logs'])
+            else:
+                ret['compress-logs'] = 'none'
+        else:
+            ret['compress-logs'] = self.arguments.compress_logs
+        if (ret['compress-logs'] not in ['none', 'gzip', 'zstd']):
             self.print_help()
             print("")
-            print("Error: make-parallel must be a positive integer")
+            print("Error: invalid compress-logs (must be one of: none, gzip, zstd)")
+            print("Argument: " + ret['compress-logs'])
             sys.exit(1)
-        ret['make-parallel'] = t
+        ret['zstd-bin'] = ''
+        if (ret['compress-logs'] == 'zstd'):
+            tmp_bin = self.find_in_path('zstd')
+            if (tmp_bin is False):
+                self.print_help()
+                print("")
+                print("Error: no 'zstd' executable found")
+                sys.exit(1)
+            ret['zstd-bin'] = tmp_bin
+
+
+        for budget in ['log-step-budget', 'log-job-budget']:
+            arg_budget = getattr(self.arguments, budget.replace('-', '_'))
+            if (arg_budget == ''):
+                if (self.configfile is not False and len(str(self.configfile['build']['options'][budget])) > 0):
+                    arg_budget = str(self.configfile['build']['options'][budget])
+                else:
+                    arg_budget = '0'
+            # store the value in bytes, 0 is unlimited
+            ret[budget] = self.size_in_bytes(arg_budget)
+            if (ret[budget] is None):
+                self.print_help()
+                print("")
+                print("Error: invalid " + budget)
+                print("Argument: " + arg_budget)
+                sys.exit(1)
 
 
         if (self.arguments.enable_orca is True):
@@ -1337,6 +1771,47 @@ class Config:
             self.lockfile_name = ret['lockfile']
 
 
+        # SQLite is the only backend right now
+        ret['database-backend'] = 'sqlite'
+        if (len(self.arguments.database_path) > 0):
+            ret['database-path'] = self.arguments.database_path
+        elif (self.configfile is not False and len(self.configfile['database']['path']) > 0):
+            ret['database-path'] = self.replace_home_env(self.configfile['database']['path'])
+        else:
+            ret['database-path'] = os.path.join(os.environ.get('HOME'), '.buildclient')
+        if (os.path.isdir(ret['database-path']) is True or
+            os.path.isdir(os.path.dirname(os.path.abspath(ret['database-path']))) is False):
+            self.print_help()
+            print("")
+            print("Error: database must be a file in an existing directory")
+            print("Argument: " + ret['database-path'])
+            sys.exit(1)
+
+        # additional PRAGMAs for the database connection, like: synchronous: NORMAL
+        ret['database-pragmas'] = {}
+        if (self.configfile is not False and self.configfile['database']['pragmas'] != ''):
+            if not (isinstance(self.configfile['database']['pragmas'], dict)):
+                print("")
+                print("Error: database pragmas must be a list of 'name: value' pairs")
+                sys.exit(1)
+            ret['database-pragmas'] = self.configfile['database']['pragmas']
+
+        # builds per branch which --compact-history keeps in full
+        if (len(self.arguments.keep_builds) > 0):
+            ret['keep-builds'] = self.arguments.keep_builds
+        elif (self.configfile is not False and len(str(self.configfile['database']['keep-builds'])) > 0):
+            ret['keep-builds'] = str(self.configfile['database']['keep-builds'])
+        else:
+            ret['keep-builds'] = '100'
+        if (ret['keep-builds'].isdigit() is False or int(ret['keep-builds']) < 1):
+            self.print_help()
+            print("")
+            print("Error: keep-builds must be a number, and at least 1")
+            print("Argument: " + ret['keep-builds'])
+            sys.exit(1)
+        ret['keep-builds'] = int(ret['keep-builds'])
+
+
 
         self.__fully_initiated = 1
         self.config = ret
@@ -1531,6 +2006,47 @@ class Config:
 
 
 
+    # size_in_bytes()
+    #
+    # convert a size (like "64M") into bytes
+    #
+    # parameter:
+    #  - self
+    #  - size string, with optional unit (k, M, G)
+    # return:
+    #  - number of bytes, or None if the size is invalid
+    def size_in_bytes(self, size):
+        m = re.match(r'^([0-9]+)([kMG]?)$', str(size))
+        if not (m):
+            return None
+        return int(m.group(1)) * {'': 1, 'k': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}[m.group(2)]
+
+
+
+    # timestamp_from_date()
+    #
+    # convert a date (like "2020-01-31" or "2020-01-31 12:00") in local time into a Unix timestamp
+    #
+    # parameter:
+    #  - self
+    #  - date string
+    #  - True: a date without time means the end of the day
+    # return:
+    #  - timestamp, or None if the date is invalid
+    def timestamp_from_date(self, date, end_of_day):
+        for format in ['%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d']:
+            try:
+                t = time.strptime(date.strip(), format)
+            except ValueError:
+                continue
+            if (format == '%Y-%m-%d' and end_of_day is True):
+                # midnight of the next day, mktime() handles the end of month and DST changes
+                return int(time.mktime((t.tm_year, t.tm_mon, t.tm_mday + 1, 0, 0, 0, 0, 0, -1)))
+            return int(time.mktime(t))
+        return None
+
+
+
     # cleanup_old_dirs_and_files()
     #
     # cleanup old directories, patches and build support files
@@ -0,0 +1,395 @@
+import os
+import logging
+import struct
+import signal
+import threading
+import multiprocessing
+import subprocess
+from subprocess import Popen, PIPE
+
+
+# ELF type of a core file
+ET_CORE = 4
+# program header type of the notes segment
+PT_NOTE = 4
+# note types in a core file: process info, and the files mapped into the process
+NT_PRPSINFO = 3
+NT_FILE = 0x46494c45
+
+
+# finds core files of crashed test servers, and extracts stack traces with gdb
+# one instance per test run
+
+class CoreDumpCollector:
+
+    def __init__(self, gdb, executable, timeout = 60):
+        # path to gdb binary
+        self.gdb = gdb
+        # binary which created the core files (the PostgreSQL server)
+        self.executable = executable
+        # seconds for one gdb run, a broken core file must not block the tests
+        self.timeout = timeout
+        # every core is only reported once, even if more stages scan the same directory
+        self.seen = set()
+        self.seen_lock = threading.Lock()
+        # file name part of core_pattern, set in core_pattern_dir()
+        self.pattern_name = ''
+        self.pattern_dir = self.core_pattern_dir()
+
+
+
+    # core_pattern_dir()
+    #
+    # figure out if the kernel writes core files into a fixed directory
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - directory name, or None if the cores are written into the working directory
+    def core_pattern_dir(self):
+        if not (os.path.isfile('/proc/sys/kernel/core_pattern')):
+            return None
+        f = open('/proc/sys/kernel/core_pattern', 'r')
+        pattern = f.read().strip()
+        f.close()
+
+        if (pattern.startswith('|')):
+            # piped into a helper (like systemd-coredump), there are no files to find
+            logging.debug("core files are handled by: " + pattern[1:])
+            return None
+        if (pattern.startswith('/')):
+            directory = os.path.dirname(pattern)
+            # placeholders in the directory part are not supported
+            if ('%' in directory or not os.path.isdir(directory)):
+                return None
+            self.pattern_name = os.path.basename(pattern)
+            return directory
+        return None
+
+
+
+    # find_cores()
+    #
+    # find new core files in a list of directories
+    # only the directories themselves are searched, not the trees below
+    # cores in the central core_pattern directory must be written by this build:
+    # by the server binary of this build, and by a server using one of the directories
+    #
+    # parameter:
+    #  - self
+    #  - list with directories (data directories of the test clusters)
+    #  - start time of the stage (seconds since the epoch), older cores belong to another stage
+    # return:
+    #  - list with core files
+    def find_cores(self, directories, start_time):
+        candidates = []
+        for directory in directories:
+            if (os.path.isdir(directory)):
+                candidates.extend([os.path.join(directory, f) for f in sorted(os.listdir(directory))])
+        if (self.pattern_dir is not None):
+            # the kernel truncates the executable name to 15 characters
+            executable_name = os.path.basename(self.executable)[0:15]
+            postmaster_pids = self.postmaster_pids(directories)
+            for f in sorted(os.listdir(self.pattern_dir)):
+                path = os.path.join(self.pattern_dir, f)
+                # the directory is shared with everything else on this host
+                if ('%e' in self.pattern_name and executable_name not in f):
+                    continue
+                if (os.path.isfile(path) and os.stat(path).st_mtime >= start_time and
+                    self.is_own_core(path, directories, postmaster_pids)):
+                    candidates.append(path)
+
+        cores = []
+        for path in candidates:
+            if (os.path.islink(path) or not os.path.isfile(path)):
+                continue
+            if (self.is_core(path) is False):
+                continue
+            st = os.stat(path)
+            key = (st.st_dev, st.st_ino, st.st_mtime)
+            with self.seen_lock:
+                if (key in self.seen):
+                    continue
+                self.seen.add(key)
+            cores.append(path)
+
+        return cores
+
+
+
+    # postmaster_pids()
+    #
+    # read the process IDs of the servers running in a list of data directories
+    #
+    # parameter:
+    #  - self
+    #  - list with data directories
+    # return:
+    #  - set with process IDs
+    def postmaster_pids(self, directories):
+        pids = set()
+        for directory in directories:
+            try:
+                f = open(os.path.join(directory, 'postmaster.pid'), 'r')
+                line = f.readline().strip()
+                f.close()
+            except (OSError, IOError):
+                # server is not running
+                continue
+            if (line.isdigit()):
+                pids.add(int(line))
+        return pids
+
+
+
+    # is_own_core()
+    #
+    # verify that a core file in the central core_pattern directory was written by this build
+    #
+    # parameter:
+    #  - self
+    #  - core file name
+    #  - list with data directories of this stage
+    #  - set with process IDs of the servers in these data directories
+    # return:
+    #  - True/False
+    def is_own_core(self, path, directories, postmaster_pids):
+        notes = self.core_notes(path)
+        if (notes is None or notes['fname'] != os.path.basename(self.executable)[0:15]):
+            # another program crashed
+            return False
+        if (len(postmaster_pids) > 0):
+            # the server itself, or one of its backends
+            return (notes['pid'] in postmaster_pids or notes['ppid'] in postmaster_pids)
+        # the server is already stopped: the server was started with one of the data directories,
+        # or the backend ran the binary of this build (the install dir is unique for every build)
+        for directory in directories:
+            if (directory in notes['psargs']):
+                return True
+        for filename in notes['files']:
+            if (filename.endswith(self.executable)):
+                return True
+        return False
+
+
+
+    # core_notes()
+    #
+    # read the process information from the notes of an ELF core file
+    #
+    # parameter:
+    #  - self
+    #  - core file name
+    # return:
+    #  - dictionary with pid, ppid, fname, psargs and the mapped files, or None
+    def core_notes(self, path):
+        try:
+            f = open(path, 'rb')
+            header = f.read(64)
+            if (len(header) < 52 or header[0:4] != b'\x7fELF'):
+                f.close()
+                return None
+            # byte 4: 1 = 32 bit, 2 = 64 bit; byte 5: 1 = little endian, 2 = big endian
+            is_64 = (header[4:5] == b'\x02')
+            endian = '>' if (header[5:6] == b'\x02') else '<'
+            word = 'Q' if is_64 else 'I'
+            if (is_64):
+                phoff = struct.unpack(endian + 'Q', header[32:40])[0]
+                phentsize, phnum = struct.unpack(endian + 'HH', header[54:58])
+            else:
+                phoff = struct.unpack(endian + 'I', header[28:32])[0]
+                phentsize, phnum = struct.unpack(endian + 'HH', header[42:46])
+
+            notes = {'pid': None, 'ppid': None, 'fname': None, 'psargs': '', 'files': []}
+            for i in range(min(phnum, 4096)):
+                f.seek(phoff + i * phentsize)
+                phdr = f.read(phentsize)
+                if (len(phdr) < phentsize):
+                    break
+                if (struct.unpack(endian + 'I', phdr[0:4])[0] != PT_NOTE):
+                    continue
+                if (is_64):
+                    offset, filesz = struct.unpack(endian + 'Q', phdr[8:16])[0], struct.unpack(endian + 'Q', phdr[32:40])[0]
+                else:
+                    offset, filesz = struct.unpack(endian + 'I', phdr[4:8])[0], struct.unpack(endian + 'I', phdr[16:20])[0]
+                # the notes are small, anything bigger is a broken file
+                if (filesz > 16 * 1024 * 1024):
+                    continue
+                f.seek(offset)
+                self.parse_notes(f.read(filesz), endian, word, notes)
+            f.close()
+        except (OSError, IOError, struct.error) as e:
+            logging.debug("failed to read core file " + path + ": " + str(e))
+            return None
+
+        if (notes['fname'] is None):
+            return None
+        return notes
+
+
+
+    # parse_notes()
+    #
+    # parse the notes segment of a core file
+    #
+    # parameter:
+    #  - self
+    #  - content of the notes segment
+    #  - byte order for struct
+    #  - format of a word (32 or 64 bit) for struct
+    #  - dictionary with the results, updated
+    # return:
+    #  none
+    def parse_notes(self, data, endian, word, notes):
+        pos = 0
+        while (pos + 12 <= len(data)):
+            namesz, descsz, note_type = struct.unpack(endian + 'III', data[pos:pos + 12])
+            # name and description are aligned to 4 bytes
+            desc_start = pos + 12 + ((namesz + 3) & ~3)
+            desc = data[desc_start:desc_start + descsz]
+            pos = desc_start + ((descsz + 3) & ~3)
+            if (len(desc) < descsz):
+                break
+
+            if (note_type == NT_PRPSINFO and descsz >= 112):
+                # the layout of the first fields differs between platforms,
+                # but the structure always ends with pid, ppid, pgrp, sid, fname[16] and psargs[80]
+                notes['pid'], notes['ppid'] = struct.unpack(endian + 'ii', desc[descsz - 112:descsz - 104])
+                notes['fname'] = desc[descsz - 96:descsz - 80].split(b'\0')[0].decode('utf-8', 'replace')
+                notes['psargs'] = desc[descsz - 80:].split(b'\0')[0].decode('utf-8', 'replace')
+            elif (note_type == NT_FILE):
+                word_size = struct.calcsize(word)
+                if (descsz < 2 * word_size):
+                    continue
+                count = struct.unpack(endian + word, desc[0:word_size])[0]
+                # count, page size, and start, end and offset for every file, then the file names
+                names = desc[(2 + 3 * count) * word_size:]
+                notes['files'] = [n.decode('utf-8', 'replace') for n in names.split(b'\0')[0:count]]
+
+
+
+    # is_core()
+    #
+    # verify if a file is an ELF core file
+    #
+    # parameter:
+    #  - self
+    #  - filename
+    # return:
+    #  - True/False
+    def is_core(self, path):
+        try:
+            f = open(path, 'rb')
+            header = f.read(18)
+            f.close()
+        except (OSError, IOError):
+            return False
+        if (len(header) < 18 or header[0:4] != b'\x7fELF'):
+            return False
+        # byte 5: 1 = little endian, 2 = big endian; e_type follows the 16 byte ident
+        if (header[5:6] == b'\x02'):
+            e_type = struct.unpack('>H', header[16:18])[0]
+        else:
+            e_type = struct.unpack('<H', header[16:18])[0]
+        return (e_type == ET_CORE)
+
+
+
+    # stack_traces()
+    #
+    # extract stack traces of all new core files, gdb runs in parallel
+    #
+    # parameter:
+    #  - self
+    #  - list with directories to search
+    #  - start time of the stage (seconds since the epoch)
+    # return:
+    #  - string with stack traces
+    def stack_traces(self, directories, start_time):
+        cores = self.find_cores(directories, start_time)
+        if (len(cores) == 0):
+            return ''
+        logging.info("found " + str(len(cores)) + " core file(s)")
+
+        traces = [None] * len(cores)
+        queue = list(range(len(cores)))
+        queue_lock = threading.Lock()
+
+        def worker():
+            while True:
+                with queue_lock:
+                    if (len(queue) == 0):
+                        return
+                    i = queue.pop(0)
+                traces[i] = self.stack_trace(cores[i])
+
+        threads = []
+        for i in range(min(len(cores), multiprocessing.cpu_count())):
+            thread = threading.Thread(target = worker)
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+
+        # keep the order of the core files
+        return ''.join([t for t in traces if t is not None])
+
+
+
+    # stack_trace()
+    #
+    # generate a stack trace for a core file
+    #
+    # parameter:
+    #  - self
+    #  - core file name
+    # return:
+    #  - string with stack trace, or None
+    def stack_trace(self, core):
+        call = [self.gdb, '--batch', '--nx', '-ex', 'bt', self.executable, core]
+        logging.debug(str(call))
+        try:
+            # own process group, the timeout also kills anything gdb started
+            proc = Popen(call, stdout=PIPE, stderr=subprocess.STDOUT, preexec_fn=os.setsid)
+        except OSError as e:
+            logging.error("failed to run gdb: " + str(e))
+            return None
+
+        # kill gdb if it takes too long
+        timer = threading.Timer(self.timeout, self.kill_process_group, [proc.pid])
+        timer.start()
+        try:
+            out, err = proc.communicate()
+        finally:
+            timer.cancel()
+        if (proc.returncode != 0):
+            # something happened, cannot extract stack trace
+            logging.debug("gdb failed for " + core + ", exit code: " + str(proc.returncode))
+            return None
+
+        trace = "\n\n" + "=" * 15 + " stack trace: "
+        trace += core
+        trace += " " + "=" * 15 + "\n"
+        trace += out.decode('utf-8', 'replace')
+
+        return trace
+
+
+
+    # kill_process_group()
+    #
+    # kill a process and everything it started
+    #
+    # parameter:
+    #  - self
+    #  - process ID of the group leader
+    # return:
+    #  none
+    def kill_process_group(self, pid):
+        logging.error("gdb timed out after " + str(self.timeout) + "s")
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except OSError:
+            # already gone
+            pass
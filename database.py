@@ -1,13 +1,16 @@
 import re
-import os
 import sys
 import logging
 import string
-import sqlite3
 import datetime
 import atexit
-import copy
 import time
+import math
+import json
+import hashlib
+import contextlib
+from database_backend import SQLiteBackend
+from build_record import BuildRecord
 
 
 class Database:
@@ -15,9 +18,15 @@ class Database:
     def __init__(self, config):
         self.config = config
 
-        # database defaults to a hardcoded file
-        self.connection = sqlite3.connect(os.path.join(os.environ.get('HOME'), '.buildclient'))
-        self.connection.row_factory = sqlite3.Row
+        # nesting level of transaction()
+        self.transaction_depth = 0
+        # database defaults to ~/.buildclient
+        logging.debug("database: " + self.config.get('database-path'))
+        if (self.config.get('database-backend') == 'sqlite'):
+            self.backend = SQLiteBackend(self.config.get('database-path'), self.config.get('database-pragmas'))
+        else:
+            logging.error("unknown database backend: " + str(self.config.get('database-backend')))
+            sys.exit(1)
         # debugging
         #self.drop_tables()
         self.init_tables()
@@ -28,7 +37,7 @@ class Database:
 
 
     def exit_handler(self):
-        self.connection.close()
+        self.backend.close()
 
 
 
@@ -39,60 +48,9 @@ class Database:
     # parameter:
     #  - self
     # return:
-    #  - object with all fields initialized
+    #  - BuildRecord with all fields initialized
     def init_dataset(self):
-        data = {}
-        data['repository'] = None
-        data['repository_type'] = None
-        data['branch'] = None
-        data['revision'] = None
-        data['is_head'] = None
-
-        data['start_time'] = None
-        data['start_time_local'] = None
-        data['orca'] = None
-        data['is_buildfarm'] = None
-
-        data['run_git_update'] = False
-        data['run_configure'] = False
-        data['run_make'] = False
-        data['run_install'] = False
-        data['run_tests'] = False
-        data['run_extra_targets'] = ''
-
-        data['time_git_update'] = 0
-        data['time_configure'] = 0
-        data['time_make'] = 0
-        data['time_install'] = 0
-        data['time_tests'] = 0
-        data['times_buildfarm'] = []
-        data['steps_buildfarm'] = []
-
-        data['result_portcheck'] = None
-        data['result_git_update'] = None
-        data['result_configure'] = None
-        data['result_make'] = None
-        data['result_install'] = None
-        data['result_tests'] = None
-
-        data['extra_configure'] = ''
-        data['extra_make'] = ''
-        data['extra_install'] = ''
-        data['extra_tests'] = ''
-        data['extra_patches'] = False
-        data['test_locales'] = ''
-        data['patches'] = ''
-        data['errorstr'] = ''
-
-        data['pg_majorversion'] = None
-        data['pg_version'] = None
-        data['pg_version_num'] = None
-        data['pg_version_str'] = None
-        data['gp_majorversion'] = None
-        data['gp_version'] = None
-        data['gp_version_num'] = None
-
-        return data
+        return BuildRecord()
 
 
 
@@ -102,12 +60,10 @@ class Database:
     #
     # parameter:
     #  - self
-    #  - log data object
+    #  - BuildRecord
     # return:
     #  none
-    def log_build(self, data_in):
-        # create a copy, because we modify the content
-        data = copy.deepcopy(data_in)
+    def log_build(self, data):
         #if (data['is_head'] is not True and data['is_head'] is not False):
         #    logging.error("'is_head' must be True or False")
         #    sys.exit(1)
@@ -115,50 +71,8 @@ class Database:
             logging.error("'is_buildfarm' must be True or False")
             sys.exit(1)
 
-        #if (data['is_head'] is True):
-        #    data['is_head'] = 1
-        #else:
-        #    data['is_head'] = 0
-
-        if (data['is_buildfarm'] is True):
-            data['is_buildfarm'] = 1
-        else:
-            data['is_buildfarm'] = 0
-
-        #if (data['orca'] is True):
-        #    data['orca'] = 1
-        #else:
-        #    data['orca'] = 0
-
-        if (data['run_git_update'] is True):
-            data['run_git_update'] = 1
-        else:
-            data['run_git_update'] = 0
-
-        if (data['run_configure'] is True):
-            data['run_configure'] = 1
-        else:
-            data['run_configure'] = 0
-
-        if (data['run_make'] is True):
-            data['run_make'] = 1
-        else:
-            data['run_make'] = 0
-
-        if (data['run_install'] is True):
-            data['run_install'] = 1
-        else:
-            data['run_install'] = 0
-
-        if (data['run_tests'] is True):
-            data['run_tests'] = 1
-        else:
-            data['run_tests'] = 0
-
-        if (data['extra_patches'] is True):
-            data['extra_patches'] = 1
-        else:
-            data['extra_patches'] = 0
+        # the verdict is calculated once, all readers use the stored result
+        result_overall, failed_stage = self.build_result(data)
 
         #print("write repository_type: " + str(data['repository_type']))
         query = """INSERT INTO build_status
@@ -171,42 +85,95 @@ class Database:
                                 run_extra_targets, test_locales,
                                 pg_majorversion, pg_version, pg_version_num, pg_version_str,
                                 gp_majorversion, gp_version, gp_version_num,
-                                times_buildfarm, steps_buildfarm)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+                                ccache_hits, ccache_misses, ccache_size, ccache_size_delta,
+                                result_overall, failed_stage)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"""
 
-        param = [data['repository'], data['repository_type'], data['branch'], data['revision'], data['is_head'], data['is_buildfarm'], data['start_time'], data['start_time_local'],
-                 data['run_git_update'], data['run_configure'], data['run_make'], data['run_install'], data['run_tests'],
+        param = [data['repository'], data['repository_type'], data['branch'], data['revision'], data['is_head'], data.sql_bool('is_buildfarm'), data['start_time'], data['start_time_local'],
+                 data.sql_bool('run_git_update'), data.sql_bool('run_configure'), data.sql_bool('run_make'), data.sql_bool('run_install'), data.sql_bool('run_tests'),
                  data['time_git_update'], data['time_configure'], data['time_make'], data['time_install'], data['time_tests'],
                  data['result_configure'], data['result_make'], data['result_install'], data['result_tests'],
                  data['extra_configure'], data['extra_make'], data['extra_install'], data['extra_tests'],
-                 data['extra_patches'], data['orca'], data['patches'], data['errorstr'], data['result_portcheck'], data['result_git_update'],
+                 data.sql_bool('extra_patches'), data['orca'], data['patches'], data['errorstr'], data['result_portcheck'], data['result_git_update'],
                  data['run_extra_targets'], data['test_locales'],
                  data['pg_majorversion'], data['pg_version'], data['pg_version_num'], data['pg_version_str'],
                  data['gp_majorversion'], data['gp_version'], data['gp_version_num'],
-                 "!".join(data['times_buildfarm']), " ".join(data['steps_buildfarm'])]
-
-        self.execute_one(query, param)
-
-        # get last inserted ID
-        query = "SELECT last_insert_rowid() AS id"
-        last_id = self.execute_one(query, [])['id']
-        logging.debug("log ID is: " + str(last_id))
-
-        # save the following logging data in the extra table
-        extra_log = ['build_dir', 'install_dir']
-        for k in extra_log:
-            if k in data:
-                query = """INSERT INTO build_additional_data
-                                       (build_status_id, data_key, data_value)
-                                VALUES (?, ?, ?)"""
-                param = [last_id, k, data[k]]
+                 data['ccache_hits'], data['ccache_misses'], data['ccache_size'], data['ccache_size_delta'],
+                 result_overall, failed_stage]
+
+        # the build and all its additional data are written at once
+        with self.transaction():
+            cur = self.backend.execute(query, param)
+
+            # get last inserted ID
+            last_id = self.backend.last_insert_id(cur)
+            logging.debug("log ID is: " + str(last_id))
+
+            # save the following logging data in the extra table
+            extra_log = ['build_dir', 'install_dir', 'stage_results']
+            for k in extra_log:
+                if (data[k] is not None):
+                    query = """INSERT INTO build_additional_data
+                                           (build_status_id, data_key, data_value)
+                                    VALUES (?, ?, ?)"""
+                    param = [last_id, k, data[k]]
+                    self.execute_one(query, param)
+
+            for failure in data['test_failures']:
+                query = """INSERT INTO test_failures
+                                       (build_status_id, suite, locale, test_name, kind, diff)
+                                VALUES (?, ?, ?, ?, ?, ?)"""
+                param = [last_id, failure['suite'], failure['locale'], failure['test'], failure['kind'], failure['diff']]
+                self.execute_one(query, param)
+
+            for step in data['build_steps']:
+                query = """INSERT INTO build_steps
+                                       (build_status_id, name, step, locale, result, exit_code, started, duration, log)
+                                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+                param = [last_id, step['name'], step['step'], step['locale'], step['result'], step['exit_code'],
+                         step['started'], float(step['duration']) if (step['duration'] is not None) else None, step['log']]
                 self.execute_one(query, param)
 
 
 
+    # build_result()
+    #
+    # figure out if and where a build failed
+    # the stages are checked in the order they run, the first failure wins
+    #
+    # parameter:
+    #  - self
+    #  - build data (a BuildRecord, or a row from build_status as dictionary)
+    # return:
+    #  - result (0: OK, otherwise the exit code of the failed stage), failed stage (buildfarm name, or None)
+    def build_result(self, data):
+        if (data['run_git_update'] == 1 and data['result_git_update'] is not None and data['result_git_update'] > 0):
+            return data['result_git_update'], 'SCM'
+        if (data['result_portcheck'] is not None and data['result_portcheck'] > 0):
+            return data['result_portcheck'], 'Pre-run-port-check'
+        if (data['run_configure'] == 1 and data['result_configure'] is not None and data['result_configure'] > 0):
+            return data['result_configure'], 'Configure'
+        if (data['run_make'] == 1 and data['result_make'] is not None and data['result_make'] > 0):
+            return data['result_make'], 'Make'
+        if (data['run_install'] == 1 and data['result_install'] is not None and data['result_install'] > 0):
+            return data['result_install'], 'Make-install'
+        if (data['run_tests'] == 1 and data['failed_stage'] is not None):
+            # the first failed test stage, even if "make check" passed
+            if (data['result_tests'] is None or data['result_tests'] == 0):
+                return 1, data['failed_stage']
+            return data['result_tests'], data['failed_stage']
+        if (data['run_tests'] == 1 and data['result_tests'] is not None and data['result_tests'] > 0):
+            return data['result_tests'], 'Check'
+        if (data['result_portcheck'] is None and (data['run_tests'] == 1 or (data['is_buildfarm'] == 1 and data['run_configure'] == 1))):
+            # buildfarm mode and running regression tests both require running portcheck
+            return 1, 'Pre-run-port-check'
+        return 0, None
+
+
+
     # init_tables()
     #
-    # initialize all missing tables
+    # initialize all missing tables, and upgrade the schema
     #
     # parameter:
     #  - self
@@ -229,6 +196,229 @@ class Database:
             logging.debug("need to create table build_additional_data")
             self.table_build_additional_data()
 
+        self.migrate()
+
+
+
+    # schema_migrations()
+    #
+    # list of all schema changes after the initial release, in order
+    # the backend stores the version of a database (SQLite: "PRAGMA user_version")
+    # never change or remove an entry, only append new ones
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - list with version number, description, function
+    def schema_migrations(self):
+        return [
+            [1, 'ccache statistics in build_status', self.migration_ccache_columns],
+            [2, 'table test_failures', self.migration_test_failures],
+            [3, 'indexes for build and job lookups', self.migration_lookup_indexes],
+            [4, 'overall result and failed stage in build_status', self.migration_build_result],
+            [5, 'table build_history', self.migration_build_history],
+            [6, 'table build_steps', self.migration_build_steps],
+            [7, 'unique job key in buildfarm_jobs', self.migration_job_key],
+        ]
+
+
+
+    # migrate()
+    #
+    # apply all schema migrations which are newer than the database
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  none
+    def migrate(self):
+        version = self.backend.schema_version()
+        for migration in self.schema_migrations():
+            if (migration[0] <= version):
+                continue
+            logging.info("upgrade database schema to version " + str(migration[0]) + ": " + migration[1])
+            # a migration is applied completely, or not at all
+            with self.transaction():
+                migration[2]()
+                self.backend.set_schema_version(migration[0])
+
+
+
+    # migration_ccache_columns()
+    #
+    # schema version 1: compiler cache statistics
+    # tables created by table_build_status() already have the columns
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  none
+    def migration_ccache_columns(self):
+        for column in ['ccache_hits', 'ccache_misses', 'ccache_size', 'ccache_size_delta']:
+            if (self.column_exist('build_status', column) is False):
+                logging.debug("need to add column build_status." + column)
+                self.run_query('ALTER TABLE build_status ADD COLUMN "%s" INTEGER' % column)
+
+
+
+    # migration_test_failures()
+    #
+    # schema version 2: failed tests
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  none
+    def migration_test_failures(self):
+        if (self.table_exist('test_failures') is False):
+            logging.debug("need to create table test_failures")
+            self.table_test_failures()
+
+
+
+    # migration_lookup_indexes()
+    #
+    # schema version 3: indexes matching the lookups of every buildfarm run and job enqueue
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  none
+    def migration_lookup_indexes(self):
+        # buildfarm_ran_before(), last_log_entry(): equality on all columns, newest first
+        self.run_query("""CREATE INDEX IF NOT EXISTS build_status_revision
+                                    ON build_status (repository, branch, revision, is_buildfarm, start_time)""")
+        # previous_log_entry(): all other revisions of a branch, newest first
+        self.run_query("""CREATE INDEX IF NOT EXISTS build_status_branch
+                                    ON build_status (repository, branch, is_buildfarm, start_time)""")
+        # jobs of a revision
+        self.run_query("""CREATE INDEX IF NOT EXISTS buildfarm_jobs_revision
+                                    ON buildfarm_jobs (repository, branch, revision)""")
+        # list_pending_buildfarm_jobs()
+        self.run_query("""CREATE INDEX IF NOT EXISTS buildfarm_jobs_pending
+                                    ON buildfarm_jobs (finished, added_ts)""")
+        # let the planner know about the new indexes
+        self.backend.analyze()
+
+
+
+    # migration_build_result()
+    #
+    # schema version 4: overall result and failed stage, calculated when the build is written
+    # existing builds are calculated once, the failed test stage moves from build_additional_data
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  none
+    def migration_build_result(self):
+        if (self.column_exist('build_status', 'result_overall') is False):
+            logging.debug("need to add column build_status.result_overall")
+            self.run_query('ALTER TABLE build_status ADD COLUMN result_overall INTEGER')
+        if (self.column_exist('build_status', 'failed_stage') is False):
+            logging.debug("need to add column build_status.failed_stage")
+            self.run_query('ALTER TABLE build_status ADD COLUMN failed_stage TEXT')
+
+        query = """SELECT id, is_buildfarm,
+                          run_git_update, run_configure, run_make, run_install, run_tests,
+                          result_git_update, result_portcheck, result_configure, result_make, result_install, result_tests,
+                          (SELECT data_value
+                             FROM build_additional_data
+                            WHERE build_status_id = build_status.id
+                              AND data_key = 'failed_stage') AS failed_stage
+                     FROM build_status"""
+        for row in self.execute_query(query, []):
+            result_overall, failed_stage = self.build_result(dict(row))
+            self.execute_one("UPDATE build_status SET result_overall = ?, failed_stage = ? WHERE id = ?",
+                             [result_overall, failed_stage, row['id']])
+        self.run_query("DELETE FROM build_additional_data WHERE data_key = 'failed_stage'")
+
+        # previous_log_entry(): the last successful build of a branch
+        self.run_query("""CREATE INDEX IF NOT EXISTS build_status_result
+                                    ON build_status (repository, branch, is_buildfarm, result_overall, start_time)""")
+        self.backend.analyze()
+
+
+
+    # migration_build_history()
+    #
+    # schema version 5: daily statistics of compacted builds
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  none
+    def migration_build_history(self):
+        if (self.table_exist('build_history') is False):
+            logging.debug("need to create table build_history")
+            self.table_build_history()
+
+
+
+    # migration_build_steps()
+    #
+    # schema version 6: every step of a build in a separate row
+    # the completed buildfarm steps and their runtimes ("steps_buildfarm", "times_buildfarm")
+    # of existing builds are moved into the new table
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  none
+    def migration_build_steps(self):
+        if (self.table_exist('build_steps') is False):
+            logging.debug("need to create table build_steps")
+            self.table_build_steps()
+
+        query = """SELECT id, steps_buildfarm, times_buildfarm
+                     FROM build_status
+                    WHERE steps_buildfarm != ''"""
+        for row in self.execute_query(query, []):
+            steps = row['steps_buildfarm'].split(' ')
+            times = row['times_buildfarm'].split('!')
+            for i, step in enumerate(steps):
+                duration = None
+                if (i < len(times) and len(times[i]) > 0):
+                    duration = float(times[i])
+                query = """INSERT INTO build_steps
+                                       (build_status_id, name, step, result, duration)
+                                VALUES (?, ?, ?, 'ok', ?)"""
+                self.execute_one(query, [row['id'], step, step, duration])
+        self.run_query("UPDATE build_status SET steps_buildfarm = '', times_buildfarm = '' WHERE steps_buildfarm != ''")
+
+
+
+    # migration_job_key()
+    #
+    # schema version 7: unique key for buildfarm jobs
+    # of duplicate jobs only the first one is kept (finished jobs first)
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  none
+    def migration_job_key(self):
+        if (self.column_exist('buildfarm_jobs', 'job_key') is False):
+            logging.debug("need to add column buildfarm_jobs.job_key")
+            self.run_query('ALTER TABLE buildfarm_jobs ADD COLUMN job_key TEXT')
+
+        query = """SELECT id, repository, branch, revision, orca, extra_configure, extra_make, extra_install, extra_tests,
+                          run_extra_targets, test_locales
+                     FROM buildfarm_jobs
+                 ORDER BY finished DESC, id"""
+        seen = set()
+        for row in self.execute_query(query, []):
+            job_key = self.job_key(row['repository'], row['branch'], row['revision'], row['orca'],
+                                   row['extra_configure'], row['extra_make'], row['extra_install'], row['extra_tests'],
+                                   row['run_extra_targets'], row['test_locales'])
+            if (job_key in seen):
+                logging.debug("remove duplicate buildfarm job: " + str(row['id']))
+                self.execute_one("DELETE FROM buildfarm_jobs WHERE id = ?", [row['id']])
+                continue
+            seen.add(job_key)
+            self.execute_one("UPDATE buildfarm_jobs SET job_key = ? WHERE id = ?", [job_key, row['id']])
+        self.run_query("CREATE UNIQUE INDEX IF NOT EXISTS buildfarm_jobs_job_key ON buildfarm_jobs (job_key)")
+
 
 
     # drop_tables()
@@ -256,6 +446,21 @@ class Database:
             logging.debug("drop table build_additional_data")
             self.drop_table('build_additional_data')
 
+        if (self.table_exist('test_failures') is True):
+            logging.debug("drop table test_failures")
+            self.drop_table('test_failures')
+
+        if (self.table_exist('build_history') is True):
+            logging.debug("drop table build_history")
+            self.drop_table('build_history')
+
+        if (self.table_exist('build_steps') is True):
+            logging.debug("drop table build_steps")
+            self.drop_table('build_steps')
+
+        self.backend.set_schema_version(0)
+        self.commit_statement()
+
 
 
     # drop_table()
@@ -286,9 +491,8 @@ class Database:
     # return:
     #  none
     def run_query(self, query):
-        cur = self.connection.cursor()
-        cur.execute(query)
-        self.connection.commit()
+        self.backend.execute(query)
+        self.commit_statement()
 
 
 
@@ -303,12 +507,9 @@ class Database:
     # return:
     #  - result
     def execute_one(self, query, param):
-        cur = self.connection.cursor()
+        result = self.backend.execute(query, param).fetchone()
 
-        cur.execute(query, param)
-        result = cur.fetchone()
-
-        self.connection.commit()
+        self.commit_statement()
         return result
 
 
@@ -324,81 +525,320 @@ class Database:
     # return:
     #  - result set
     def execute_query(self, query, param):
-        cur = self.connection.cursor()
-
-        cur.execute(query, param)
-        result = cur.fetchall()
+        result = self.backend.execute(query, param).fetchall()
 
-        self.connection.commit()
+        self.commit_statement()
         return result
 
 
 
+    # iterate_query()
+    #
+    # execute a database query with parameters, return the rows one by one
+    # the result set is never loaded into memory at once
+    #
+    # parameter:
+    #  - self
+    #  - query
+    #  - list with parameters
+    # return:
+    #  - iterator over the result set
+    def iterate_query(self, query, param):
+        for row in self.backend.execute(query, param):
+            yield row
+
+        self.commit_statement()
+
+
+
+    # commit_statement()
+    #
+    # commit a data change made outside of transaction()
+    # read-only statements do not open a transaction, and are not committed
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  none
+    def commit_statement(self):
+        if (self.transaction_depth == 0):
+            self.backend.commit_if_needed()
+
+
+
+    # transaction()
+    #
+    # context manager: run multiple statements in one transaction
+    # the write lock is taken at the start, commit at the end, rollback on any error
+    # can be nested, only the outermost level commits
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  none
+    @contextlib.contextmanager
+    def transaction(self):
+        if (self.transaction_depth == 0):
+            self.backend.begin()
+        self.transaction_depth += 1
+        try:
+            yield
+        except BaseException:
+            self.transaction_depth -= 1
+            if (self.transaction_depth == 0):
+                self.backend.rollback()
+            raise
+        self.transaction_depth -= 1
+        if (self.transaction_depth == 0):
+            self.backend.commit()
+
+
+
+    # build_status_filter()
+    #
+    # turn filters for build status log entries into a WHERE clause
+    #
+    # parameter:
+    #  - self
+    #  - dictionary with filters, empty values are ignored:
+    #    failing-test, branch, repository, status (ok, error), mode (buildfarm, interactive),
+    #    since, until (Unix timestamps)
+    # return:
+    #  - WHERE clause (or empty string), list with parameters
+    def build_status_filter(self, filters):
+        where = []
+        param = []
+        if (filters.get('failing-test')):
+            where.append("""id IN (SELECT build_status_id
+                                     FROM test_failures
+                                    WHERE test_name = ?)""")
+            param.append(filters['failing-test'])
+        if (filters.get('repository')):
+            where.append("repository = ?")
+            param.append(filters['repository'])
+        if (filters.get('branch')):
+            where.append("branch = ?")
+            param.append(filters['branch'])
+        if (filters.get('mode') == 'buildfarm'):
+            where.append("is_buildfarm = 1")
+        elif (filters.get('mode') == 'interactive'):
+            where.append("is_buildfarm = 0")
+        if (filters.get('since') is not None):
+            where.append("start_time >= ?")
+            param.append(filters['since'])
+        if (filters.get('until') is not None):
+            where.append("start_time < ?")
+            param.append(filters['until'])
+        if (filters.get('status') == 'ok'):
+            where.append("result_overall = 0")
+        elif (filters.get('status') == 'error'):
+            where.append("result_overall > 0")
+
+        if (len(where) == 0):
+            return '', param
+        return """
+                    WHERE """ + """
+                      AND """.join(where), param
+
+
+
+    # count_build_status()
+    #
+    # count the build status log entries matching the filters
+    #
+    # parameter:
+    #  - self
+    #  - dictionary with filters, see build_status_filter()
+    # return:
+    #  - number of entries
+    def count_build_status(self, filters):
+        where, param = self.build_status_filter(filters)
+        query = """SELECT COUNT(*) AS count
+                     FROM build_status""" + where
+        return self.execute_one(query, param)['count']
+
+
+
     # fetch_all_from_build_status()
     #
-    # fetch a list of build status log entries
+    # fetch build status log entries, in the order they were written
     #
     # parameter:
     #  - self
+    #  - dictionary with filters, see build_status_filter()
+    #  - optional: maximum number of entries
+    #  - optional: number of entries to skip
     # return:
-    #  - list with log entries (table: build_status)
-    def fetch_all_from_build_status(self):
+    #  - iterator over the log entries (table: build_status)
+    def fetch_all_from_build_status(self, filters, limit = None, offset = None):
+        where, param = self.build_status_filter(filters)
         query = """SELECT id , repository, repository_type, branch, revision, is_head, is_buildfarm, orca,
                           start_time, start_time_local,
                           run_git_update, run_configure, run_make, run_install, run_tests, extra_patches,
                           result_git_update, result_configure, result_make, result_install, result_tests, result_portcheck,
-                          run_extra_targets, test_locales
-                     FROM build_status
+                          run_extra_targets, test_locales, result_overall, failed_stage
+                     FROM build_status""" + where + """
                  ORDER BY id"""
-        return self.execute_query(query, [])
+        if (limit is not None or offset is not None):
+            # SQLite only knows OFFSET together with LIMIT, -1 is unlimited
+            query += """
+                    LIMIT ? OFFSET ?"""
+            param.append(limit if (limit is not None) else -1)
+            param.append(offset if (offset is not None) else 0)
+        return self.iterate_query(query, param)
 
 
 
-    # fetch_specific_build_status()
+    # fetch_build_steps()
     #
-    # fetch a specific build status log entry
+    # fetch the steps of a build, in the order they started
     #
     # parameter:
     #  - self
     #  - id
     # return:
-    #  - data for specific log entry
-    def fetch_specific_build_status(self, id):
-        query = """SELECT id, repository, repository_type, branch, revision, is_head, is_buildfarm, orca,
-                          start_time, start_time_local,
-                          run_git_update, run_configure, run_make, run_install, run_tests, extra_patches,
-                          result_git_update, result_configure, result_make, result_install, result_tests, result_portcheck,
-                          time_git_update, time_configure, time_make, time_install, time_tests, times_buildfarm,
-                          extra_configure, extra_make, extra_install, extra_tests, patches, errorstr,
-                          run_extra_targets, test_locales,
-                          pg_majorversion, pg_version, pg_version_num, pg_version_str,
-                          gp_majorversion, gp_version, gp_version_num, steps_buildfarm
-                     FROM build_status
-                    WHERE id = ?"""
-        data = self.execute_one(query, [id])
+    #  - list with steps (table: build_steps)
+    def fetch_build_steps(self, id):
+        query = """SELECT name, step, locale, result, exit_code, started, duration, log
+                     FROM build_steps
+                    WHERE build_status_id = ?
+                 ORDER BY started IS NULL, started, id"""
+        return self.execute_query(query, [id])
 
-        # data is a sqlite3.Row object, and does not support assignments
-        k = data.keys()
-        data2 = {}
-        for v in k:
-            data2[v] = data[v]
-        data = data2
 
-        # fetch extra data for this build
-        query = """SELECT *
-                     FROM build_additional_data
-                    WHERE build_status_id = ?"""
-        extra_data = self.execute_query(query, [id])
-        for e in extra_data:
+
+    # fetch_test_failures()
+    #
+    # fetch the failed tests of a build
+    #
+    # parameter:
+    #  - self
+    #  - id
+    # return:
+    #  - list with failed tests (table: test_failures)
+    def fetch_test_failures(self, id):
+        query = """SELECT suite, locale, test_name, kind, diff
+                     FROM test_failures
+                    WHERE build_status_id = ?
+                 ORDER BY id"""
+        return self.execute_query(query, [id])
+
+
+
+    # test_failure_statistics()
+    #
+    # count how often a test failed, per repository and branch
+    # only builds which ran the tests, since the first failure of the test, are counted:
+    # a test which fails now and then is flaky, a test which fails every time is broken
+    #
+    # parameter:
+    #  - self
+    #  - test name
+    # return:
+    #  - list with repository, branch, number of failed builds, number of builds, time of the last failure
+    def test_failure_statistics(self, test_name):
+        query = """SELECT bs.repository, bs.branch,
+                          COUNT(DISTINCT tf.build_status_id) AS failed,
+                          (SELECT COUNT(*)
+                             FROM build_status bs2
+                            WHERE bs2.repository = bs.repository
+                              AND bs2.branch = bs.branch
+                              AND bs2.run_tests = 1
+                              AND bs2.id >= MIN(bs.id)) AS builds,
+                          MAX(bs.start_time_local) AS last_failure
+                     FROM test_failures tf
+                     JOIN build_status bs
+                       ON bs.id = tf.build_status_id
+                    WHERE tf.test_name = ?
+                 GROUP BY bs.repository, bs.branch
+                 ORDER BY bs.repository, bs.branch"""
+        return self.execute_query(query, [test_name])
+
+
+
+    # fetch_build_status()
+    #
+    # fetch any number of build status log entries, including the additional data
+    # every build and its additional data are read in one joined query
+    #
+    # parameter:
+    #  - self
+    #  - list with IDs
+    # return:
+    #  - dictionary with the data for every found log entry, the ID is the key
+    def fetch_build_status(self, ids):
+        result = {}
+        ids = list(ids)
+        # stay below the limit for query parameters
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            condition = "bs.id IN (" + ", ".join(['?'] * len(chunk)) + ")"
+            for data in self.fetch_build_status_where(condition, chunk):
+                result[data['id']] = data
+
+        return result
+
+
+
+    # fetch_build_status_where()
+    #
+    # fetch the build status log entries matching a condition, including the additional data
+    # the condition refers to the build_status table as "bs"
+    #
+    # parameter:
+    #  - self
+    #  - condition
+    #  - list with parameters
+    # return:
+    #  - list with the data for every log entry, ordered by ID
+    def fetch_build_status_where(self, condition, param):
+        query = """SELECT bs.id, bs.repository, bs.repository_type, bs.branch, bs.revision, bs.is_head, bs.is_buildfarm, bs.orca,
+                          bs.start_time, bs.start_time_local,
+                          bs.run_git_update, bs.run_configure, bs.run_make, bs.run_install, bs.run_tests, bs.extra_patches,
+                          bs.result_git_update, bs.result_configure, bs.result_make, bs.result_install, bs.result_tests, bs.result_portcheck,
+                          bs.time_git_update, bs.time_configure, bs.time_make, bs.time_install, bs.time_tests,
+                          bs.extra_configure, bs.extra_make, bs.extra_install, bs.extra_tests, bs.patches, bs.errorstr,
+                          bs.run_extra_targets, bs.test_locales,
+                          bs.pg_majorversion, bs.pg_version, bs.pg_version_num, bs.pg_version_str,
+                          bs.gp_majorversion, bs.gp_version, bs.gp_version_num,
+                          bs.ccache_hits, bs.ccache_misses, bs.ccache_size, bs.ccache_size_delta,
+                          bs.result_overall, bs.failed_stage,
+                          ad.data_key, ad.data_value
+                     FROM build_status bs
+                LEFT JOIN build_additional_data ad
+                       ON ad.build_status_id = bs.id
+                    WHERE """ + condition + """
+                 ORDER BY bs.id"""
+
+        result = []
+        for row in self.iterate_query(query, param):
+            # one row per additional data entry, the build columns repeat
+            if (len(result) == 0 or result[-1]['id'] != row['id']):
+                # data is a sqlite3.Row object, and does not support assignments
+                data = dict(row)
+                del data['data_key']
+                del data['data_value']
+                result.append(data)
             # skip all keys which are integers
-            k = e['data_key']
-            try:
-                k2 = int(k)
-            except ValueError:
-                # if it's an exception, it's not an integer
-                data[k] = e['data_value']
+            k = row['data_key']
+            if (k is not None and not k.lstrip('-').isdigit()):
+                result[-1][k] = row['data_value']
+
+        return result
 
-        return data
+
+
+    # fetch_specific_build_status()
+    #
+    # fetch a specific build status log entry
+    #
+    # parameter:
+    #  - self
+    #  - id
+    # return:
+    #  - data for specific log entry, or None
+    def fetch_specific_build_status(self, id):
+        return self.fetch_build_status([id]).get(id)
 
 
 
@@ -466,32 +906,33 @@ class Database:
         else:
             is_buildfarm = 0
 
+        # the ID is looked up in a subquery, the build is fetched in the same query
         if (start_time is None):
-            query = """SELECT id
-                         FROM build_status
-                        WHERE is_buildfarm = ?
-                          AND repository = ?
-                          AND branch = ?
-                          AND revision = ?
-                     ORDER BY start_time DESC, id DESC
-                        LIMIT 1"""
+            condition = """bs.id = (SELECT id
+                                      FROM build_status
+                                     WHERE is_buildfarm = ?
+                                       AND repository = ?
+                                       AND branch = ?
+                                       AND revision = ?
+                                  ORDER BY start_time DESC, id DESC
+                                     LIMIT 1)"""
             param = [is_buildfarm, repository, branch, revision]
         else:
-            query = """SELECT id
-                         FROM build_status
-                        WHERE is_buildfarm = ?
-                          AND repository = ?
-                          AND branch = ?
-                          AND revision = ?
-                          AND start_time = ?
-                     ORDER BY start_time DESC, id DESC
-                        LIMIT 1"""
+            condition = """bs.id = (SELECT id
+                                      FROM build_status
+                                     WHERE is_buildfarm = ?
+                                       AND repository = ?
+                                       AND branch = ?
+                                       AND revision = ?
+                                       AND start_time = ?
+                                  ORDER BY start_time DESC, id DESC
+                                     LIMIT 1)"""
             param = [is_buildfarm, repository, branch, revision, start_time]
-        result = self.execute_one(query, param)
+        result = self.fetch_build_status_where(condition, param)
         # no result
-        if (result is None):
+        if (len(result) == 0):
             return False
-        return self.fetch_specific_build_status(result['id'])
+        return result[0]
 
 
 
@@ -520,122 +961,249 @@ class Database:
         # this is scanning the log table for the first entry (timewise) which does
         # not match the current revision and is older than the current revision
         if (without_error is False):
-            query = """SELECT id
-                         FROM build_status
-                        WHERE is_buildfarm = ?
-                          AND repository = ?
-                          AND branch = ?
-                          AND revision != ?
-                          AND id < ?
-                     ORDER BY start_time DESC, id DESC
-                        LIMIT 1"""
+            success = ""
         else:
-            query = """SELECT id
-                         FROM build_status
-                        WHERE is_buildfarm = ?
-                          AND repository = ?
-                          AND branch = ?
-                          AND revision != ?
-                          AND id < ?
-                          AND result_configure = 0
-                          AND result_make = 0
-                          AND result_install = 0
-                          AND result_tests = 0
-                     ORDER BY start_time DESC, id DESC
-                        LIMIT 1"""
-        result = self.execute_one(query, [is_buildfarm, repository, branch, revision, this_id])
+            success = "AND result_overall = 0"
+        condition = """bs.id = (SELECT id
+                                  FROM build_status
+                                 WHERE is_buildfarm = ?
+                                   AND repository = ?
+                                   AND branch = ?
+                                   AND revision != ?
+                                   AND id < ?
+                                   """ + success + """
+                              ORDER BY start_time DESC, id DESC
+                                 LIMIT 1)"""
+        result = self.fetch_build_status_where(condition, [is_buildfarm, repository, branch, revision, this_id])
         # no result
-        if (result is None):
+        if (len(result) == 0):
             return False
-        return self.fetch_specific_build_status(result['id'])
+        return result[0]
+
+
+
+    # compact_history()
+    #
+    # roll up old builds into daily statistics per branch (table: build_history), and delete them
+    # kept in full are the newest builds of every branch, the last successful build of every
+    # branch (the buildfarm report lists the changes since), and all other builds of the same days,
+    # this way a day is always rolled up at once
+    # finished buildfarm jobs are kept in the same number per branch, jobs which --add-jobs
+    # could add again (fixed revision, current HEAD) are always kept
+    #
+    # parameter:
+    #  - self
+    #  - number of builds to keep per branch
+    # return:
+    #  - dictionary with number of rolled up builds, days, and deleted jobs
+    def compact_history(self, keep_builds):
+        stats = {'builds': 0, 'days': 0, 'jobs': 0}
+        with self.transaction():
+            branches = self.execute_query("SELECT DISTINCT repository, branch FROM build_status", [])
+            for branch in branches:
+                query = """SELECT id, is_buildfarm, start_time_local, result_overall,
+                                  """ + ", ".join(['run_' + step + ', time_' + step for step in self.history_steps()]) + """
+                             FROM build_status
+                            WHERE repository = ?
+                              AND branch = ?
+                         ORDER BY start_time DESC, id DESC"""
+                builds = self.execute_query(query, [branch['repository'], branch['branch']])
+
+                keep_days = set()
+                last_success = set()
+                for i, build in enumerate(builds):
+                    if (i < keep_builds):
+                        keep_days.add(build['start_time_local'][:10])
+                    elif (build['result_overall'] == 0 and build['is_buildfarm'] not in last_success):
+                        keep_days.add(build['start_time_local'][:10])
+                    if (build['result_overall'] == 0):
+                        last_success.add(build['is_buildfarm'])
+
+                days = {}
+                for build in builds:
+                    day = build['start_time_local'][:10]
+                    if (day in keep_days):
+                        continue
+                    days.setdefault((build['is_buildfarm'], day), []).append(build)
+                for (is_buildfarm, day), day_builds in sorted(days.items()):
+                    self.roll_up_builds(branch['repository'], branch['branch'], is_buildfarm, day, day_builds)
+                    ids = [b['id'] for b in day_builds]
+                    for table, column in [['test_failures', 'build_status_id'], ['build_additional_data', 'build_status_id'],
+                                          ['build_steps', 'build_status_id'], ['build_status', 'id']]:
+                        # stay below the limit for query parameters
+                        for start in range(0, len(ids), 500):
+                            chunk = ids[start:start + 500]
+                            self.execute_one("DELETE FROM " + table + " WHERE " + column + " IN (" + ", ".join(['?'] * len(chunk)) + ")", chunk)
+                    stats['builds'] += len(ids)
+                    stats['days'] += 1
+
+            # additional data of builds which no longer exist
+            for table in ['build_additional_data', 'test_failures', 'build_steps']:
+                self.execute_one("DELETE FROM " + table + " WHERE build_status_id NOT IN (SELECT id FROM build_status)", [])
+
+            query = """SELECT COUNT(*) AS count
+                         FROM buildfarm_jobs
+                        WHERE finished = 1"""
+            jobs_before = self.execute_one(query, [])['count']
+            # finished jobs prevent that --add-jobs adds the same job again (unique job key):
+            # jobs for a fixed revision, and all jobs (every variant) for the current HEAD
+            # of a branch are always kept, only jobs for outdated HEAD revisions are deleted
+            query = """DELETE FROM buildfarm_jobs
+                        WHERE finished = 1
+                          AND is_head = 1
+                          AND revision != (SELECT latest.revision
+                                             FROM buildfarm_jobs latest
+                                            WHERE latest.is_head = 1
+                                              AND latest.repository = buildfarm_jobs.repository
+                                              AND latest.branch = buildfarm_jobs.branch
+                                         ORDER BY latest.added_ts DESC, latest.id DESC
+                                            LIMIT 1)
+                          AND id NOT IN (SELECT keep.id
+                                           FROM buildfarm_jobs keep
+                                          WHERE keep.finished = 1
+                                            AND keep.repository = buildfarm_jobs.repository
+                                            AND keep.branch = buildfarm_jobs.branch
+                                       ORDER BY keep.executed_ts DESC, keep.id DESC
+                                          LIMIT ?)"""
+            self.execute_one(query, [keep_builds])
+            query = """SELECT COUNT(*) AS count
+                         FROM buildfarm_jobs
+                        WHERE finished = 1"""
+            stats['jobs'] = jobs_before - self.execute_one(query, [])['count']
+
+        # give the space back, outside of the transaction
+        self.backend.vacuum()
+
+        return stats
+
+
+
+    # history_steps()
+    #
+    # steps with timing statistics in build_history
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - list with step names (columns: run_<step>, time_<step> in build_status)
+    def history_steps(self):
+        return ['git_update', 'configure', 'make', 'install', 'tests']
+
 
 
+    # roll_up_builds()
+    #
+    # add the builds of one day to the daily statistics
+    #
+    # parameter:
+    #  - self
+    #  - repository
+    #  - branch
+    #  - buildfarm build (1/0)
+    #  - day (YYYY-MM-DD, local time)
+    #  - list with builds of this day
+    # return:
+    #  none
+    def roll_up_builds(self, repository, branch, is_buildfarm, day, builds):
+        values = {'builds': len(builds), 'builds_ok': len([b for b in builds if (b['result_overall'] == 0)])}
+        for step in self.history_steps():
+            times = sorted([b['time_' + step] for b in builds if (b['run_' + step] == 1 and b['time_' + step] is not None)])
+            values['runs_' + step] = len(times)
+            values['mean_' + step] = (sum(times) / len(times)) if (len(times) > 0) else None
+            # nearest rank
+            values['p95_' + step] = times[int(math.ceil(0.95 * len(times))) - 1] if (len(times) > 0) else None
 
-    # buildfarm_job_exists()
+        query = """SELECT *
+                     FROM build_history
+                    WHERE repository = ?
+                      AND branch = ?
+                      AND is_buildfarm = ?
+                      AND day = ?"""
+        existing = self.execute_one(query, [repository, branch, is_buildfarm, day])
+        if (existing is not None):
+            # only happens if builds show up for a day which was already rolled up (clock changes),
+            # the means are merged exactly, the 95th percentile is approximated by the maximum
+            values['builds'] += existing['builds']
+            values['builds_ok'] += existing['builds_ok']
+            for step in self.history_steps():
+                runs = values['runs_' + step] + existing['runs_' + step]
+                if (existing['runs_' + step] > 0 and values['runs_' + step] > 0):
+                    values['mean_' + step] = (values['mean_' + step] * values['runs_' + step] + existing['mean_' + step] * existing['runs_' + step]) / runs
+                    values['p95_' + step] = max(values['p95_' + step], existing['p95_' + step])
+                elif (existing['runs_' + step] > 0):
+                    values['mean_' + step] = existing['mean_' + step]
+                    values['p95_' + step] = existing['p95_' + step]
+                values['runs_' + step] = runs
+            self.execute_one("DELETE FROM build_history WHERE id = ?", [existing['id']])
+
+        columns = sorted(values.keys())
+        query = """INSERT INTO build_history
+                               (repository, branch, is_buildfarm, day, """ + ", ".join(columns) + """)
+                        VALUES (?, ?, ?, ?, """ + ", ".join(['?'] * len(columns)) + ")"
+        self.execute_one(query, [repository, branch, is_buildfarm, day] + [values[c] for c in columns])
+
+
+
+    # job_key()
     #
-    # verify if a specific buildfarm job exists in the queue or history
+    # canonical identity of a buildfarm job: a hash over everything which makes a build different
     #
     # parameter:
     #  - self
     #  - repository name
     #  - branch name
     #  - revision string
+    #  - Orca enabled (True/False, or 1/0)
     #  - extra configure string
     #  - extra make string
     #  - extra install string
     #  - extra tests string
-    #  - optional: Orca enabled (default: exclude)
-    #  - optional: job already finished (default: exclude)
+    #  - extra test targets string
+    #  - test locales string
     # return:
-    #  - True/False
-    def buildfarm_job_exists(self, repository, branch, revision, extra_configure, extra_make, extra_install, extra_tests, run_extra_targets, test_locales, orca = None, finished = None):
-        query = """SELECT COUNT(*) AS count
-                     FROM buildfarm_jobs
-                    WHERE repository = ?
-                      AND branch = ?
-                      AND revision = ?
-                      AND extra_configure = ?
-                      AND extra_make = ?
-                      AND extra_install = ?
-                      AND extra_tests = ?
-                      AND run_extra_targets = ?
-                      AND test_locales = ?"""
-        params = [repository, branch, revision, extra_configure, extra_make, extra_install, extra_tests, run_extra_targets, test_locales]
-        if (orca is True):
-            query += " AND orca = ?"
-            params.append("1")
-        if (orca is False):
-            query += " AND orca = ?"
-            params.append("0")
-
-        if (finished is True):
-            query += " AND finished = ?"
-            params.append("1")
-        if (finished is False):
-            query += " AND finished = ?"
-            params.append("0")
-
-        result = self.execute_one(query, params)
-        if (result['count'] > 0):
-            return True
-        else:
-            return False
+    #  - job key (hex string)
+    def job_key(self, repository, branch, revision, orca, extra_configure, extra_make, extra_install, extra_tests, run_extra_targets, test_locales):
+        orca = 1 if (orca in [1, '1']) else 0
+        # JSON keeps the fields apart, no separator can show up in a value
+        key = json.dumps([repository, branch, revision, orca, extra_configure, extra_make, extra_install, extra_tests,
+                          run_extra_targets, test_locales])
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
 
 
 
     # add_bildfarm_job()
     #
-    # add a new buildfarm job
+    # add a new buildfarm job, unless the same job is already in the queue or history
+    # safe to run concurrently, the job key is unique
     #
     # parameter:
     #  - self
     #  - buildfarm job data object
     # return:
-    #  none
-    def add_bildfarm_job(self, job_in):
-        # create a copy, because we modify the content
-        job = copy.deepcopy(job_in)
-        if (job['is_head'] is True):
-            job['is_head'] = 1
-        else:
-            job['is_head'] = 0
+    #  - True/False (False if the job exists)
+    def add_bildfarm_job(self, job):
+        is_head = 1 if (job['is_head'] is True) else 0
+        orca = 1 if (job['orca'] is True) else 0
 
-        if (job['orca'] is True):
-            job['orca'] = 1
-        else:
-            job['orca'] = 0
+        job_key = self.job_key(job['repository'], job['branch'], job['revision'], orca,
+                               job['extra-configure'], job['extra-make'], job['extra-install'], job['extra-tests'],
+                               job['run-extra-targets'], job['test-locales'])
 
         query = """INSERT INTO buildfarm_jobs
                                (finished, added_ts, executed_ts, repository, branch, revision, is_head,
                                 orca, extra_configure, extra_make, extra_install, extra_tests,
-                                run_extra_targets, test_locales)
-                        VALUES (0, ?, 0, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+                                run_extra_targets, test_locales, job_key)
+                        VALUES (0, ?, 0, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT (job_key) DO NOTHING"""
 
-        param = [job['added_ts'], job['repository'], job['branch'], job['revision'], job['is_head'],
-                 job['orca'], job['extra-configure'], job['extra-make'], job['extra-install'], job['extra-tests'],
-                 job['run-extra-targets'], job['test-locales']]
+        param = [job['added_ts'], job['repository'], job['branch'], job['revision'], is_head,
+                 orca, job['extra-configure'], job['extra-make'], job['extra-install'], job['extra-tests'],
+                 job['run-extra-targets'], job['test-locales'], job_key]
 
-        self.execute_one(query, param)
+        inserted = self.backend.execute(query, param).rowcount
+        self.commit_statement()
+
+        return (inserted > 0)
 
 
 
@@ -767,12 +1335,22 @@ class Database:
     # return:
     #  - True/False
     def table_exist(self, table):
-        query = "SELECT name FROM sqlite_master WHERE type='table' AND name=?"
-        result = self.execute_one(query, [table])
-        if (result is None):
-            return False
-        else:
-            return True
+        return self.backend.table_exist(table)
+
+
+
+    # column_exist()
+    #
+    # verify if a column exists in a table
+    #
+    # parameter:
+    #  - self
+    #  - table name
+    #  - column name
+    # return:
+    #  - True/False
+    def column_exist(self, table, column):
+        return self.backend.column_exist(table, column)
 
 
 
@@ -829,7 +1407,11 @@ class Database:
                 pg_version_str TEXT,
                 gp_majorversion TEXT,
                 gp_version TEXT,
-                gp_version_num TEXT
+                gp_version_num TEXT,
+                ccache_hits INTEGER,
+                ccache_misses INTEGER,
+                ccache_size INTEGER,
+                ccache_size_delta INTEGER
                 )"""
         self.run_query(query)
 
@@ -856,6 +1438,91 @@ class Database:
 
 
 
+    # table_test_failures()
+    #
+    # create the 'test_failures' table
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  none
+    def table_test_failures(self):
+        query = """CREATE TABLE test_failures (
+                id INTEGER PRIMARY KEY NOT NULL,
+                build_status_id INTEGER NOT NULL,
+                suite TEXT NOT NULL,
+                locale TEXT,
+                test_name TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                diff TEXT NOT NULL DEFAULT '',
+                FOREIGN KEY (build_status_id) REFERENCES build_status(id)
+                )"""
+        self.run_query(query)
+        # "which builds failed in this test" is the common question
+        self.run_query("CREATE INDEX test_failures_test_name ON test_failures (test_name, build_status_id)")
+        self.run_query("CREATE INDEX test_failures_build_status_id ON test_failures (build_status_id)")
+
+
+
+    # table_build_history()
+    #
+    # create the 'build_history' table: daily statistics per branch of compacted builds
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  none
+    def table_build_history(self):
+        steps = []
+        for step in self.history_steps():
+            steps.append("""runs_%s INTEGER NOT NULL,
+                mean_%s REAL,
+                p95_%s REAL,""" % (step, step, step))
+        query = """CREATE TABLE build_history (
+                id INTEGER PRIMARY KEY NOT NULL,
+                repository TEXT NOT NULL,
+                branch TEXT NOT NULL,
+                is_buildfarm BOOLEAN NOT NULL,
+                day TEXT NOT NULL,
+                builds INTEGER NOT NULL,
+                builds_ok INTEGER NOT NULL,
+                """ + """
+                """.join(steps) + """
+                UNIQUE(repository, branch, is_buildfarm, day)
+                )"""
+        self.run_query(query)
+
+
+
+    # table_build_steps()
+    #
+    # create the 'build_steps' table: every step and test stage of a build
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  none
+    def table_build_steps(self):
+        query = """CREATE TABLE build_steps (
+                id INTEGER PRIMARY KEY NOT NULL,
+                build_status_id INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                step TEXT,
+                locale TEXT,
+                result TEXT,
+                exit_code INTEGER,
+                started REAL,
+                duration REAL,
+                log TEXT,
+                FOREIGN KEY (build_status_id) REFERENCES build_status(id)
+                )"""
+        self.run_query(query)
+        # runtime of a buildfarm step over time, like: ContribCheck-C in the last 90 days
+        self.run_query("CREATE INDEX build_steps_step ON build_steps (step, started, build_status_id)")
+        self.run_query("CREATE INDEX build_steps_build_status_id ON build_steps (build_status_id)")
+
+
+
     # table_buildfarm_jobs()
     #
     # create the 'buildfarm_jobs' table
@@ -0,0 +1,234 @@
+import sys
+import logging
+import sqlite3
+
+
+# storage backends for Database
+# a backend handles the connection, transactions, and everything specific to one
+# database product; the queries in Database stay portable SQL with "?" placeholders
+
+class SQLiteBackend:
+
+    def __init__(self, path, pragmas):
+        self.path = path
+        # the cron job adding jobs and the job executor use the database at the same time,
+        # wait for locks instead of failing with "database is locked"
+        self.connection = sqlite3.connect(path, timeout = 60)
+        self.connection.row_factory = sqlite3.Row
+        # readers do not block the writer, and the writer does not block readers
+        self.execute('PRAGMA journal_mode = WAL')
+        for name in sorted(pragmas.keys()):
+            self.set_pragma(name, pragmas[name])
+        self.commit_if_needed()
+
+
+
+    # set_pragma()
+    #
+    # set a PRAGMA for this connection
+    #
+    # parameter:
+    #  - self
+    #  - pragma name
+    #  - value
+    # return:
+    #  none
+    def set_pragma(self, name, value):
+        # PRAGMA does not support parameters, only allow plain names and values
+        if not (str(name).replace('_', '').isalnum() and str(value).replace('_', '').replace('-', '').isalnum()):
+            logging.error("invalid database pragma: " + str(name) + " = " + str(value))
+            sys.exit(1)
+        logging.debug("database pragma: " + str(name) + " = " + str(value))
+        self.execute('PRAGMA %s = %s' % (name, value))
+
+
+
+    # execute()
+    #
+    # execute a query
+    #
+    # parameter:
+    #  - self
+    #  - query
+    #  - optional: list with parameters
+    # return:
+    #  - cursor
+    def execute(self, query, param = []):
+        cur = self.connection.cursor()
+        cur.execute(query, param)
+        return cur
+
+
+
+    # begin()
+    #
+    # start a transaction, and take the write lock right away
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  none
+    def begin(self):
+        self.connection.execute('BEGIN IMMEDIATE')
+
+
+
+    # commit()
+    #
+    # commit the current transaction
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  none
+    def commit(self):
+        self.connection.commit()
+
+
+
+    # rollback()
+    #
+    # roll back the current transaction
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  none
+    def rollback(self):
+        self.connection.rollback()
+
+
+
+    # commit_if_needed()
+    #
+    # commit a data change, read-only statements do not open a transaction
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  none
+    def commit_if_needed(self):
+        if (self.connection.in_transaction is True):
+            self.connection.commit()
+
+
+
+    # close()
+    #
+    # close the connection
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  none
+    def close(self):
+        self.connection.close()
+
+
+
+    # last_insert_id()
+    #
+    # return the ID of the last inserted row
+    #
+    # parameter:
+    #  - self
+    #  - cursor used for the INSERT
+    # return:
+    #  - ID
+    def last_insert_id(self, cur):
+        return cur.lastrowid
+
+
+
+    # schema_version()
+    #
+    # return the schema version of the database
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - version number (0 for a new database)
+    def schema_version(self):
+        return self.execute('PRAGMA user_version').fetchone()[0]
+
+
+
+    # set_schema_version()
+    #
+    # store the schema version of the database
+    #
+    # parameter:
+    #  - self
+    #  - version number
+    # return:
+    #  none
+    def set_schema_version(self, version):
+        # PRAGMA does not support parameters
+        self.execute('PRAGMA user_version = %d' % int(version))
+
+
+
+    # table_exist()
+    #
+    # verify if a table exists
+    #
+    # parameter:
+    #  - self
+    #  - table name
+    # return:
+    #  - True/False
+    def table_exist(self, table):
+        result = self.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", [table]).fetchone()
+        return (result is not None)
+
+
+
+    # column_exist()
+    #
+    # verify if a column exists in a table
+    #
+    # parameter:
+    #  - self
+    #  - table name
+    #  - column name
+    # return:
+    #  - True/False
+    def column_exist(self, table, column):
+        # there is no sane way to quote identifiers in Python for SQLite
+        # assume that the table name is safe
+        for row in self.execute('PRAGMA table_info("%s")' % table).fetchall():
+            if (row['name'] == column):
+                return True
+        return False
+
+
+
+    # analyze()
+    #
+    # update the statistics for the query planner
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  none
+    def analyze(self):
+        self.execute('ANALYZE')
+
+
+
+    # vacuum()
+    #
+    # give free space back to the filesystem
+    # with "auto_vacuum = INCREMENTAL" only the free pages are released, otherwise the database is rebuilt
+    # must not run inside a transaction
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  none
+    def vacuum(self):
+        if (self.execute('PRAGMA auto_vacuum').fetchone()[0] == 2):
+            self.execute('PRAGMA incremental_vacuum').fetchall()
+        else:
+            self.execute('VACUUM')
+        self.commit_if_needed()
@@ -0,0 +1,181 @@
+import os
+import logging
+import threading
+import collections
+
+
+# a log is never cut below this size, even if the job budget is used up:
+# the first and the last lines usually explain what went wrong
+MIN_LIMIT = 64 * 1024
+# bytes read at once from the output of a command
+CHUNK_SIZE = 64 * 1024
+
+
+# size budgets for logfiles
+# a log which exceeds its budget keeps the beginning and the end, with a marker in between
+# one instance per Build
+
+class LogBudget:
+
+    def __init__(self, step_budget, job_budget):
+        # bytes per logfile, 0: unlimited
+        self.step_budget = step_budget
+        # bytes for all logfiles of a job, 0: unlimited
+        self.job_budget = job_budget
+        self.used = 0
+        # test stages write their logs in parallel
+        self.lock = threading.Lock()
+
+
+
+    # limit()
+    #
+    # figure out the budget for the next logfile
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - number of bytes, 0 for unlimited
+    def limit(self):
+        limit = self.step_budget
+        if (self.job_budget > 0):
+            with self.lock:
+                remaining = max(self.job_budget - self.used, MIN_LIMIT)
+            if (limit == 0 or remaining < limit):
+                limit = remaining
+        return limit
+
+
+
+    # split()
+    #
+    # split a log into the part which is kept at the beginning, and the part kept at the end
+    # the kept bytes are charged to the job budget
+    #
+    # parameter:
+    #  - self
+    #  - size of the log
+    # return:
+    #  - number of bytes at the beginning, number of bytes at the end, marker (bytes, or None if nothing is dropped)
+    def split(self, size):
+        limit = self.limit()
+        if (limit == 0 or size <= limit):
+            self.charge(size)
+            return size, 0, None
+
+        head = limit // 2
+        tail = limit - head
+        self.charge(limit)
+        logging.debug("log exceeds budget, drop " + str(size - limit) + " bytes")
+        return head, tail, self.marker(size, limit)
+
+
+
+    # charge()
+    #
+    # charge bytes to the job budget
+    #
+    # parameter:
+    #  - self
+    #  - number of bytes
+    # return:
+    #  none
+    def charge(self, size):
+        with self.lock:
+            self.used += size
+
+
+
+    # marker()
+    #
+    # the text inserted where a log was cut
+    #
+    # parameter:
+    #  - self
+    #  - original size of the log
+    #  - number of bytes kept
+    # return:
+    #  - marker (bytes)
+    def marker(self, size, limit):
+        text = os.linesep + os.linesep
+        text += "=" * 15 + " log truncated: " + str(size - limit) + " of " + str(size) + " bytes dropped"
+        text += " (budget: " + str(limit) + " bytes) " + "=" * 15
+        text += os.linesep + os.linesep
+        return text.encode('utf-8')
+
+
+
+    # read_stream()
+    #
+    # read the output of a command, and apply the budget while reading
+    # only the beginning and a bounded buffer for the end are kept in memory,
+    # the kept bytes are charged when the log is written, see charge()
+    #
+    # parameter:
+    #  - self
+    #  - stream (file object, binary)
+    # return:
+    #  - log (bytes)
+    def read_stream(self, stream):
+        limit = self.limit()
+        head_size = limit // 2
+        tail_size = limit - head_size
+        head = []
+        head_len = 0
+        tail = collections.deque()
+        tail_len = 0
+        size = 0
+        for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+            size += len(chunk)
+            if (limit == 0):
+                head.append(chunk)
+                continue
+            if (head_len < head_size):
+                head.append(chunk[:head_size - head_len])
+                chunk = chunk[head_size - head_len:]
+                head_len += len(head[-1])
+                if (len(chunk) == 0):
+                    continue
+            tail.append(chunk)
+            tail_len += len(chunk)
+            # drop chunks from the end buffer which are no longer needed
+            while (tail_len - len(tail[0]) >= tail_size):
+                tail_len -= len(tail.popleft())
+
+        if (limit == 0 or size <= limit):
+            return b''.join(head) + b''.join(tail)
+
+        logging.debug("log exceeds budget, drop " + str(size - limit) + " bytes")
+        tail = b''.join(tail)
+        return b''.join(head) + self.marker(size, limit) + tail[len(tail) - tail_size:]
+
+
+
+    # truncate_file()
+    #
+    # apply the budget to a logfile on disk, the file is changed in place
+    # the timestamps of the file are kept, the buildfarm sorts the logs by mtime
+    #
+    # parameter:
+    #  - self
+    #  - filename
+    # return:
+    #  - False if the file was not truncated, otherwise start and end of the dropped
+    #    part (byte offsets), and the length of the marker which replaced it
+    def truncate_file(self, filename):
+        st = os.stat(filename)
+        head, tail, marker = self.split(st.st_size)
+        if (marker is None):
+            return False
+
+        f = open(filename, 'r+b')
+        f.seek(st.st_size - tail)
+        end = f.read(tail)
+        f.seek(head)
+        f.write(marker)
+        f.write(end)
+        f.truncate()
+        f.close()
+        os.utime(filename, (st.st_atime, st.st_mtime))
+
+        return head, st.st_size - tail, len(marker)
@@ -0,0 +1,302 @@
+import os
+import json
+import time
+import logging
+import threading
+
+
+# name of the manifest in the build directory
+MANIFEST_NAME = 'buildclient_manifest.json'
+
+
+# per-job list of steps, with exit code, timing, and the logfiles each step wrote
+# for every attached section in a logfile the byte offset of the header is recorded
+# one instance per Build, or per build directory when reading the manifest
+
+class LogManifest:
+
+    def __init__(self, build_dir):
+        self.build_dir = build_dir
+        self.filename = os.path.join(build_dir, MANIFEST_NAME)
+        self.steps = {}
+        # test stages write their logs in parallel
+        self.lock = threading.Lock()
+
+
+
+    # step()
+    #
+    # return the entry for a step, create it if necessary
+    # the caller must hold the lock
+    #
+    # parameter:
+    #  - self
+    #  - step name
+    # return:
+    #  - dictionary with step data
+    def step(self, name):
+        if not (name in self.steps):
+            self.steps[name] = {'name': name, 'buildfarm_step': None, 'locale': None, 'result': None, 'exit_code': None,
+                                'started': None, 'duration': None, 'logs': []}
+        return self.steps[name]
+
+
+
+    # log()
+    #
+    # return the entry for a logfile of a step, create it if necessary
+    # the caller must hold the lock
+    #
+    # parameter:
+    #  - self
+    #  - step name
+    #  - logfile name
+    # return:
+    #  - dictionary with logfile data
+    def log(self, name, filename):
+        filename = os.path.relpath(filename, self.build_dir)
+        step = self.step(name)
+        for log in step['logs']:
+            if (log['file'] == filename):
+                return log
+        log = {'file': filename, 'size': None, 'compression': None, 'sections': []}
+        step['logs'].append(log)
+        return log
+
+
+
+    # add_log()
+    #
+    # record a logfile written by a step
+    #
+    # parameter:
+    #  - self
+    #  - step name
+    #  - logfile name
+    # return:
+    #  none
+    def add_log(self, name, filename):
+        with self.lock:
+            self.log(name, filename)
+
+
+
+    # add_section()
+    #
+    # record a section attached to a logfile
+    #
+    # parameter:
+    #  - self
+    #  - step name
+    #  - logfile name
+    #  - byte offset of the section header
+    #  - section header
+    # return:
+    #  none
+    def add_section(self, name, filename, offset, header):
+        with self.lock:
+            self.log(name, filename)['sections'].append({'offset': offset, 'header': header.strip().strip('=').strip()})
+
+
+
+    # cut_log()
+    #
+    # record that a part of a logfile was replaced (see LogBudget.truncate_file())
+    # sections behind the cut move, sections inside the cut are gone
+    #
+    # parameter:
+    #  - self
+    #  - logfile name
+    #  - start of the cut (byte offset)
+    #  - end of the cut (byte offset)
+    #  - length of the replacement
+    # return:
+    #  none
+    def cut_log(self, filename, start, end, length):
+        filename = os.path.relpath(filename, self.build_dir)
+        with self.lock:
+            for step in self.steps.values():
+                for log in step['logs']:
+                    if (log['file'] != filename):
+                        continue
+                    sections = []
+                    for section in log['sections']:
+                        if (section['offset'] >= end):
+                            section['offset'] += length - (end - start)
+                        elif (section['offset'] >= start):
+                            continue
+                        sections.append(section)
+                    log['sections'] = sections
+
+
+
+    # compress_log()
+    #
+    # record that a logfile was compressed
+    # size and section offsets still refer to the uncompressed content
+    #
+    # parameter:
+    #  - self
+    #  - logfile name
+    #  - name of the compressed logfile
+    #  - compression method (gzip, zstd)
+    # return:
+    #  none
+    def compress_log(self, filename, target, method):
+        filename = os.path.relpath(filename, self.build_dir)
+        with self.lock:
+            for step in self.steps.values():
+                for log in step['logs']:
+                    if (log['file'] == filename):
+                        if (log['size'] is None):
+                            log['size'] = os.path.getsize(os.path.join(self.build_dir, filename))
+                        log['file'] = os.path.relpath(target, self.build_dir)
+                        log['compression'] = method
+
+
+
+    # update_step()
+    #
+    # set data (like result, exit code, timing) for a step
+    #
+    # parameter:
+    #  - self
+    #  - step name
+    #  - values to set
+    # return:
+    #  none
+    def update_step(self, name, **values):
+        with self.lock:
+            self.step(name).update(values)
+
+
+
+    # write()
+    #
+    # write the manifest into the build directory
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - True/False
+    def write(self):
+        with self.lock:
+            # steps in the order they started, steps which never ran at the end
+            steps = sorted(self.steps.values(), key = lambda s: (s['started'] is None, s['started']))
+            for step in steps:
+                for log in step['logs']:
+                    path = os.path.join(self.build_dir, log['file'])
+                    if (log.get('compression') is None and os.path.exists(path)):
+                        log['size'] = os.path.getsize(path)
+            data = {'version': 1, 'written': time.time(), 'steps': steps}
+
+        tmp_file = self.filename + '.tmp'
+        try:
+            f = open(tmp_file, 'w')
+            json.dump(data, f, indent = 1)
+            f.close()
+            os.rename(tmp_file, self.filename)
+        except (OSError, IOError) as e:
+            logging.error("failed to write manifest: " + self.filename)
+            logging.error("error: " + str(e))
+            return False
+
+        return True
+
+
+
+    # load()
+    #
+    # read the manifest of a build directory
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - True/False (False if there is no readable manifest)
+    def load(self):
+        if not (os.path.isfile(self.filename)):
+            return False
+        try:
+            f = open(self.filename, 'r')
+            data = json.load(f)
+            f.close()
+        except (OSError, IOError, ValueError) as e:
+            logging.error("failed to read manifest: " + self.filename)
+            logging.error("error: " + str(e))
+            return False
+
+        with self.lock:
+            self.steps = {}
+            for step in data['steps']:
+                self.steps[step['name']] = step
+
+        return True
+
+
+
+    # ordered_steps()
+    #
+    # return all steps, in the order they were written
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - list with step dictionaries
+    def ordered_steps(self):
+        with self.lock:
+            return sorted(self.steps.values(), key = lambda s: (s['started'] is None, s['started']))
+
+
+
+    # completed_steps()
+    #
+    # return the buildfarm steps which completed successfully
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - list with buildfarm step names
+    def completed_steps(self):
+        return [s['buildfarm_step'] for s in self.ordered_steps() if (s['buildfarm_step'] is not None and s['result'] == 'ok')]
+
+
+
+    # main_log()
+    #
+    # return the logfile which describes a step best: the buildfarm log, else the command output
+    #
+    # parameter:
+    #  - self
+    #  - step dictionary
+    # return:
+    #  - logfile name (relative to the build directory), or None
+    def main_log(self, step):
+        for log in step['logs']:
+            if (log['file'].startswith('.buildfarm-logs' + os.sep)):
+                return log['file']
+        for log in step['logs']:
+            if (log['file'].endswith('_stdout_stderr.txt')):
+                return log['file']
+        if (len(step['logs']) > 0):
+            return step['logs'][0]['file']
+        return None
+
+
+
+    # find_step()
+    #
+    # find a step by name, or by buildfarm step name
+    #
+    # parameter:
+    #  - self
+    #  - name
+    # return:
+    #  - step dictionary, or None
+    def find_step(self, name):
+        for step in self.ordered_steps():
+            if (step['name'] == name):
+                return step
+        for step in self.ordered_steps():
+            if (step['buildfarm_step'] is not None and step['buildfarm_step'].lower() == name.lower()):
+                return step
+        return None
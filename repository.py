@@ -68,7 +68,7 @@ class Repository:
                 self.database.log_build(log_data)
                 sys.exit(1)
         elif (self.repository_available_offline() is False):
-            log_data['errstr'] = 'No local copy of repository'
+            log_data['errorstr'] = 'No local copy of repository'
             self.database.log_build(log_data)
             sys.exit(1)
 
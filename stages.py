@@ -0,0 +1,279 @@
+import os
+import sys
+import logging
+import time
+import datetime
+import threading
+
+
+# one node in a StageGraph
+
+class Stage:
+
+    def __init__(self, name, function, deps, outputs, step, log_number, after = [], locale = None, report_step = None):
+        # unique name of this stage
+        self.name = name
+        # called with the stage as only argument, returns True/False
+        self.function = function
+        # names of stages which must complete successfully before this one starts
+        self.deps = deps
+        # names of stages which must be finished (with any result) before this one starts
+        self.after = after
+        # directories (or other resources) this stage writes into,
+        # stages with overlapping outputs never run at the same time
+        self.outputs = outputs
+        # buildfarm step name, or None if the stage is not reported
+        self.step = step
+        # buildfarm step reported if this stage fails,
+        # stages without an own step report the step of the suite they belong to
+        if (report_step is None):
+            report_step = step
+        self.report_step = report_step
+        # number for the logfiles, assigned in declaration order
+        self.log_number = log_number
+        # locale of the test cluster, or None
+        self.locale = locale
+        # None: did not run, True/False: result
+        self.result = None
+        # start time (seconds since the epoch) and runtime (string)
+        self.started = None
+        self.time = None
+        # free form data for the stage function
+        self.data = {}
+
+
+
+# dependency graph of build and test stages
+# stages which do not depend on each other run in parallel
+
+class StageGraph:
+
+    def __init__(self, max_parallel = 1, first_log_number = 0, continue_on_failure = False):
+        self.max_parallel = max(1, max_parallel)
+        # keep running stages which do not depend on a failed stage
+        self.continue_on_failure = continue_on_failure
+        self.next_log_number = first_log_number
+        self.stages = []
+        self.stages_by_name = {}
+        # set if a stage function called sys.exit()
+        self.exit_requested = False
+        # the stage running in the current thread
+        self.local = threading.local()
+
+
+
+    # add()
+    #
+    # add a stage to the graph
+    #
+    # parameter:
+    #  - self
+    #  - unique stage name
+    #  - function to run
+    #  - list with names of stages this one depends on (must be added before)
+    #  - list with outputs (directories) this stage writes into
+    #  - buildfarm step name (optional)
+    #  - list with names of stages which must be finished before, successful or not (optional)
+    #  - locale of the test cluster (optional)
+    #  - buildfarm step reported if the stage fails (optional, default: buildfarm step name)
+    # return:
+    #  - Stage object
+    def add(self, name, function, deps = [], outputs = [], step = None, after = [], locale = None, report_step = None):
+        if (name in self.stages_by_name):
+            logging.error("stage added twice: " + name)
+            sys.exit(1)
+        for dep in list(deps) + list(after):
+            # requiring declared dependencies keeps the graph free of cycles
+            if not (dep in self.stages_by_name):
+                logging.error("stage " + name + " depends on unknown stage: " + dep)
+                sys.exit(1)
+
+        stage = Stage(name, function, list(deps), [os.path.normpath(o) for o in outputs], step, self.next_log_number, list(after), locale, report_step)
+        self.next_log_number += 1
+        self.stages.append(stage)
+        self.stages_by_name[name] = stage
+
+        return stage
+
+
+
+    # get()
+    #
+    # return a stage by name
+    #
+    # parameter:
+    #  - self
+    #  - stage name
+    # return:
+    #  - Stage object, or None
+    def get(self, name):
+        return self.stages_by_name.get(name)
+
+
+
+    # run()
+    #
+    # run all stages, respecting dependencies and outputs
+    # after the first failure no new stages are started, running stages are finished
+    # in "continue on failure" mode only stages depending on a failed stage are skipped
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - True/False (False if a stage failed)
+    def run(self):
+        pending = list(self.stages)
+        running = []
+        failed = []
+        cond = threading.Condition()
+
+        def worker(stage):
+            self.local.stage = stage
+            stage.started = time.time()
+            t_start = datetime.datetime.now()
+            result = False
+            try:
+                result = stage.function(stage)
+            except SystemExit:
+                self.exit_requested = True
+            except Exception:
+                logging.exception("stage " + stage.name + " failed with an exception")
+            finally:
+                t_end = datetime.datetime.now()
+                cond.acquire()
+                stage.result = (result is True)
+                stage.time = "%.2f" % (t_end - t_start).total_seconds()
+                running.remove(stage)
+                if (stage.result is False):
+                    failed.append(stage)
+                cond.notify_all()
+                cond.release()
+                self.local.stage = None
+
+        cond.acquire()
+        try:
+            while True:
+                if (len(failed) == 0 or self.continue_on_failure is True):
+                    # start everything which is ready, in declaration order
+                    for stage in list(pending):
+                        if (len(running) >= self.max_parallel):
+                            break
+                        if (self.is_ready(stage) is False or self.conflicts(stage, running) is True):
+                            continue
+                        pending.remove(stage)
+                        running.append(stage)
+                        logging.debug("start stage: " + stage.name)
+                        thread = threading.Thread(target = worker, args = (stage,))
+                        thread.daemon = True
+                        thread.start()
+                if (len(running) == 0):
+                    break
+                cond.wait()
+        finally:
+            cond.release()
+
+        if (self.exit_requested is True):
+            sys.exit(1)
+
+        for stage in failed:
+            logging.debug("stage failed: " + stage.name)
+        for stage in pending:
+            logging.debug("stage not started: " + stage.name)
+
+        if (len(failed) > 0 or len(pending) > 0):
+            return False
+        return True
+
+
+
+    # current_stage()
+    #
+    # return the stage running in the calling thread
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - Stage object, or None
+    def current_stage(self):
+        return getattr(self.local, 'stage', None)
+
+
+
+    # is_ready()
+    #
+    # verify if all dependencies of a stage completed successfully,
+    # and all stages it runs after are finished
+    #
+    # parameter:
+    #  - self
+    #  - Stage object
+    # return:
+    #  - True/False
+    def is_ready(self, stage):
+        for dep in stage.deps:
+            if (self.stages_by_name[dep].result is not True):
+                return False
+        for dep in stage.after:
+            if (self.stages_by_name[dep].result is None):
+                return False
+        return True
+
+
+
+    # conflicts()
+    #
+    # verify if a stage writes into the same outputs as a running stage
+    #
+    # parameter:
+    #  - self
+    #  - Stage object
+    #  - list with running stages
+    # return:
+    #  - True/False
+    def conflicts(self, stage, running):
+        for other in running:
+            for output in stage.outputs:
+                for other_output in other.outputs:
+                    # one directory inside the other is a conflict as well
+                    if (output == other_output or
+                        output.startswith(other_output + os.sep) or
+                        other_output.startswith(output + os.sep)):
+                        return True
+        return False
+
+
+
+    # failed_stage()
+    #
+    # return the first failed stage (in declaration order)
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - Stage object, or None
+    def failed_stage(self):
+        for stage in self.stages:
+            if (stage.result is False):
+                return stage
+        return None
+
+
+
+    # stage_results()
+    #
+    # return the result of every stage
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - string with "name:result" pairs (result: ok, failed, skipped)
+    def stage_results(self):
+        results = []
+        for stage in self.stages:
+            if (stage.result is True):
+                results.append(stage.name + ':ok')
+            elif (stage.result is False):
+                results.append(stage.name + ':failed')
+            else:
+                results.append(stage.name + ':skipped')
+        return ' '.join(results)
@@ -0,0 +1,165 @@
+import re
+import os
+import logging
+
+
+# the diff of one failed test is cut after this size
+MAX_DIFF_SIZE = 64 * 1024
+
+
+# extracts the failed tests from the output of the regression tests collected by the test stages
+# (regression.diffs of pg_regress and pg_isolation_regress, logfiles of the TAP tests)
+
+class TestFailureExtractor:
+
+    def __init__(self, build_dir):
+        self.build_dir = build_dir
+        # directory where the installcheck suites write their results, see Build.create_regress_output_dirs()
+        self.regress_dir = 'buildclient_regress'
+
+
+
+    # collect()
+    #
+    # parse the test results collected by the test stages
+    # only these files are used: a kept or restored build tree might hold results of older builds
+    #
+    # parameter:
+    #  - self
+    #  - list with result files (full path)
+    # return:
+    #  - list with failed tests, every entry is a dictionary with suite, locale, test, kind and diff
+    def collect(self, result_files):
+        failures = []
+        for path in result_files:
+            dirpath, filename = os.path.split(path)
+            if (filename == 'regression.diffs'):
+                failures.extend(self.parse_diffs(path))
+            elif (filename.startswith('regress_log_') and dirpath.endswith(os.path.join('tmp_check', 'log'))):
+                failures.extend(self.parse_tap_log(path))
+
+        logging.debug("found " + str(len(failures)) + " failed tests")
+        return failures
+
+
+
+    # suite_and_locale()
+    #
+    # figure out the test suite (directory) and the locale of a result file
+    #
+    # parameter:
+    #  - self
+    #  - directory of the result file
+    # return:
+    #  - suite name, locale (or None)
+    def suite_and_locale(self, directory):
+        suite = os.path.relpath(directory, self.build_dir)
+        parts = suite.split(os.sep)
+        locale = None
+        if (len(parts) >= 2 and parts[0] == self.regress_dir):
+            # installcheck suites write into a directory per locale
+            locale = parts[1]
+            suite = os.sep.join(parts[2:])
+        return suite, locale
+
+
+
+    # parse_diffs()
+    #
+    # extract the failed tests from a regression.diffs file
+    # handles unified diffs (with a "diff" line per test), and context diffs of older versions
+    #
+    # parameter:
+    #  - self
+    #  - filename
+    # return:
+    #  - list with failed tests
+    def parse_diffs(self, filename):
+        suite, locale = self.suite_and_locale(os.path.dirname(filename))
+        if (suite.endswith('output_iso') or 'isolation' in suite.split(os.sep)):
+            kind = 'isolation'
+        else:
+            kind = 'regress'
+
+        try:
+            f = open(filename, 'rb')
+            lines = f.read().decode('utf-8', 'replace').splitlines(True)
+            f.close()
+        except (OSError, IOError) as e:
+            logging.error("failed to read: " + filename)
+            logging.error("error: " + str(e))
+            return []
+
+        failures = []
+        for i, line in enumerate(lines):
+            name = None
+            after_diff = (i > 0 and lines[i - 1].startswith('diff '))
+            following = lines[i + 1] if (i + 1 < len(lines)) else ''
+            if (line.startswith('diff ')):
+                # diff <options> <expected> <results>
+                name = line.split()[-1].strip('"')
+            elif (after_diff is False and line.startswith('*** ') and following.startswith('--- ') and
+                  re.match(r'^\*\*\* \d', line) is None):
+                # context diff of older versions: *** <expected>, --- <results>
+                name = following[4:].split('\t')[0].strip()
+            elif (after_diff is False and line.startswith('--- ') and following.startswith('+++ ')):
+                # unified diff without "diff" line: --- <expected>, +++ <results>
+                name = following[4:].split('\t')[0].strip()
+            if (name is not None and name.endswith('.out')):
+                failures.append({'suite': suite, 'locale': locale, 'test': os.path.basename(name)[:-4], 'kind': kind, 'diff': []})
+            if (len(failures) > 0):
+                failures[-1]['diff'].append(line)
+
+        result = []
+        for failure in failures:
+            diff = ''.join(failure['diff'])
+            if (len(diff) > MAX_DIFF_SIZE):
+                diff = diff[:MAX_DIFF_SIZE] + os.linesep + "... diff truncated" + os.linesep
+            result.append({'suite': failure['suite'], 'locale': failure['locale'], 'test': failure['test'],
+                           'kind': failure['kind'], 'diff': diff})
+
+        return result
+
+
+
+    # parse_tap_log()
+    #
+    # extract the failed tests from the logfile of a TAP test
+    #
+    # parameter:
+    #  - self
+    #  - filename
+    # return:
+    #  - list with failed tests (one entry per TAP script)
+    def parse_tap_log(self, filename):
+        # <suite>/tmp_check/log/regress_log_<test>
+        suite, locale = self.suite_and_locale(os.path.dirname(os.path.dirname(os.path.dirname(filename))))
+        test = os.path.basename(filename)[len('regress_log_'):]
+
+        try:
+            f = open(filename, 'rb')
+            lines = f.read().decode('utf-8', 'replace').splitlines(True)
+            f.close()
+        except (OSError, IOError) as e:
+            logging.error("failed to read: " + filename)
+            logging.error("error: " + str(e))
+            return []
+
+        diff = []
+        in_failure = False
+        for line in lines:
+            if (line.startswith('not ok ')):
+                in_failure = True
+                diff.append(line)
+            elif (in_failure is True and line.startswith('#')):
+                # diagnostics of the failed test
+                diff.append(line)
+            else:
+                in_failure = False
+        if (len(diff) == 0):
+            return []
+
+        diff = ''.join(diff)
+        if (len(diff) > MAX_DIFF_SIZE):
+            diff = diff[:MAX_DIFF_SIZE] + os.linesep + "... diff truncated" + os.linesep
+        return [{'suite': suite, 'locale': locale, 'test': test, 'kind': 'tap', 'diff': diff}]
@@ -0,0 +1,101 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from build import Build
+from stages import StageGraph
+
+
+SUITES = ['installcheck', 'isolation-check', 'pl-installcheck', 'contrib-installcheck', 'testmodules-installcheck']
+
+
+class Config:
+
+    def __init__(self, test_fast):
+        self.test_fast = test_fast
+
+    def get(self, name):
+        if (name == 'test-fast'):
+            return self.test_fast
+        raise KeyError(name)
+
+
+
+# declare the stages of all locales, and run the stage functions in declaration order
+# the functions only record which cluster (and server logfile) they use
+
+class LocaleStagesTest(unittest.TestCase):
+
+    def declare(self, test_fast, test_locales):
+        build = Build.__new__(Build)
+        build.config = Config(test_fast)
+        build.build_dir = '/build'
+        build.install_dir = '/install'
+        build.data_root = '/install'
+        build.pg_test_port = 5678
+
+        calls = []
+        build.create_regress_output_dirs = lambda output_root, output_dirs: True
+        build.regression_pg_initdb = lambda extra_options, log_data, test_locale, test_log_number, test_log_name, port: \
+            calls.append('initdb-' + test_locale) or True
+        build.regression_pg_startdb = lambda extra_options, log_data, test_locale, started_times, test_log_number, test_log_name, port: \
+            calls.append('startdb-' + test_locale + '-' + str(started_times)) or True
+        build.regression_pg_stopdb = lambda extra_options, log_data, test_locale, started_times, test_log_number, test_log_name, port: \
+            calls.append('stopdb-' + test_locale + '-' + str(started_times)) or True
+        build.stage_pg_script = lambda stage, execute, log_name, buildfarm_log, *args, **kwargs: \
+            calls.append(execute.split(' ', 1)[1] + ' ' + os.path.basename(kwargs['db_logfile'])) or True
+
+        log_data = {'test_locales': ','.join(test_locales)}
+        graph = StageGraph()
+        started_times = 0
+        for test_locale in test_locales:
+            started_times = build.add_pg_locale_stages(graph, '', log_data, test_locale, [], started_times)
+        for stage in graph.stages:
+            stage.function(stage)
+
+        return [stage.name for stage in graph.stages], calls
+
+
+
+    # the names the serial run (one locale after the other) used
+    def serial(self, test_fast, test_locales):
+        names = []
+        calls = []
+        started_times = 0
+        for test_locale in test_locales:
+            names.append('initdb-' + test_locale)
+            calls.append('initdb-' + test_locale)
+            for suite in SUITES:
+                if (test_fast is False or suite is SUITES[0]):
+                    started_times += 1
+                    names.append('startdb-' + test_locale + '-' + str(started_times))
+                    calls.append('startdb-' + test_locale + '-' + str(started_times))
+                names.append(suite + '-' + test_locale)
+                calls.append(test_locale + ' ' + str(started_times) + ' logfile-' + test_locale + '-' + str(started_times))
+                if (test_fast is False or suite is SUITES[-1]):
+                    names.append('stopdb-' + test_locale + '-' + str(started_times))
+                    calls.append('stopdb-' + test_locale + '-' + str(started_times))
+
+        return names, calls
+
+
+
+    def test_two_locales(self):
+        names, calls = self.declare(False, ['C', 'en_US'])
+        self.assertEqual((names, calls), self.serial(False, ['C', 'en_US']))
+        self.assertIn('startdb-en_US-6', names)
+        self.assertIn('stopdb-en_US-10', names)
+
+
+
+    def test_two_locales_fast(self):
+        names, calls = self.declare(True, ['C', 'en_US'])
+        self.assertEqual((names, calls), self.serial(True, ['C', 'en_US']))
+        self.assertIn('startdb-en_US-2', names)
+
+
+
+if __name__ == '__main__':
+    unittest.main()